@@ -1,4 +1,5 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g, has_request_context
+from werkzeug.exceptions import RequestEntityTooLarge
 import numpy as np
 try:
     import cv2
@@ -14,8 +15,24 @@ except Exception:
 import logging
 import sqlite3
 import os
+import sys
+import re
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, TimeoutError as FutureTimeoutError
+import multiprocessing
 from datetime import datetime
 import json
+import heapq
+import copy
+import hashlib
+from collections import OrderedDict, Counter
+import functools
+from functools import lru_cache
+import bisect
+import random
+import uuid
 try:
     import torch
     import torchvision.transforms as transforms
@@ -37,11 +54,21 @@ try:
 except Exception:
     AutoTokenizer = None
     AutoModel = None
+from pair_scoring import haversine_km, score_pair_chunk, text_similarity
 
 app = Flask(__name__)
 
 # Set port for the ML service
-PORT = 8000
+PORT = int(os.environ.get('PORT', 8000))
+
+# Larger request bodies are refused with 413 before any of them is read or buffered
+MAX_REQUEST_BYTES = int(os.environ.get('MAX_REQUEST_BYTES', 32 * 1024 * 1024))
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+
+# The matching job's spawned worker processes import the main module as __mp_main__ when
+# the service runs as `python app.py`. They only use pair_scoring, so they load no models
+# and start no background threads.
+MATCH_JOB_WORKER = __name__ == '__mp_main__'
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
@@ -87,93 +114,776 @@ def init_database():
         )
     ''')
     
+    # Image features keyed by SHA-256 of the decoded image bytes
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS image_feature_cache (
+            content_hash TEXT PRIMARY KEY,
+            resnet_features BLOB,
+            orb_descriptors BLOB,
+            fingerprint TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Fast-tier embeddings, one row per item and embedding model
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS item_embeddings (
+            item_id INTEGER NOT NULL,
+            item_type TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            model TEXT NOT NULL,
+            embedding BLOB NOT NULL,
+            PRIMARY KEY (item_id, item_type, kind, model)
+        )
+    ''')
+    
+    # Trained embedding compression codecs (PCA + product quantization), one per image model
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS embedding_codecs (
+            model TEXT PRIMARY KEY,
+            codec BLOB NOT NULL,
+            report TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Materialized top-K matches per stored item, maintained by /store-item
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS item_matches (
+            item_type TEXT NOT NULL,
+            item_id INTEGER NOT NULL,
+            match_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (item_type, item_id, match_id)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_item_matches_score ON item_matches(item_type, item_id, score DESC)")
+    
+    # High-confidence lost/found pairs from the background matching job, and its run stats
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS match_candidates (
+            lost_item_id INTEGER NOT NULL,
+            found_item_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            run_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (lost_item_id, found_item_id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS match_job_runs (
+            run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            status TEXT NOT NULL,
+            lost_items INTEGER,
+            found_items INTEGER,
+            blocks INTEGER,
+            candidate_pairs INTEGER,
+            all_pairs INTEGER,
+            matches_written INTEGER,
+            elapsed_s REAL,
+            pairs_per_s REAL,
+            error TEXT,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    
+    # Write counter per item_type, bumped after every write to item_features. Every process
+    # serving from this database compares it with the generation of its in-memory indexes.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS item_generations (
+            item_type TEXT PRIMARY KEY,
+            generation INTEGER NOT NULL
+        )
+    ''')
+
+    # The item_ids each generation changed (NULL: rebuild everything), so indexes can catch up
+    # by re-reading only those items
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS item_changes (
+            item_type TEXT NOT NULL,
+            generation INTEGER NOT NULL,
+            item_id INTEGER
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_item_changes ON item_changes(item_type, generation)")
+
+    # Columns added after the initial schema (SQLite has no ADD COLUMN IF NOT EXISTS)
+    added_columns = [
+        ('item_features', 'text_embedding', 'BLOB'),
+        ('item_features', 'lat', 'REAL'),
+        ('item_features', 'lng', 'REAL'),
+        ('item_features', 'image_model', 'TEXT'),
+        ('item_features', 'text_model', 'TEXT'),
+        ('item_features', 'fingerprint', 'TEXT'),
+        ('item_features', 'cluster_id', 'INTEGER'),
+        ('image_feature_cache', 'image_model', 'TEXT'),
+        ('image_feature_cache', 'fast_features', 'BLOB'),
+        ('image_feature_cache', 'fast_model', 'TEXT')
+    ]
+    for table, column, column_type in added_columns:
+        existing_columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+        if column not in existing_columns:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_item_features_type ON item_features(item_type)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_item_features_cluster ON item_features(item_type, cluster_id)")
+    
     conn.commit()
     conn.close()
 
 # Initialize database on startup
 init_database()
 
-# Initialize ResNet50 model for image feature extraction
-def init_resnet_model():
-    """Initialize ResNet50 model for feature extraction"""
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire ttl seconds after insertion"""
+
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+class SingleFlight:
+    """Coalesces concurrent identical computations: while one thread (the leader) computes a
+    key, other threads asking for the same key wait for and share its result or exception"""
+
+    def __init__(self):
+        self.calls = {}  # key -> Future of the in-flight computation
+        self.lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key, fn, *args):
+        return self.do_many([key], lambda keys: [fn(*args)])[0]
+
+    def do_many(self, keys, compute):
+        """Batch form of do(): compute(owned_keys) is called with the keys no other thread is
+        computing (each once) and returns their results in order; the others are awaited"""
+        owned, futures = [], []
+        with self.lock:
+            for key in keys:
+                future = self.calls.get(key)
+                if future is None:
+                    future = self.calls[key] = Future()
+                    owned.append((key, future))
+                    self.leaders += 1
+                else:
+                    self.followers += 1
+                futures.append(future)
+        try:
+            if owned:
+                results = compute([key for key, _ in owned])
+                if len(results) != len(owned):
+                    raise RuntimeError(f"Expected {len(owned)} results, got {len(results)}")
+                for (key, future), result in zip(owned, results):
+                    future.set_result(result)
+        except BaseException as e:
+            for _, future in owned:
+                if not future.done():
+                    future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                for key, _ in owned:
+                    self.calls.pop(key, None)
+        return [future.result() for future in futures]
+
+
+# ---------------------------------------------------------------------------
+# Metrics: per-endpoint request latency, per-stage timers around the model,
+# database and scoring helpers (stages nest, e.g. scoring includes fuzzy),
+# model batch sizes and cache hit rates, in Prometheus text format at /metrics.
+# ---------------------------------------------------------------------------
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values)) + "}"
+
+class Histogram:
+    """Thread-safe Prometheus-style histogram with one series per label combination"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self.series = {}  # label values -> [per-bucket counts (last is +Inf), sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series_items = sorted((labels, [list(s[0]), s[1], s[2]]) for labels, s in self.series.items())
+        bucket_names = self.label_names + ("le",)
+        for labels, (counts, total, count) in series_items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{format_labels(bucket_names, labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{format_labels(self.label_names, labels)} {count}")
+        return lines
+
+REQUEST_LATENCY = Histogram('ml_request_duration_seconds', 'Request latency by endpoint',
+                            ('endpoint', 'method', 'status'), LATENCY_BUCKETS)
+STAGE_LATENCY = Histogram('ml_stage_duration_seconds', 'Time spent in instrumented helpers by stage',
+                          ('stage',), LATENCY_BUCKETS)
+MODEL_BATCH_SIZE = Histogram('ml_model_batch_size', 'Inputs per model forward pass',
+                             ('model',), BATCH_SIZE_BUCKETS)
+
+# ---------------------------------------------------------------------------
+# Profiling: opt-in per-request stack sampling (X-Profile header or
+# PROFILE_SAMPLE_RATE) stored as collapsed stacks keyed by request id, plus an
+# optional periodic sampler aggregating hot stacks of all request threads.
+# Collapsed stacks ("frame;frame;frame count") feed flamegraph.pl or speedscope.
+# ---------------------------------------------------------------------------
+
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))          # fraction of requests
+PROFILE_INTERVAL_S = float(os.environ.get('PROFILE_INTERVAL_S', 0.005))         # per-request sampling
+PROFILE_SAMPLER_INTERVAL_S = float(os.environ.get('PROFILE_SAMPLER_INTERVAL_S', 0))  # 0 disables
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN') or None
+
+def collapse_stack(frame):
+    """Root-first 'file:function' frames of a stack, joined with ';'"""
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+def format_collapsed(stacks, limit=None):
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common(limit)) + "\n"
+
+class RequestProfiler:
+    """Samples one thread's stack every PROFILE_INTERVAL_S from a helper thread"""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL_S):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='request-profiler', daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        return self.stacks
+
+_active_request_threads = set()
+_hot_stacks = Counter()
+_hot_stacks_lock = threading.Lock()
+
+def hot_stack_sampler():
+    """Low-rate sampler aggregating the stacks of threads currently serving requests"""
+    while True:
+        time.sleep(PROFILE_SAMPLER_INTERVAL_S)
+        frames = sys._current_frames()
+        with _hot_stacks_lock:
+            for thread_id in list(_active_request_threads):
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    _hot_stacks[collapse_stack(frame)] += 1
+
+if PROFILE_SAMPLER_INTERVAL_S > 0 and not MATCH_JOB_WORKER:
+    threading.Thread(target=hot_stack_sampler, name='hot-stack-sampler', daemon=True).start()
+
+def timed_stage(stage):
+    """Decorator recording the wrapped helper's duration under STAGE_LATENCY{stage}"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                STAGE_LATENCY.observe(time.perf_counter() - started, stage)
+        return wrapper
+    return decorator
+
+
+# Optional optimized CPU inference. ML_INFERENCE_MODE=optimized enables:
+# - ResNet50: channels-last memory format, then TorchScript trace+freeze (RESNET_BACKEND=torchscript)
+#   or torch.compile (RESNET_BACKEND=compile)
+# - BERT: dynamic int8 quantization of the Linear layers
+# Each optimized model must reproduce the fp32 outputs within tolerance at startup, otherwise
+# the fp32 model is kept.
+INFERENCE_MODE = os.environ.get('ML_INFERENCE_MODE', 'eager')
+RESNET_BACKEND = os.environ.get('RESNET_BACKEND', 'torchscript')
+RESNET_MIN_COSINE = float(os.environ.get('RESNET_SELF_CHECK_MIN_COSINE', 0.999))
+TEXT_MIN_COSINE = float(os.environ.get('TEXT_SELF_CHECK_MIN_COSINE', 0.98))
+
+# What each loaded model is actually running as, keyed by registry name, reported by /health
+inference_backends = {}
+
+def min_row_cosine(reference, candidate):
+    reference = reference.reshape(reference.shape[0], -1)
+    candidate = candidate.reshape(candidate.shape[0], -1)
+    return float(torch.nn.functional.cosine_similarity(reference, candidate, dim=1).min())
+
+def optimize_resnet_model(model):
+    """Return (model, backend name); falls back to the fp32 eager model if the self-check fails"""
+    try:
+        example = torch.randn(2, 3, 224, 224, generator=torch.Generator().manual_seed(0))
+        with torch.no_grad():
+            reference = model(example)
+            optimized = model.to(memory_format=torch.channels_last)
+            example_cl = example.contiguous(memory_format=torch.channels_last)
+            if RESNET_BACKEND == 'compile' and hasattr(torch, 'compile'):
+                optimized = torch.compile(optimized)
+                backend = 'torch_compile+channels_last'
+            else:
+                optimized = torch.jit.freeze(torch.jit.trace(optimized, example_cl))
+                backend = 'torchscript+channels_last'
+            cosine = min_row_cosine(reference, optimized(example_cl))
+        if cosine < RESNET_MIN_COSINE:
+            logger.warning(f"ResNet50 {backend} self-check failed (cosine {cosine:.5f}), using fp32 eager")
+            return model.to(memory_format=torch.contiguous_format), 'fp32'
+        logger.info(f"ResNet50 running as {backend} (self-check cosine {cosine:.5f})")
+        return optimized, backend
+    except Exception as e:
+        logger.warning(f"ResNet50 optimization failed, using fp32 eager: {e}")
+        return model.to(memory_format=torch.contiguous_format), 'fp32'
+
+def optimize_text_model(tokenizer, model):
+    """Return (model, backend name); falls back to the fp32 model if the self-check fails"""
+    try:
+        quantized = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        samples = ["black iphone with a red case", "blue backpack left at the library", "gold ring"]
+        inputs = tokenizer(samples, return_tensors='pt', padding=True, truncation=True, max_length=256)
+        mask = inputs['attention_mask'].unsqueeze(-1).float()
+        with torch.no_grad():
+            reference = (model(**inputs).last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1)
+            candidate = (quantized(**inputs).last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1)
+        cosine = min_row_cosine(reference, candidate)
+        if cosine < TEXT_MIN_COSINE:
+            logger.warning(f"BERT int8 self-check failed (cosine {cosine:.5f}), using fp32")
+            return model, 'fp32'
+        logger.info(f"BERT running with int8 dynamic quantization (self-check cosine {cosine:.5f})")
+        return quantized, 'int8_dynamic'
+    except Exception as e:
+        logger.warning(f"BERT quantization failed, using fp32: {e}")
+        return model, 'fp32'
+
+# Embedding model registry. TEXT_MODEL / IMAGE_MODEL select the heavy tier used for scoring and
+# re-ranking (defaults are the original BERT-base and ResNet50). FAST_TEXT_MODEL / FAST_IMAGE_MODEL
+# optionally load a lightweight tier whose embeddings drive interactive candidate generation.
+# Stored embeddings are tagged with the registry name of the model that produced them.
+TEXT_MODEL_REGISTRY = {
+    'bert-base': {'hf_name': 'bert-base-uncased', 'max_length': 256},
+    'minilm': {'hf_name': 'sentence-transformers/all-MiniLM-L6-v2', 'max_length': 128}
+}
+IMAGE_MODEL_REGISTRY = ('resnet50', 'mobilenet_v3_small', 'efficientnet_b0')
+
+TEXT_MODEL = os.environ.get('TEXT_MODEL', 'bert-base')
+IMAGE_MODEL = os.environ.get('IMAGE_MODEL', 'resnet50')
+FAST_TEXT_MODEL = os.environ.get('FAST_TEXT_MODEL') or None
+FAST_IMAGE_MODEL = os.environ.get('FAST_IMAGE_MODEL') or None
+FAST_PCA_DIM = int(os.environ.get('FAST_PCA_DIM', 0))  # e.g. 256; 0 keeps full fast-tier vectors
+
+def build_image_backbone(name):
+    """Pretrained torchvision backbone with the classifier removed (pooled features out)"""
+    if name == 'resnet50':
+        model = models.resnet50(pretrained=True)
+        # Remove the final classification layer to get features
+        return torch.nn.Sequential(*list(model.children())[:-1])
+    if name == 'mobilenet_v3_small':
+        model = models.mobilenet_v3_small(pretrained=True)
+        return torch.nn.Sequential(model.features, model.avgpool)
+    if name == 'efficientnet_b0':
+        model = models.efficientnet_b0(pretrained=True)
+        return torch.nn.Sequential(model.features, model.avgpool)
+    raise ValueError(f"Unknown image model '{name}', expected one of {IMAGE_MODEL_REGISTRY}")
+
+# Initialize the image backbone (ResNet50 by default) for image feature extraction
+def init_resnet_model(name=IMAGE_MODEL):
+    """Initialize an image model from the registry for feature extraction"""
     try:
         if models is None or torch is None:
             raise RuntimeError('Torch/torchvision unavailable')
-        model = models.resnet50(pretrained=True)
+        model = build_image_backbone(name)
         model.eval()  # Set to evaluation mode
-        # Remove the final classification layer to get features
-        model = torch.nn.Sequential(*list(model.children())[:-1])
-        logger.info("ResNet50 model loaded successfully")
+        logger.info(f"{name} image model loaded successfully")
+        backend = 'fp32'
+        if INFERENCE_MODE == 'optimized':
+            model, backend = optimize_resnet_model(model)
+        inference_backends[name] = backend
         return model
     except Exception as e:
-        logger.error(f"Failed to load ResNet50 model: {e}")
+        logger.error(f"Failed to load {name} image model: {e}")
         return None
 
-# Global model variable
-resnet_model = init_resnet_model()
+# Global model variables
+resnet_model = init_resnet_model() if not MATCH_JOB_WORKER else None
+fast_image_model = init_resnet_model(FAST_IMAGE_MODEL) if FAST_IMAGE_MODEL and not MATCH_JOB_WORKER else None
 
-# Initialize BERT model for text embeddings (mean pooled)
-def init_text_model():
+# Initialize the text model (BERT by default) for text embeddings (mean pooled)
+def init_text_model(name=TEXT_MODEL):
     try:
         if AutoTokenizer is None or AutoModel is None or torch is None:
             raise RuntimeError('Transformers/Torch unavailable')
-        tokenizer = AutoTokenizer.from_pretrained('bert-base-uncased')
-        model = AutoModel.from_pretrained('bert-base-uncased')
+        if name not in TEXT_MODEL_REGISTRY:
+            raise ValueError(f"Unknown text model '{name}', expected one of {list(TEXT_MODEL_REGISTRY)}")
+        hf_name = TEXT_MODEL_REGISTRY[name]['hf_name']
+        tokenizer = AutoTokenizer.from_pretrained(hf_name)
+        model = AutoModel.from_pretrained(hf_name)
         model.eval()
-        logger.info("BERT model loaded successfully")
+        logger.info(f"{name} text model loaded successfully")
+        backend = 'fp32'
+        if INFERENCE_MODE == 'optimized':
+            model, backend = optimize_text_model(tokenizer, model)
+        inference_backends[name] = backend
         return tokenizer, model
     except Exception as e:
-        logger.error(f"Failed to load BERT model: {e}")
+        logger.error(f"Failed to load {name} text model: {e}")
         return None, None
 
-text_tokenizer, text_model = init_text_model()
+text_tokenizer, text_model = init_text_model() if not MATCH_JOB_WORKER else (None, None)
+fast_text_tokenizer, fast_text_model = (init_text_model(FAST_TEXT_MODEL) if FAST_TEXT_MODEL and not MATCH_JOB_WORKER
+                                        else (None, None))
+
+# ---------------------------------------------------------------------------
+# Inference executors: every model runs on its own worker threads behind a
+# bounded queue, with an explicit torch intra-op/inter-op thread budget, so
+# concurrent requests queue for a model instead of each forward pass grabbing
+# every core at once. Request threads that find a queue full get a 429 with a
+# Retry-After hint; background jobs wait for a slot instead.
+# ---------------------------------------------------------------------------
+
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', 1))  # per model
+INFERENCE_QUEUE_SIZE = int(os.environ.get('INFERENCE_QUEUE_SIZE', 16))  # waiting calls per model
+INFERENCE_TIMEOUT_S = float(os.environ.get('INFERENCE_TIMEOUT_S', 60))
+# 0 splits the cores evenly between the loaded torch models' workers
+INFERENCE_INTRA_OP_THREADS = int(os.environ.get('INFERENCE_INTRA_OP_THREADS', 0))
+INFERENCE_INTER_OP_THREADS = int(os.environ.get('INFERENCE_INTER_OP_THREADS', 1))
+
+INFERENCE_QUEUE_WAIT = Histogram('ml_inference_queue_wait_seconds', 'Time calls waited for a model worker',
+                                 ('model',), LATENCY_BUCKETS)
+
+class InferenceOverloaded(Exception):
+    """A model's inference queue is full; served as 429 with a Retry-After hint"""
+
+    def __init__(self, model, retry_after):
+        super().__init__(f"{model} inference queue is full, retry in {retry_after}s")
+        self.model = model
+        self.retry_after = retry_after
+
+_inference_thread = threading.local()
+
+class InferenceExecutor:
+    """Runs one model's calls on its own worker threads, admitting at most workers + queue_size
+    calls at a time"""
+
+    def __init__(self, name, workers=INFERENCE_WORKERS, queue_size=INFERENCE_QUEUE_SIZE):
+        self.name = name
+        self.workers = max(1, workers)
+        self.capacity = self.workers + max(0, queue_size)
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f'inference-{name}')
+        self.slots = threading.BoundedSemaphore(self.capacity)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.avg_call_s = 0.05  # moving average of call time, for Retry-After
+        self.pid = os.getpid()
+
+    def retry_after(self):
+        """Seconds until the current backlog should have drained"""
+        with self.lock:
+            return max(1, math.ceil(self.pending / self.workers * self.avg_call_s))
+
+    def _call(self, submitted, fn, args, kwargs):
+        INFERENCE_QUEUE_WAIT.observe(time.perf_counter() - submitted, self.name)
+        _inference_thread.executor = self
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.avg_call_s = 0.8 * self.avg_call_s + 0.2 * elapsed
+                self.completed += 1
+
+    def _release(self, future):
+        with self.lock:
+            self.pending -= 1
+        self.slots.release()
+
+    def run(self, fn, *args, **kwargs):
+        """Run fn on this model's workers and return its result. Nested calls from one of the
+        workers, and calls from a forked child process, run inline."""
+        if getattr(_inference_thread, 'executor', None) is self or os.getpid() != self.pid:
+            return fn(*args, **kwargs)
+        rejecting = has_request_context() or getattr(_inference_thread, 'rejecting', False)
+        if not self.slots.acquire(blocking=not rejecting):
+            with self.lock:
+                self.rejected += 1
+            raise InferenceOverloaded(self.name, self.retry_after())
+        with self.lock:
+            self.pending += 1
+        future = self.pool.submit(self._call, time.perf_counter(), fn, args, kwargs)
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=INFERENCE_TIMEOUT_S)
+        except FutureTimeoutError:
+            raise InferenceOverloaded(self.name, self.retry_after())
 
-# Image preprocessing for ResNet50
-def preprocess_image_for_resnet(image_data):
-    """Preprocess image for ResNet50 feature extraction"""
+def rejecting_when_full(fn, *args, **kwargs):
+    """Call fn outside a Flask request (e.g. from the ASGI server's pools) with request
+    admission: a full inference queue raises InferenceOverloaded instead of waiting"""
+    _inference_thread.rejecting = True
     try:
-        if transforms is None:
-            return None
-        # Decode base64 image
-        if isinstance(image_data, str) and image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
-        
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Convert to RGB if needed
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Resize to 224x224 (ResNet50 input size)
-        image = image.resize((224, 224))
-        
-        # Convert to tensor and normalize
-        transform = transforms.Compose([
+        return fn(*args, **kwargs)
+    finally:
+        _inference_thread.rejecting = False
+
+def with_caller_admission(fn):
+    """Wrap fn to run on another thread with the calling thread's inference admission"""
+    if has_request_context() or getattr(_inference_thread, 'rejecting', False):
+        return functools.partial(rejecting_when_full, fn)
+    return fn
+
+inference_executors = {}
+_inference_executors_lock = threading.Lock()
+
+def inference_executor(name):
+    """The executor owning the named model (registry name, or 'fraud_model')"""
+    with _inference_executors_lock:
+        executor = inference_executors.get(name)
+        if executor is None:
+            executor = inference_executors[name] = InferenceExecutor(name)
+        return executor
+
+def configure_torch_threads():
+    """Give each torch model worker an equal share of the cores for intra-op parallelism"""
+    if torch is None:
+        return
+    loaded = [model for model in (resnet_model, fast_image_model, text_model, fast_text_model) if model is not None]
+    intra_op = INFERENCE_INTRA_OP_THREADS or max(1, (os.cpu_count() or 1) // max(1, len(loaded) * INFERENCE_WORKERS))
+    torch.set_num_threads(intra_op)
+    try:
+        torch.set_num_interop_threads(INFERENCE_INTER_OP_THREADS)
+    except RuntimeError as e:
+        # Only allowed before the first inter-op parallel work
+        logger.warning(f"Could not set torch inter-op threads: {e}")
+    logger.info(f"Torch thread budget: {intra_op} intra-op, {INFERENCE_INTER_OP_THREADS} inter-op "
+                f"per call, {INFERENCE_WORKERS} worker(s) per model")
+
+configure_torch_threads()
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    return jsonify({"ok": False, "error": f"Request body exceeds {MAX_REQUEST_BYTES} bytes"}), 413
+
+@app.errorhandler(InferenceOverloaded)
+def inference_overloaded(e):
+    response = jsonify({"ok": False, "error": str(e), "retry_after": e.retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+def image_encoder(tier):
+    """(registry name, model) of the 'heavy' or 'fast' image tier"""
+    if tier == 'fast':
+        return FAST_IMAGE_MODEL, fast_image_model
+    return IMAGE_MODEL, resnet_model
+
+def text_encoder(tier):
+    """(registry name, tokenizer, model) of the 'heavy' or 'fast' text tier"""
+    if tier == 'fast':
+        return FAST_TEXT_MODEL, fast_text_tokenizer, fast_text_model
+    return TEXT_MODEL, text_tokenizer, text_model
+
+def decode_image_data(image_data):
+    """Return raw image bytes from a base64 string (optionally a data: URL).
+    Bytes-like input (multipart / raw uploads) is returned as-is, without copying."""
+    if isinstance(image_data, (bytes, bytearray, memoryview)):
+        return image_data
+    if isinstance(image_data, str) and image_data.startswith('data:image'):
+        image_data = image_data.split(',')[1]
+    return base64.b64decode(image_data)
+
+def read_stream_into_buffer(stream, length):
+    """Read exactly length bytes (at most MAX_REQUEST_BYTES) from stream into one preallocated buffer"""
+    if length > MAX_REQUEST_BYTES:
+        raise RequestEntityTooLarge()
+    buffer = bytearray(length)
+    view = memoryview(buffer)
+    filled = 0
+    while filled < length:
+        count = stream.readinto(view[filled:])
+        if not count:
+            break
+        filled += count
+    return view[:filled]
+
+def read_upload(storage):
+    """Bytes of an uploaded file part, without an intermediate copy when Werkzeug buffered it in memory"""
+    stream = storage.stream
+    if isinstance(stream, io.BytesIO):
+        return stream.getbuffer()
+    stream.seek(0)
+    return memoryview(stream.read())
+
+def set_dotted(payload, dotted_key, value):
+    """payload['lost_item.image'] -> payload['lost_item']['image']"""
+    *parents, leaf = dotted_key.split('.')
+    target = payload
+    for key in parents:
+        if not isinstance(target.get(key), dict):
+            target[key] = {}
+        target = target[key]
+    target[leaf] = value
+
+def get_request_payload():
+    """Parse the request body into a payload dict, accepting three forms:
+    - application/json: the original contract, images as base64 strings
+    - multipart/form-data: form fields (JSON objects allowed, plus an optional 'payload'
+      JSON field) and image file parts, whose names may be dotted ('found_item.image')
+    - image/* or application/octet-stream: the body is the image, other fields come
+      from the query string
+    Uploaded images are passed on as memoryviews over the received bytes."""
+    if (request.content_length or 0) > MAX_REQUEST_BYTES:
+        raise RequestEntityTooLarge()
+    mimetype = request.mimetype or ''
+    if mimetype == 'multipart/form-data':
+        payload = {}
+        if request.form.get('payload'):
+            payload.update(json.loads(request.form['payload']))
+        for key, value in request.form.items():
+            if key == 'payload':
+                continue
+            if value.startswith('{'):
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+            set_dotted(payload, key, value)
+        for key, storage in request.files.items():
+            set_dotted(payload, key, read_upload(storage))
+        return payload
+    if mimetype.startswith('image/') or mimetype == 'application/octet-stream':
+        payload = request.args.to_dict()
+        if request.content_length:
+            payload['image'] = read_stream_into_buffer(request.stream, request.content_length)
+        else:
+            payload['image'] = memoryview(request.get_data(cache=False))
+        return payload
+    return request.get_json(silent=True) or {}
+
+def image_content_hash(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+RESNET_INPUT_SIZE = 224   # ResNet50 input is 224x224
+ORB_MAX_SIDE = 800        # ORB runs on images downsized to fit 800x800
+
+@timed_stage('decode')
+def decode_image_for_features(image_data, resnet=True, orb=False):
+    """Decode an image once, at the lowest resolution the requested feature paths need.
+    For JPEGs, Image.draft makes libjpeg decode at a reduced DCT scale (1/2, 1/4 or 1/8)
+    as long as the result still covers the target, so a 12 MP phone photo is never fully
+    decoded just to be resized to 224x224 or 800 px. Other formats decode normally."""
+    image = Image.open(io.BytesIO(decode_image_data(image_data)))
+    width, height = image.size
+    target_width, target_height = (RESNET_INPUT_SIZE, RESNET_INPUT_SIZE) if resnet else (1, 1)
+    if orb:
+        scale = min(1.0, ORB_MAX_SIDE / width, ORB_MAX_SIDE / height)
+        target_width = max(target_width, int(width * scale))
+        target_height = max(target_height, int(height * scale))
+    if image.format == 'JPEG':
+        image.draft('RGB', (target_width, target_height))
+    # Convert to RGB if needed
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+_resnet_transform = None
+
+@timed_stage('preprocess')
+def resnet_tensor_from_image(image):
+    """Resize a decoded RGB image to the ResNet50 input and normalize it into a batch tensor"""
+    global _resnet_transform
+    if transforms is None:
+        return None
+    if _resnet_transform is None:
+        _resnet_transform = transforms.Compose([
             transforms.ToTensor(),
             transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
         ])
-        
-        tensor = transform(image).unsqueeze(0)  # Add batch dimension
-        return tensor
-    except Exception as e:
-        logger.error(f"Error preprocessing image for ResNet: {e}")
-        return None
+    image = image.resize((RESNET_INPUT_SIZE, RESNET_INPUT_SIZE))
+    return _resnet_transform(image).unsqueeze(0)  # Add batch dimension
 
-def extract_resnet_features(image_tensor):
-    """Extract features using ResNet50"""
+@timed_stage('resnet')
+def extract_resnet_features(image_tensor, tier='heavy'):
+    """Extract features using the image model of the given tier (ResNet50 by default)"""
     try:
-        if resnet_model is None or torch is None:
-            logger.warning("ResNet50 model not available, falling back to ORB features")
+        name, model = image_encoder(tier)
+        if model is None or torch is None:
+            logger.warning(f"{tier} image model not available, falling back to ORB features")
             return None
             
-        with torch.no_grad():
-            features = resnet_model(image_tensor)
-            # Flatten the features
-            features = features.squeeze().numpy()
-            return features
+        if inference_backends.get(name, 'fp32') != 'fp32':
+            image_tensor = image_tensor.contiguous(memory_format=torch.channels_last)
+        MODEL_BATCH_SIZE.observe(image_tensor.shape[0], name)
+        def forward():
+            with torch.no_grad():
+                # Flatten the features
+                return model(image_tensor).squeeze().numpy()
+        return inference_executor(name).run(forward)
+    except InferenceOverloaded:
+        raise
     except Exception as e:
-        logger.error(f"Error extracting ResNet features: {e}")
+        logger.error(f"Error extracting image features: {e}")
         return None
 
 def mean_pool_last_hidden_state(last_hidden_state, attention_mask):
@@ -187,22 +897,76 @@ def mean_pool_last_hidden_state(last_hidden_state, attention_mask):
         logger.error(f"Error in mean pooling: {e}")
         return None
 
-def encode_text_to_embedding(text):
-    """Encode input text into a fixed-size embedding using BERT with mean pooling"""
+# Concurrent requests embedding the same text (e.g. a claims page comparing many lost
+# reports with one found item) share a single forward pass, keyed by model and text hash.
+text_flight = SingleFlight()
+
+def text_flight_key(name, text):
+    return name, hashlib.sha256(text.encode()).hexdigest()
+
+@timed_stage('bert')
+def encode_text_to_embedding(text, tier='heavy'):
+    """Encode input text into a fixed-size embedding using the tier's text model (BERT by default) with mean pooling"""
     try:
         if not text or text.strip() == '':
             return None
-        if text_tokenizer is None or text_model is None or torch is None:
+        name, tokenizer, model = text_encoder(tier)
+        if tokenizer is None or model is None or torch is None:
             return None
-        inputs = text_tokenizer(text, return_tensors='pt', truncation=True, max_length=256)
-        with torch.no_grad():
-            outputs = text_model(**inputs)
-        embedding = mean_pool_last_hidden_state(outputs.last_hidden_state, inputs['attention_mask'])
-        return embedding
+        def encode():
+            inputs = tokenizer(text, return_tensors='pt', truncation=True,
+                               max_length=TEXT_MODEL_REGISTRY[name]['max_length'])
+            MODEL_BATCH_SIZE.observe(1, name)
+            def forward():
+                with torch.no_grad():
+                    return model(**inputs)
+            outputs = inference_executor(name).run(forward)
+            return mean_pool_last_hidden_state(outputs.last_hidden_state, inputs['attention_mask'])
+        return text_flight.do(text_flight_key(name, text), encode)
+    except InferenceOverloaded:
+        raise
     except Exception as e:
         logger.error(f"Error encoding text: {e}")
         return None
 
+@timed_stage('bert')
+def encode_texts_to_embeddings(texts, batch_size=32, tier='heavy'):
+    """Batched variant of encode_text_to_embedding; returns one embedding (or None) per text"""
+    embeddings = [None] * len(texts)
+    name, tokenizer, model = text_encoder(tier)
+    if tokenizer is None or model is None or torch is None:
+        return embeddings
+    todo = [i for i, t in enumerate(texts) if t and t.strip()]
+    keys = [text_flight_key(name, texts[i]) for i in todo]
+    text_by_key = dict(zip(keys, (texts[i] for i in todo)))
+
+    def encode(owned_keys):
+        """Embeddings of the texts no concurrent request is already encoding"""
+        results = []
+        for start in range(0, len(owned_keys), batch_size):
+            batch = [text_by_key[key] for key in owned_keys[start:start + batch_size]]
+            try:
+                inputs = tokenizer(batch, return_tensors='pt', padding=True,
+                                   truncation=True, max_length=TEXT_MODEL_REGISTRY[name]['max_length'])
+                MODEL_BATCH_SIZE.observe(len(batch), name)
+                def forward():
+                    with torch.no_grad():
+                        return model(**inputs)
+                outputs = inference_executor(name).run(forward)
+                mask = inputs['attention_mask'].unsqueeze(-1).float()
+                pooled = (outputs.last_hidden_state * mask).sum(dim=1) / torch.clamp(mask.sum(dim=1), min=1e-9)
+                results.extend(pooled.numpy())
+            except InferenceOverloaded:
+                raise
+            except Exception as e:
+                logger.error(f"Error encoding text batch: {e}")
+                results.extend([None] * len(batch))
+        return results
+
+    for i, embedding in zip(todo, text_flight.do_many(keys, encode)):
+        embeddings[i] = embedding
+    return embeddings
+
 def cosine_sim(a, b):
     try:
         if a is None or b is None or cosine_similarity is None:
@@ -214,20 +978,47 @@ def cosine_sim(a, b):
         logger.error(f"Error computing cosine similarity: {e}")
         return 0.0
 
-def compute_feature_set(lost_item, found_item):
+# The independent stages of scoring one pair (the text embedding batch and each item's image
+# pipeline) run concurrently on this pool; ML_DEBUG_TIMINGS=1 (or "debug": true in a
+# /compare-items request) adds the per-stage breakdown to the response.
+PAIR_FEATURE_WORKERS = int(os.environ.get('PAIR_FEATURE_WORKERS', 4))
+DEBUG_TIMINGS = os.environ.get('ML_DEBUG_TIMINGS', '0') == '1'
+
+pair_feature_executor = ThreadPoolExecutor(max_workers=PAIR_FEATURE_WORKERS, thread_name_prefix='pair-features')
+
+def pair_text_embeddings(lost_item, lost_text, found_item, found_text):
+    """Text embeddings of both items, encoding the ones without a stored embedding in one batch"""
+    embeddings = [lost_item.get('_text_embedding'), found_item.get('_text_embedding')]
+    texts = (lost_text, found_text)
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        for i, embedding in zip(missing, encode_texts_to_embeddings([texts[i] for i in missing])):
+            embeddings[i] = embedding
+    return embeddings
+
+@timed_stage('scoring')
+def compute_feature_set(lost_item, found_item, pair=None):
     """Compute feature-level similarities between lost and found items"""
+    pair = pair or PairFeatures(lost_item, found_item)
+    started = time.perf_counter()
     # Text: combine name + description
     lost_text = f"{lost_item.get('name','')} {lost_item.get('description','')}".strip()
     found_text = f"{found_item.get('name','')} {found_item.get('description','')}".strip()
-    lost_emb = encode_text_to_embedding(lost_text)
-    found_emb = encode_text_to_embedding(found_text)
-    text_similarity = cosine_sim(lost_emb, found_emb)
+    text_job = pair_feature_executor.submit(with_caller_admission(pair.timed),
+                                            'text_embeddings', pair_text_embeddings,
+                                            lost_item, lost_text, found_item, found_text)
+
+    # Image similarity via ResNet if possible; the two images are processed in parallel
+    image_similarity = pair.timed('images', pair.image_similarity, pair_feature_executor)
 
     # Category similarity (fallback to fuzzy if BERT unavailable)
-    category_similarity = calculate_text_similarity(lost_item.get('category',''), found_item.get('category',''))
+    category_similarity = pair.timed('fuzzy', pair.similarity, 'category')
 
     # Location similarity (fuzzy)
-    location_similarity = calculate_text_similarity(lost_item.get('location',''), found_item.get('location',''))
+    location_similarity = pair.timed('fuzzy', pair.similarity, 'location')
+
+    lost_emb, found_emb = text_job.result()
+    text_similarity = cosine_sim(lost_emb, found_emb)
 
     # Time similarity and temporal features
     time_similarity = 0.0
@@ -236,31 +1027,14 @@ def compute_feature_set(lost_item, found_item):
     found_dow = None
     lost_date = lost_item.get('date') or lost_item.get('date_lost')
     found_date = found_item.get('date') or found_item.get('date_found')
-    if lost_date and found_date:
-        try:
-            lost_dt = datetime.strptime(lost_date, '%Y-%m-%d')
-            found_dt = datetime.strptime(found_date, '%Y-%m-%d')
-            days_diff = abs((lost_dt - found_dt).days)
-            time_similarity = max(0.0, 1.0 - (days_diff / 30.0))
-            time_to_claim_days = days_diff
-            lost_dow = lost_dt.weekday()
-            found_dow = found_dt.weekday()
-        except Exception:
-            time_similarity = 0.0
-
-    # Image similarity via ResNet if possible
-    image_similarity = 0.0
-    if lost_item.get('image') and found_item.get('image'):
-        try:
-            lt = preprocess_image_for_resnet(lost_item['image'])
-            ft = preprocess_image_for_resnet(found_item['image'])
-            if lt is not None and ft is not None:
-                lf = extract_resnet_features(lt)
-                ff = extract_resnet_features(ft)
-                if lf is not None and ff is not None:
-                    image_similarity = cosine_sim(lf, ff)
-        except Exception as e:
-            logger.error(f"Image similarity error: {e}")
+    lost_dt = parse_iso_date(lost_date)
+    found_dt = parse_iso_date(found_date)
+    if lost_dt is not None and found_dt is not None:
+        days_diff = abs((lost_dt - found_dt).days)
+        time_similarity = max(0.0, 1.0 - (days_diff / 30.0))
+        time_to_claim_days = days_diff
+        lost_dow = lost_dt.weekday()
+        found_dow = found_dt.weekday()
 
     # Spatial distance (if lat/lng provided)
     def to_float(x):
@@ -289,6 +1063,7 @@ def compute_feature_set(lost_item, found_item):
         except Exception:
             distance_km = None
             location_proximity = 0.0
+    pair.timings['features'] = round((time.perf_counter() - started) * 1000, 2)
 
     features = {
         'text_similarity': float(max(0.0, min(1.0, text_similarity))) if text_emb_avail() else float(calculate_text_similarity(lost_text, found_text)),
@@ -308,19 +1083,33 @@ def compute_feature_set(lost_item, found_item):
 def text_emb_avail():
     return text_tokenizer is not None and text_model is not None
 
+# Weighted average with emphasis on text and image
+MATCH_WEIGHTS = {
+    'text_similarity': 0.35,
+    'category_similarity': 0.10,
+    'location_similarity': 0.10,
+    'location_proximity': 0.10,
+    'time_similarity': 0.10,
+    'image_similarity': 0.25
+}
+
 def compute_match_score(features):
-    # Weighted average with emphasis on text and image
-    w = {
-        'text_similarity': 0.35,
-        'category_similarity': 0.10,
-        'location_similarity': 0.10,
-        'location_proximity': 0.10,
-        'time_similarity': 0.10,
-        'image_similarity': 0.25
-    }
+    w = MATCH_WEIGHTS
     score = sum(features[k] * w[k] for k in w)
     return float(round(score * 100.0, 1))
 
+def fraud_feature_matrix(features):
+    """Stack compute_feature_set features (scalars or arrays) into the fraud model's 5 columns.
+    The model was trained on a single location feature, so similarity and proximity are averaged."""
+    columns = [
+        features['text_similarity'],
+        features['category_similarity'],
+        np.asarray(features['location_similarity']) * 0.5 + np.asarray(features['location_proximity']) * 0.5,
+        features['time_similarity'],
+        features.get('image_similarity', 0.0)
+    ]
+    return np.column_stack([np.atleast_1d(np.asarray(c, dtype=np.float64)) for c in columns])
+
 fraud_model = None
 fraud_model_path = 'fraud_model.pkl'
 
@@ -357,7 +1146,8 @@ def load_or_train_fraud_model():
         logger.error(f"Failed to train fraud model: {e}")
         fraud_model = None
 
-load_or_train_fraud_model()
+if not MATCH_JOB_WORKER:
+    load_or_train_fraud_model()
 
 def get_risk_level(fraud_score):
     """Get risk level based on fraud score"""
@@ -399,6 +1189,122 @@ def get_fraud_analysis(fraud_score):
             "recommended_action": "reject"
         }
 
+profile_store = TTLCache(maxsize=int(os.environ.get('PROFILE_STORE_SIZE', 100)), ttl=3600)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    thread_id = threading.get_ident()
+    _active_request_threads.add(thread_id)
+    profile_requested = request.headers.get("X-Profile", "").lower() in ("1", "true", "yes")
+    if profile_requested or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE):
+        g.profiler = RequestProfiler(thread_id).start()
+
+@app.after_request
+def record_request_latency(response):
+    started = getattr(g, "request_started", None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        REQUEST_LATENCY.observe(elapsed, endpoint, request.method, str(response.status_code))
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            profile_store.set(g.request_id, {
+                "request_id": g.request_id,
+                "endpoint": endpoint,
+                "method": request.method,
+                "status": response.status_code,
+                "duration_ms": round(elapsed * 1000, 1),
+                "stacks": profiler.stop()
+            })
+            response.headers["X-Profile-Id"] = g.request_id
+    response.headers["X-Request-ID"] = getattr(g, "request_id", "")
+    return response
+
+@app.teardown_request
+def finish_request(exc=None):
+    _active_request_threads.discard(threading.get_ident())
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.stop()
+
+def admin_authorized():
+    return ADMIN_TOKEN is None or request.headers.get("X-Admin-Token") == ADMIN_TOKEN
+
+@app.get("/admin/profiles")
+def list_profiles():
+    """Stored per-request profiles, newest first"""
+    if not admin_authorized():
+        return jsonify({"ok": False, "error": "Unauthorized"}), 403
+    with profile_store.lock:
+        now = time.monotonic()
+        entries = [value for expires, value in reversed(profile_store.entries.values()) if expires > now]
+    return jsonify({"ok": True, "profiles": [
+        {key: value for key, value in entry.items() if key != "stacks"} | {"samples": sum(entry["stacks"].values())}
+        for entry in entries
+    ]})
+
+@app.get("/admin/profiles/<request_id>")
+def get_profile(request_id):
+    """Collapsed stacks of one profiled request (text/plain, for flamegraph.pl or speedscope)"""
+    if not admin_authorized():
+        return jsonify({"ok": False, "error": "Unauthorized"}), 403
+    entry = profile_store.get(request_id)
+    if entry is None:
+        return jsonify({"ok": False, "error": "Profile not found or expired"}), 404
+    return Response(format_collapsed(entry["stacks"]), mimetype="text/plain")
+
+@app.get("/admin/hot-stacks")
+def hot_stacks():
+    """Aggregated collapsed stacks from the periodic sampler; ?limit=N, ?reset=1 clears after reading"""
+    if not admin_authorized():
+        return jsonify({"ok": False, "error": "Unauthorized"}), 403
+    limit = request.args.get("limit", type=int)
+    with _hot_stacks_lock:
+        text = format_collapsed(_hot_stacks, limit)
+        if request.args.get("reset") in ("1", "true"):
+            _hot_stacks.clear()
+    return Response(text, mimetype="text/plain")
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text exposition of the service metrics"""
+    lines = []
+    for histogram in (REQUEST_LATENCY, STAGE_LATENCY, MODEL_BATCH_SIZE, INFERENCE_QUEUE_WAIT):
+        lines.extend(histogram.render())
+    with _inference_executors_lock:
+        executors = sorted(inference_executors.items())
+    for metric, attribute, metric_type, help_text in (
+        ("ml_inference_pending", "pending", "gauge", "Model calls queued or running"),
+        ("ml_inference_completed_total", "completed", "counter", "Model calls completed"),
+        ("ml_inference_rejected_total", "rejected", "counter", "Model calls rejected with 429 because the queue was full")
+    ):
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {metric_type}"]
+        lines += [f'{metric}{{model="{name}"}} {getattr(executor, attribute)}' for name, executor in executors]
+    caches = {
+        "image_features": image_feature_memory,
+        "results": result_cache,
+        "rankings": ranking_cache
+    }
+    flights = {"image_features": image_flight, "text_embedding": text_flight, "query_scoring": query_flight}
+    lines += ["# HELP ml_singleflight_calls_total Coalesced computations by role (followers shared a leader's result)",
+              "# TYPE ml_singleflight_calls_total counter"]
+    for name, flight in flights.items():
+        lines.append(f'ml_singleflight_calls_total{{flight="{name}",role="leader"}} {flight.leaders}')
+        lines.append(f'ml_singleflight_calls_total{{flight="{name}",role="follower"}} {flight.followers}')
+    date_cache = _parse_iso_date.cache_info()
+    cache_stats = {name: (cache.hits, cache.misses, len(cache.entries)) for name, cache in caches.items()}
+    cache_stats["dates"] = (date_cache.hits, date_cache.misses, date_cache.currsize)
+    for metric, position, metric_type, help_text in (
+        ("ml_cache_hits_total", 0, "counter", "Cache lookups that hit"),
+        ("ml_cache_misses_total", 1, "counter", "Cache lookups that missed"),
+        ("ml_cache_entries", 2, "gauge", "Entries currently cached")
+    ):
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {metric_type}"]
+        lines += [f'{metric}{{cache="{name}"}} {stats[position]}' for name, stats in cache_stats.items()]
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
 @app.get("/health")
 def health():
     try:
@@ -418,7 +1324,15 @@ def health():
             "ok": True, 
             "message": "ML service is running",
             "found_items": found_count,
-            "lost_items": lost_count
+            "lost_items": lost_count,
+            "inference": {
+                "mode": INFERENCE_MODE,
+                "models": inference_backends,
+                "text_model": TEXT_MODEL,
+                "image_model": IMAGE_MODEL,
+                "fast_text_model": FAST_TEXT_MODEL,
+                "fast_image_model": FAST_IMAGE_MODEL
+            }
         })
     except Exception as e:
         return jsonify({
@@ -430,55 +1344,41 @@ def health():
         })
 
 # Helper functions for image processing
-def preprocess_image(image_data):
-    """Convert base64 image to OpenCV format and extract ORB features"""
-    try:
-        if cv2 is None:
-            return None
-        # Decode base64 image
-        if isinstance(image_data, str) and image_data.startswith('data:image'):
-            # Handle data URL format
-            image_data = image_data.split(',')[1]
-        
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Convert to RGB if needed
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # Convert to OpenCV format
-        open_cv_image = np.array(image) 
-        open_cv_image = open_cv_image[:, :, ::-1].copy() # Convert RGB to BGR
-        
-        # Resize image for consistent processing
-        height, width = open_cv_image.shape[:2]
-        if width > 800 or height > 800:
-            scale = min(800/width, 800/height)
-            new_width = int(width * scale)
-            new_height = int(height * scale)
-            open_cv_image = cv2.resize(open_cv_image, (new_width, new_height))
-        
-        # Convert to grayscale for feature extraction
-        gray = cv2.cvtColor(open_cv_image, cv2.COLOR_BGR2GRAY)
-        
-        # Extract ORB features
-        orb = cv2.ORB_create(nfeatures=1000)
-        keypoints, descriptors = orb.detectAndCompute(gray, None)
-        
-        if descriptors is None or len(descriptors) == 0:
-            return None
-            
-        return {
-            "image": open_cv_image,
-            "gray": gray,
-            "keypoints": keypoints,
-            "descriptors": descriptors
-        }
-    except Exception as e:
-        logger.error(f"Error preprocessing image: {e}")
+@timed_stage('orb')
+def orb_features_from_image(image):
+    """Extract ORB features from a decoded RGB image"""
+    if cv2 is None:
+        return None
+    # Convert to OpenCV format
+    open_cv_image = np.array(image)
+    open_cv_image = open_cv_image[:, :, ::-1].copy() # Convert RGB to BGR
+    
+    # Resize image for consistent processing
+    height, width = open_cv_image.shape[:2]
+    if width > ORB_MAX_SIDE or height > ORB_MAX_SIDE:
+        scale = min(ORB_MAX_SIDE/width, ORB_MAX_SIDE/height)
+        new_width = int(width * scale)
+        new_height = int(height * scale)
+        open_cv_image = cv2.resize(open_cv_image, (new_width, new_height))
+    
+    # Convert to grayscale for feature extraction
+    gray = cv2.cvtColor(open_cv_image, cv2.COLOR_BGR2GRAY)
+    
+    # Extract ORB features
+    orb = cv2.ORB_create(nfeatures=1000)
+    keypoints, descriptors = orb.detectAndCompute(gray, None)
+    
+    if descriptors is None or len(descriptors) == 0:
         return None
+        
+    return {
+        "image": open_cv_image,
+        "gray": gray,
+        "keypoints": keypoints,
+        "descriptors": descriptors
+    }
 
+@timed_stage('orb_match')
 def calculate_image_similarity(desc1, desc2):
     """Calculate similarity between two image descriptors using feature matching"""
     try:
@@ -527,106 +1427,409 @@ def calculate_color_similarity(img1, img2):
         logger.error(f"Error calculating color similarity: {e}")
         return 0.0
 
-def calculate_text_similarity(text1, text2):
-    """Calculate similarity between two text strings using fuzzy matching"""
-    if not text1 or not text2:
-        return 0.0
-    
+# Content-addressed image feature cache: SHA-256 of the decoded bytes -> ResNet vector,
+# ORB descriptors and perceptual fingerprint. An in-memory LRU sits in front of the
+# image_feature_cache table, so repeat images skip decode and inference entirely.
+IMAGE_FEATURE_KINDS = ('resnet', 'orb', 'fingerprint')
+# Cached in place of ORB descriptors when ORB finds no keypoints (an empty blob in the table,
+# unlike NULL = not computed); callers still see None
+NO_ORB_DESCRIPTORS = np.empty((0, 32), dtype=np.uint8)
+image_feature_memory = TTLCache(maxsize=int(os.environ.get('IMAGE_FEATURE_CACHE_SIZE', 1024)), ttl=3600)
+image_flight = SingleFlight()
+
+def compute_image_fingerprint(image):
+    """64-bit difference hash (dHash) of a decoded image as 16 hex characters"""
     try:
-        if fuzz is None:
-            # Fallback to simple string matching when thefuzz is not available
-            text1_lower = text1.lower().strip()
-            text2_lower = text2.lower().strip()
-            
-            # Exact match
-            if text1_lower == text2_lower:
-                return 1.0
-            
-            # Check if one is substring of another
-            if text1_lower in text2_lower or text2_lower in text1_lower:
-                return 0.7
-            
-            # Simple word overlap
-            words1 = set(text1_lower.split())
-            words2 = set(text2_lower.split())
-            if len(words1) == 0 or len(words2) == 0:
-                return 0.0
-            
-            intersection = words1.intersection(words2)
-            union = words1.union(words2)
-            return len(intersection) / len(union)
-        
-        # Use thefuzz if available
-        ratio = fuzz.ratio(text1.lower(), text2.lower()) / 100.0
-        partial_ratio = fuzz.partial_ratio(text1.lower(), text2.lower()) / 100.0
-        token_sort_ratio = fuzz.token_sort_ratio(text1.lower(), text2.lower()) / 100.0
-        
-        # Weighted average
-        return (0.3 * ratio + 0.4 * partial_ratio + 0.3 * token_sort_ratio)
+        pixels = np.asarray(image.convert('L').resize((9, 8)), dtype=np.int16)
+        bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+        return '%016x' % int(''.join('1' if bit else '0' for bit in bits), 2)
     except Exception as e:
-        logger.error(f"Error in text similarity calculation: {e}")
-        return 0.0
+        logger.error(f"Error computing image fingerprint: {e}")
+        return None
 
-def calculate_fraud_score_based_on_matching(lost_item, found_item, user_history=None):
-    """Calculate fraud score based on actual similarity between lost and found items"""
-    fraud_indicators = []
-    total_score = 0
-    
-    # Extract item details
-    lost_name = lost_item.get('name', '').lower()
-    lost_desc = lost_item.get('description', '').lower()
-    lost_category = lost_item.get('category', '').lower()
-    lost_location = lost_item.get('location', '').lower()
-    lost_date = lost_item.get('date', '')
-    
-    found_name = found_item.get('name', '').lower()
-    found_desc = found_item.get('description', '').lower()
-    found_category = found_item.get('category', '').lower()
-    found_location = found_item.get('location', '').lower()
-    found_date = found_item.get('date', '')
-    
-    # Calculate similarity scores
-    name_similarity = calculate_text_similarity(lost_name, found_name)
-    desc_similarity = calculate_text_similarity(lost_desc, found_desc)
-    category_similarity = calculate_text_similarity(lost_category, found_category)
-    location_similarity = calculate_text_similarity(lost_location, found_location)
-    
-    # Date proximity analysis
-    date_similarity = 0
-    if lost_date and found_date:
-        try:
-            from datetime import datetime
-            lost_dt = datetime.strptime(lost_date, '%Y-%m-%d')
-            found_dt = datetime.strptime(found_date, '%Y-%m-%d')
-            days_diff = abs((lost_dt - found_dt).days)
-            date_similarity = max(0, 1 - (days_diff / 30))  # 30 days max
-        except:
-            date_similarity = 0
-    
-    # Calculate overall match score
-    overall_match = (
-        name_similarity * 0.3 +
-        desc_similarity * 0.25 +
-        category_similarity * 0.2 +
-        location_similarity * 0.15 +
-        date_similarity * 0.1
-    )
-    
-    # Fraud indicators based on matching analysis
-    if overall_match < 0.3:
-        fraud_indicators.append("Very low similarity between lost and found items")
-        total_score += 40
-    elif overall_match < 0.5:
-        fraud_indicators.append("Low similarity between lost and found items")
-        total_score += 25
-    elif overall_match < 0.7:
-        fraud_indicators.append("Moderate similarity - requires verification")
-        total_score += 10
-    
-    # Specific fraud patterns
-    if name_similarity < 0.2 and desc_similarity < 0.2:
-        fraud_indicators.append("Name and description don't match")
-        total_score += 30
+# Rows stored before embeddings were tagged were produced by the original models
+LEGACY_IMAGE_MODEL = 'resnet50'
+LEGACY_TEXT_MODEL = 'bert-base'
+
+@timed_stage('db')
+def load_image_feature_row(content_hash):
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT resnet_features, image_model, fast_features, fast_model, orb_descriptors, fingerprint
+            FROM image_feature_cache WHERE content_hash = ?
+        ''', (content_hash,))
+        row = cursor.fetchone()
+        conn.close()
+    except Exception as e:
+        logger.error(f"Error loading cached image features: {e}")
+        return None
+    if row is None:
+        return None
+    resnet_blob, image_model, fast_blob, fast_model, orb_blob, fingerprint = row
+    # Vectors from a different model than the one configured now are treated as missing
+    return {
+        "hash": content_hash,
+        "resnet": decode_embedding_blob(resnet_blob) if (image_model or LEGACY_IMAGE_MODEL) == IMAGE_MODEL else None,
+        "fast": decode_embedding_blob(fast_blob) if fast_model and fast_model == FAST_IMAGE_MODEL else None,
+        "orb": np.frombuffer(orb_blob, dtype=np.uint8).reshape(-1, 32) if orb_blob is not None else None,
+        "fingerprint": fingerprint
+    }
+
+@timed_stage('db')
+def save_image_feature_row(entry):
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT OR REPLACE INTO image_feature_cache
+            (content_hash, resnet_features, image_model, fast_features, fast_model, orb_descriptors, fingerprint)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            entry["hash"],
+            pickle.dumps(entry["resnet"]) if entry["resnet"] is not None else None,
+            IMAGE_MODEL,
+            pickle.dumps(entry["fast"]) if entry.get("fast") is not None else None,
+            FAST_IMAGE_MODEL,
+            entry["orb"].tobytes() if entry["orb"] is not None else None,
+            entry["fingerprint"]
+        ))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        logger.error(f"Error saving cached image features: {e}")
+
+def get_image_features(image_data, need=('resnet',)):
+    """Return {'hash', 'resnet', 'fast', 'orb', 'fingerprint'} for an image, computing only the
+    requested kinds that are not cached yet. 'resnet' is the heavy-tier image model vector,
+    'fast' the fast-tier one. Unavailable features stay None."""
+    image_bytes = decode_image_data(image_data)
+    content_hash = image_content_hash(image_bytes)
+    entry = image_feature_memory.get(content_hash)
+    if entry is None:
+        entry = load_image_feature_row(content_hash) or {
+            "hash": content_hash, "resnet": None, "fast": None, "orb": None, "fingerprint": None
+        }
+    missing = [kind for kind in need if entry.get(kind) is None]
+    if 'resnet' in missing and (transforms is None or resnet_model is None):
+        missing.remove('resnet')
+    if 'fast' in missing and (transforms is None or fast_image_model is None):
+        missing.remove('fast')
+    if 'orb' in missing and cv2 is None:
+        missing.remove('orb')
+    if missing:
+        # Concurrent requests for the same image and kinds share one decode and inference
+        entry = image_flight.do((content_hash, tuple(missing)), compute_image_features,
+                                image_bytes, entry, missing)
+    image_feature_memory.set(content_hash, entry)
+    if entry["orb"] is not None and len(entry["orb"]) == 0:
+        return dict(entry, orb=None)
+    return entry
+
+def compute_image_features(image_bytes, entry, missing):
+    """Copy of a feature cache entry with the missing kinds computed (and saved)"""
+    entry = dict(entry)
+    # One decode serves every missing feature kind
+    try:
+        image = decode_image_for_features(image_bytes, resnet='resnet' in missing or 'fast' in missing,
+                                          orb='orb' in missing)
+    except Exception as e:
+        logger.error(f"Error decoding image: {e}")
+        image = None
+    if image is not None:
+        if 'resnet' in missing or 'fast' in missing:
+            try:
+                image_tensor = resnet_tensor_from_image(image)
+                if 'resnet' in missing:
+                    entry["resnet"] = extract_resnet_features(image_tensor)
+                if 'fast' in missing:
+                    entry["fast"] = extract_resnet_features(image_tensor, tier='fast')
+            except InferenceOverloaded:
+                raise
+            except Exception as e:
+                logger.error(f"Error preprocessing image for ResNet: {e}")
+        if 'orb' in missing:
+            try:
+                processed_image = orb_features_from_image(image)
+                entry["orb"] = processed_image["descriptors"] if processed_image else NO_ORB_DESCRIPTORS
+            except Exception as e:
+                logger.error(f"Error preprocessing image: {e}")
+        if 'fingerprint' in missing:
+            entry["fingerprint"] = compute_image_fingerprint(image)
+    if any(entry[kind] is not None for kind in missing):
+        save_image_feature_row(entry)
+    return entry
+
+# Items referenced by id (lost_item_id / found_item_id) are scored from the features
+# /store-item already holds in item_features instead of a re-shipped base64 image.
+@timed_stage('db')
+def load_stored_item(item_id, item_type):
+    """Load a stored item as an item dict carrying its stored features, or None"""
+    if item_id is None:
+        return None
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT item_name, category, description, location, date, image_features, text_embedding, lat, lng,
+                   image_model, text_model
+            FROM item_features
+            WHERE item_id = ? AND item_type = ?
+        ''', (item_id, item_type))
+        row = cursor.fetchone()
+        conn.close()
+    except Exception as e:
+        logger.error(f"Error loading stored {item_type} item {item_id}: {e}")
+        return None
+    if row is None:
+        return None
+    name, category, description, location, date, image_blob, text_blob, lat, lng, image_model, text_model = row
+    kind, image_features = decode_image_features_blob(image_blob)
+    # Features from a model other than the configured one can't be compared with fresh ones
+    if (image_model or LEGACY_IMAGE_MODEL) != IMAGE_MODEL:
+        image_features = None
+    if (text_model or LEGACY_TEXT_MODEL) != TEXT_MODEL:
+        text_blob = None
+    return {
+        "item_id": item_id,
+        "name": name or '',
+        "category": category or '',
+        "description": description or '',
+        "location": location or '',
+        "date": date or '',
+        "lat": lat,
+        "lng": lng,
+        "_image_features": image_features if kind == 'resnet' else None,
+        "_text_embedding": decode_embedding_blob(text_blob)
+    }
+
+def search_feature_kinds():
+    """Feature kinds to index/search an image by: the heavy image model when it is loaded
+    (else ORB), plus the fast-tier model when one is configured"""
+    kinds = ('resnet',) if resnet_model is not None else ('orb',)
+    if fast_image_model is not None:
+        kinds += ('fast',)
+    return kinds
+
+def resolve_item(item, item_id, item_type):
+    """Merge an inline item with its stored copy when an id reference is given.
+    Inline fields override stored metadata; stored features win over an inline image."""
+    item = item or {}
+    stored = load_stored_item(item_id, item_type)
+    if stored is None:
+        return item
+    merged = {**stored, **{k: v for k, v in item.items() if v not in (None, '')}, "_stored": True}
+    if stored["_image_features"] is not None:
+        merged.pop('image', None)
+    # The stored embedding is of the stored name + description; inline text replaces it
+    if (merged["name"], merged["description"]) != (stored["name"], stored["description"]):
+        merged.pop('_text_embedding')
+    return merged
+
+def unresolved_item_ids(payload, lost_item, found_item):
+    """The lost_item_id / found_item_id references in payload that match no stored item,
+    so callers can tell that the item was scored from its inline fields only"""
+    return {key: payload.get(key) for key, item in (('lost_item_id', lost_item), ('found_item_id', found_item))
+            if payload.get(key) is not None and not item.get('_stored')}
+
+def has_image(item):
+    return bool(item.get('image')) or item.get('_image_features') is not None
+
+def item_image_features(item):
+    """ResNet features for an item: stored features if present, else from its (cached) image"""
+    if item.get('_image_features') is not None:
+        return item['_image_features']
+    if item.get('image'):
+        return get_image_features(item['image'])["resnet"]
+    return None
+
+def item_text_embedding(item, text):
+    """Stored text embedding for an item (computed from name + description), else encode text"""
+    if item.get('_text_embedding') is not None:
+        return item['_text_embedding']
+    return encode_text_to_embedding(text)
+
+def item_image_similarity(item_a, item_b, executor=None):
+    """Cosine similarity of the ResNet features of two items, 0.0 if unavailable.
+    With an executor, item_a's features are computed there while item_b's are computed here."""
+    if executor is not None:
+        job_a = executor.submit(with_caller_admission(item_image_features), item_a)
+        features_b = item_image_features(item_b)
+        features_a = job_a.result()
+    else:
+        features_a = item_image_features(item_a)
+        features_b = item_image_features(item_b)
+    if features_a is None or features_b is None:
+        return 0.0
+    return cosine_sim(features_a, features_b)
+
+@timed_stage('fuzzy')
+def calculate_text_similarity(text1, text2):
+    """Calculate similarity between two text strings using fuzzy matching"""
+    return text_similarity(text1, text2)
+
+# ---------------------------------------------------------------------------
+# Fraud rules: keyword lists and date parsing are set up once at import time
+# instead of on every call.
+# ---------------------------------------------------------------------------
+
+class KeywordSet:
+    """Multi-keyword substring matcher; matches(text) returns the set of keywords occurring
+    anywhere in text. For lists this short, per-keyword `in` scans (memchr-backed) measured
+    faster than a single compiled-regex or lookahead pass over typical descriptions."""
+
+    def __init__(self, keywords):
+        self.keywords = tuple(dict.fromkeys(keywords))
+
+    def matches(self, text):
+        return {keyword for keyword in self.keywords if keyword in text}
+
+    def count_in_either(self, text1, text2):
+        """Number of keywords found in text1 or text2"""
+        return sum(1 for keyword in self.keywords if keyword in text1 or keyword in text2)
+
+# Suspicious keywords that might indicate fraud
+SUSPICIOUS_KEYWORDS = KeywordSet([
+    'urgent', 'asap', 'reward', 'expensive', 'valuable', 'brand new',
+    'iphone', 'samsung', 'macbook', 'laptop', 'jewelry', 'gold', 'diamond',
+    'wallet', 'purse', 'handbag', 'watch', 'ring', 'necklace'
+])
+# Subset checked in the combined lost + found descriptions of a claimed match
+SUSPICIOUS_MATCH_PATTERNS = KeywordSet([
+    'urgent', 'asap', 'reward', 'expensive', 'valuable', 'brand new',
+    'iphone', 'samsung', 'macbook', 'laptop', 'jewelry', 'gold', 'diamond'
+])
+GENERIC_PHRASES = KeywordSet([
+    'lost item', 'found item', 'personal belongings', 'valuable item',
+    'important document', 'electronic device', 'accessory'
+])
+VAGUE_LOCATIONS = ('unknown', 'n/a', 'not specified')
+
+@lru_cache(maxsize=4096)
+def _parse_iso_date(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+def parse_iso_date(value):
+    """Parse a YYYY-MM-DD string (memoized), None if missing/invalid"""
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        return _parse_iso_date(value)
+    except ValueError:
+        return None
+
+def date_gap_days(date1, date2):
+    """Absolute day difference between two YYYY-MM-DD dates, None if either is missing/invalid"""
+    dt1, dt2 = parse_iso_date(date1), parse_iso_date(date2)
+    if dt1 is None or dt2 is None:
+        return None
+    return abs((dt1 - dt2).days)
+
+def user_history_fraud_points(user_history):
+    """(points, indicators) contributed by a claimant's history"""
+    points, indicators = 0, []
+    if user_history:
+        recent_claims = user_history.get('recent_claims', 0)
+        if recent_claims > 5:
+            indicators.append(f"High number of recent claims ({recent_claims})")
+            points += min(recent_claims * 3, 20)
+        
+        similar_claims = user_history.get('similar_claims', 0)
+        if similar_claims > 2:
+            indicators.append(f"Multiple similar claims ({similar_claims})")
+            points += min(similar_claims * 5, 15)
+    return points, indicators
+
+class PairFeatures:
+    """Pairwise similarities of one (lost, found) pair, computed on first use and memoized so
+    the match and fraud scorers of a request share them instead of recomputing each one"""
+
+    def __init__(self, lost_item, found_item):
+        self.lost_item = lost_item
+        self.found_item = found_item
+        self._similarities = {}
+        self._image_similarity = None
+        self.timings = {}  # stage -> milliseconds, see timed()
+
+    def similarity(self, field):
+        """Fuzzy calculate_text_similarity of a field (case-insensitive)"""
+        if field not in self._similarities:
+            self._similarities[field] = calculate_text_similarity(
+                self.lost_item.get(field, ''), self.found_item.get(field, ''))
+        return self._similarities[field]
+
+    def days_apart(self):
+        return date_gap_days(self.lost_item.get('date', ''), self.found_item.get('date', ''))
+
+    def timed(self, stage, fn, *args):
+        """Call fn, adding its duration to timings[stage]"""
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            elapsed = round((time.perf_counter() - started) * 1000, 2)
+            self.timings[stage] = round(self.timings.get(stage, 0.0) + elapsed, 2)
+
+    def image_similarity(self, executor=None):
+        """Image feature cosine, 0.0 unless both items have an image. With an executor the two
+        images are processed in parallel."""
+        if self._image_similarity is None:
+            self._image_similarity = 0.0
+            if has_image(self.lost_item) and has_image(self.found_item):
+                try:
+                    self._image_similarity = item_image_similarity(self.lost_item, self.found_item, executor)
+                except InferenceOverloaded:
+                    raise
+                except Exception as e:
+                    logger.error(f"Image similarity error: {e}")
+        return self._image_similarity
+
+@timed_stage('scoring')
+def calculate_fraud_score_based_on_matching(lost_item, found_item, user_history=None, pair=None):
+    """Calculate fraud score based on actual similarity between lost and found items"""
+    pair = pair or PairFeatures(lost_item, found_item)
+    fraud_indicators = []
+    total_score = 0
+    
+    # Extract item details
+    lost_desc = lost_item.get('description', '').lower()
+    found_desc = found_item.get('description', '').lower()
+    
+    # Calculate similarity scores (calculate_text_similarity is case-insensitive)
+    name_similarity = pair.similarity('name')
+    desc_similarity = pair.similarity('description')
+    category_similarity = pair.similarity('category')
+    location_similarity = pair.similarity('location')
+    
+    # Date proximity analysis
+    days_diff = pair.days_apart()
+    date_similarity = 0 if days_diff is None else max(0, 1 - (days_diff / 30))  # 30 days max
+    
+    # Calculate overall match score
+    overall_match = (
+        name_similarity * 0.3 +
+        desc_similarity * 0.25 +
+        category_similarity * 0.2 +
+        location_similarity * 0.15 +
+        date_similarity * 0.1
+    )
+    
+    # Fraud indicators based on matching analysis
+    if overall_match < 0.3:
+        fraud_indicators.append("Very low similarity between lost and found items")
+        total_score += 40
+    elif overall_match < 0.5:
+        fraud_indicators.append("Low similarity between lost and found items")
+        total_score += 25
+    elif overall_match < 0.7:
+        fraud_indicators.append("Moderate similarity - requires verification")
+        total_score += 10
+    
+    # Specific fraud patterns
+    if name_similarity < 0.2 and desc_similarity < 0.2:
+        fraud_indicators.append("Name and description don't match")
+        total_score += 30
     
     if category_similarity < 0.5:
         fraud_indicators.append("Category mismatch")
@@ -637,72 +1840,37 @@ def calculate_fraud_score_based_on_matching(lost_item, found_item, user_history=
         total_score += 10
     
     # Date analysis
-    if lost_date and found_date:
-        try:
-            from datetime import datetime
-            lost_dt = datetime.strptime(lost_date, '%Y-%m-%d')
-            found_dt = datetime.strptime(found_date, '%Y-%m-%d')
-            days_diff = abs((lost_dt - found_dt).days)
-            
-            if days_diff > 30:
-                fraud_indicators.append("Large time gap between lost and found dates")
-                total_score += 20
-            elif days_diff > 14:
-                fraud_indicators.append("Significant time gap between lost and found dates")
-                total_score += 10
-        except:
-            pass
+    if days_diff is not None:
+        if days_diff > 30:
+            fraud_indicators.append("Large time gap between lost and found dates")
+            total_score += 20
+        elif days_diff > 14:
+            fraud_indicators.append("Significant time gap between lost and found dates")
+            total_score += 10
     
     # Check for suspicious patterns in descriptions
-    suspicious_patterns = [
-        'urgent', 'asap', 'reward', 'expensive', 'valuable', 'brand new',
-        'iphone', 'samsung', 'macbook', 'laptop', 'jewelry', 'gold', 'diamond'
-    ]
-    
     combined_desc = f"{lost_desc} {found_desc}"
-    pattern_matches = sum(1 for pattern in suspicious_patterns if pattern in combined_desc)
+    pattern_matches = len(SUSPICIOUS_MATCH_PATTERNS.matches(combined_desc))
     if pattern_matches > 2:
         fraud_indicators.append(f"Multiple suspicious keywords detected ({pattern_matches})")
         total_score += min(pattern_matches * 5, 20)
     
     # Check for generic descriptions
-    generic_phrases = [
-        'lost item', 'found item', 'personal belongings', 'valuable item',
-        'important document', 'electronic device', 'accessory'
-    ]
-    generic_matches = sum(1 for phrase in generic_phrases if phrase in combined_desc)
-    if generic_matches > 0:
+    if GENERIC_PHRASES.matches(combined_desc):
         fraud_indicators.append("Generic description detected")
         total_score += 8
     
     # User history analysis
-    if user_history:
-        recent_claims = user_history.get('recent_claims', 0)
-        if recent_claims > 5:
-            fraud_indicators.append(f"High number of recent claims ({recent_claims})")
-            total_score += min(recent_claims * 3, 20)
-        
-        similar_claims = user_history.get('similar_claims', 0)
-        if similar_claims > 2:
-            fraud_indicators.append(f"Multiple similar claims ({similar_claims})")
-            total_score += min(similar_claims * 5, 15)
+    history_points, history_indicators = user_history_fraud_points(user_history)
+    fraud_indicators.extend(history_indicators)
+    total_score += history_points
     
     # Normalize score to 0-100
     fraud_score = min(total_score, 100)
     
-    # Determine risk level
-    if fraud_score < 20:
-        risk_level = "Low"
-    elif fraud_score < 50:
-        risk_level = "Medium"
-    elif fraud_score < 80:
-        risk_level = "High"
-    else:
-        risk_level = "Critical"
-    
     return {
         'fraud_score': fraud_score,
-        'risk_level': risk_level,
+        'risk_level': get_risk_level(fraud_score),
         'indicators': fraud_indicators,
         'confidence': max(0, 100 - fraud_score),
         'match_analysis': {
@@ -715,162 +1883,1653 @@ def calculate_fraud_score_based_on_matching(lost_item, found_item, user_history=
         }
     }
 
+def item_fraud_signals(item_details):
+    """Rule inputs of calculate_fraud_score for one item:
+    (keyword_matches, description_length, max_word_repetition, vague_location, generic_matches)"""
+    description = item_details.get('description', '').lower()
+    name = item_details.get('name', '').lower()
+    keyword_matches = SUSPICIOUS_KEYWORDS.count_in_either(description, name)
+    words = description.split()
+    max_repetition = max(Counter(words).values()) if words else 0
+    location = item_details.get('location', '').lower()
+    vague_location = not location or location in VAGUE_LOCATIONS
+    generic_matches = len(GENERIC_PHRASES.matches(description))
+    return keyword_matches, len(description), max_repetition, int(vague_location), generic_matches
+
+@timed_stage('scoring')
 def calculate_fraud_score(item_details, user_history=None):
     """Calculate fraud risk score based on item details and user history"""
     fraud_indicators = []
     total_score = 0
+    keyword_matches, description_length, max_repetition, vague_location, generic_matches = \
+        item_fraud_signals(item_details)
     
-    # Check for suspicious patterns in item description
-    description = item_details.get('description', '').lower()
-    name = item_details.get('name', '').lower()
-    
-    # Suspicious keywords that might indicate fraud
-    suspicious_keywords = [
-        'urgent', 'asap', 'reward', 'expensive', 'valuable', 'brand new',
-        'iphone', 'samsung', 'macbook', 'laptop', 'jewelry', 'gold', 'diamond',
-        'wallet', 'purse', 'handbag', 'watch', 'ring', 'necklace'
-    ]
-    
-    keyword_matches = sum(1 for keyword in suspicious_keywords if keyword in description or keyword in name)
     if keyword_matches > 3:
         fraud_indicators.append(f"Multiple suspicious keywords detected ({keyword_matches})")
         total_score += min(keyword_matches * 5, 25)
     
     # Check for unrealistic descriptions
-    if len(description) < 10:
+    if description_length < 10:
         fraud_indicators.append("Very short description")
         total_score += 10
-    elif len(description) > 500:
+    elif description_length > 500:
         fraud_indicators.append("Excessively long description")
         total_score += 5
     
     # Check for repeated words (potential copy-paste)
-    words = description.split()
-    if len(words) > 0:
-        word_counts = {}
-        for word in words:
-            word_counts[word] = word_counts.get(word, 0) + 1
-        max_repetition = max(word_counts.values())
-        if max_repetition > 3:
-            fraud_indicators.append("Repetitive text detected")
-            total_score += 15
+    if max_repetition > 3:
+        fraud_indicators.append("Repetitive text detected")
+        total_score += 15
     
     # Check location patterns
-    location = item_details.get('location', '').lower()
-    if not location or location in ['unknown', 'n/a', 'not specified']:
+    if vague_location:
         fraud_indicators.append("Missing or vague location")
         total_score += 5
     
     # Check for generic descriptions
-    generic_phrases = [
-        'lost item', 'found item', 'personal belongings', 'valuable item',
-        'important document', 'electronic device', 'accessory'
-    ]
-    generic_matches = sum(1 for phrase in generic_phrases if phrase in description)
     if generic_matches > 0:
         fraud_indicators.append("Generic description detected")
         total_score += 8
     
     # Check user history if available
-    if user_history:
-        # Check for multiple recent claims
-        recent_claims = user_history.get('recent_claims', 0)
-        if recent_claims > 5:
-            fraud_indicators.append(f"High number of recent claims ({recent_claims})")
-            total_score += min(recent_claims * 3, 20)
-        
-        # Check for similar previous claims
-        similar_claims = user_history.get('similar_claims', 0)
-        if similar_claims > 2:
-            fraud_indicators.append(f"Multiple similar claims ({similar_claims})")
-            total_score += min(similar_claims * 5, 15)
+    history_points, history_indicators = user_history_fraud_points(user_history)
+    fraud_indicators.extend(history_indicators)
+    total_score += history_points
     
     # Normalize score to 0-100
     fraud_score = min(total_score, 100)
     
-    # Determine risk level
-    if fraud_score < 20:
-        risk_level = "Low"
-    elif fraud_score < 50:
-        risk_level = "Medium"
-    elif fraud_score < 80:
-        risk_level = "High"
+    return {
+        'fraud_score': fraud_score,
+        'risk_level': get_risk_level(fraud_score),
+        'indicators': fraud_indicators,
+        'confidence': max(0, 100 - fraud_score)
+    }
+
+def calculate_fraud_scores(items, user_history=None):
+    """Columnar calculate_fraud_score for many items. Returns numpy arrays of the rule inputs
+    plus 'fraud_score' and 'risk_level', element-wise identical to the single-item function."""
+    signals = np.array([item_fraud_signals(item) for item in items], dtype=np.int64).reshape(-1, 5)
+    keyword_matches, description_length, max_repetition, vague_location, generic_matches = signals.T
+    history_points, _ = user_history_fraud_points(user_history)
+    total_score = (
+        np.where(keyword_matches > 3, np.minimum(keyword_matches * 5, 25), 0) +
+        np.where(description_length < 10, 10, np.where(description_length > 500, 5, 0)) +
+        np.where(max_repetition > 3, 15, 0) +
+        vague_location * 5 +
+        np.where(generic_matches > 0, 8, 0) +
+        history_points
+    )
+    fraud_score = np.minimum(total_score, 100)
+    return {
+        'keyword_matches': keyword_matches,
+        'description_length': description_length,
+        'max_word_repetition': max_repetition,
+        'vague_location': vague_location.astype(bool),
+        'generic_matches': generic_matches,
+        'fraud_score': fraud_score,
+        'risk_level': np.select([fraud_score < 20, fraud_score < 50, fraud_score < 80],
+                                ['Low', 'Medium', 'High'], 'Critical'),
+        'confidence': np.maximum(0, 100 - fraud_score)
+    }
+
+@timed_stage('scoring')
+def calculate_match_confidence(lost_item, found_item, image_similarity=0, pair=None):
+    """Calculate overall match confidence between lost and found items"""
+    pair = pair or PairFeatures(lost_item, found_item)
+    # Text similarity scores
+    name_sim = pair.similarity('name')
+    desc_sim = pair.similarity('description')
+    category_sim = pair.similarity('category')
+    location_sim = pair.similarity('location')
+    
+    # Date proximity (if both have dates)
+    date_sim = 0
+    days_diff = pair.days_apart()
+    if days_diff is not None:
+        # Higher similarity for closer dates
+        date_sim = max(0, 1 - (days_diff / 30))  # 30 days max
+    
+    # Weighted combination
+    if image_similarity > 0:
+        # If we have image data, weight it heavily
+        match_score = (
+            name_sim * 0.25 +
+            desc_sim * 0.25 +
+            category_sim * 0.15 +
+            location_sim * 0.10 +
+            date_sim * 0.10 +
+            image_similarity * 0.15
+        ) * 100
+    else:
+        # Text-only matching
+        match_score = (
+            name_sim * 0.35 +
+            desc_sim * 0.35 +
+            category_sim * 0.15 +
+            location_sim * 0.10 +
+            date_sim * 0.05
+        ) * 100
+    
+    # Determine confidence level
+    if match_score >= 85:
+        confidence_level = "Very High"
+    elif match_score >= 70:
+        confidence_level = "High"
+    elif match_score >= 50:
+        confidence_level = "Medium"
+    elif match_score >= 30:
+        confidence_level = "Low"
+    else:
+        confidence_level = "Very Low"
+    
+    return {
+        'match_score': round(match_score, 1),
+        'confidence_level': confidence_level,
+        'breakdown': {
+            'name_similarity': round(name_sim * 100, 1),
+            'description_similarity': round(desc_sim * 100, 1),
+            'category_similarity': round(category_sim * 100, 1),
+            'location_similarity': round(location_sim * 100, 1),
+            'date_similarity': round(date_sim * 100, 1),
+            'image_similarity': round(image_similarity * 100, 1) if image_similarity > 0 else None
+        }
+    }
+
+# ---------------------------------------------------------------------------
+# Hybrid retrieval: candidate generation from several in-memory indexes
+# (image ANN, text ANN, lexical, geo), reciprocal-rank fusion, then a single
+# vectorized re-rank over the shortlist using the compute_feature_set features.
+# ---------------------------------------------------------------------------
+
+RRF_K = 60                   # Reciprocal-rank fusion damping constant
+CANDIDATES_PER_INDEX = 100   # Candidates each index contributes to fusion
+SHORTLIST_SIZE = 50          # Fused candidates that reach the re-rank stage (more if a request asks for more results)
+STAGE_TWO_MIN_K = 10         # Cascade: stage two always scores at least this many candidates
+STAGE_TWO_MAX_K = 200        # Cascade: and never more than this many
+MATCH_LATENCY_BUDGET_MS = float(os.environ.get('MATCH_LATENCY_BUDGET_MS', 300))
+GEO_RADIUS_KM = 10.0         # Geo index only proposes items within this radius
+MIN_MATCH_SCORE = 30         # Minimum threshold for returned results
+RERANK_CHUNK_SIZE = 16       # Candidates fully scored per step of the bounded re-rank
+
+retrieval_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='retrieval')
+
+def to_float(value):
+    try:
+        return float(value)
+    except Exception:
+        return None
+
+def tokenize(text):
+    return re.findall(r'[a-z0-9]+', (text or '').lower())
+
+def parse_date_ordinal(value):
+    """Parse a YYYY-MM-DD date into a day ordinal, or None if missing/invalid"""
+    parsed = parse_iso_date(value)
+    return parsed.toordinal() if parsed is not None else None
+
+def l2_normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+def top_k_indices(scores, k):
+    """Indices of the k largest scores, best first"""
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if scores.size > k:
+        idx = np.argpartition(-scores, k - 1)[:k]
+    else:
+        idx = np.arange(scores.size)
+    return idx[np.argsort(-scores[idx], kind='stable')]
+
+def decode_image_features_blob(blob):
+    """Decode a stored image_features blob into ('resnet', vector) or ('orb', descriptors)"""
+    if not blob:
+        return None, None
+    # ResNet features are pickled numpy vectors, ORB descriptors are raw 32-byte rows
+    if blob[:1] == b'\x80':
+        try:
+            features = pickle.loads(blob)
+            if isinstance(features, np.ndarray) and features.ndim == 1:
+                return 'resnet', features.astype(np.float32)
+        except Exception:
+            pass
+    if len(blob) % 32 == 0:
+        return 'orb', np.frombuffer(blob, dtype=np.uint8).reshape(-1, 32)
+    return None, None
+
+def decode_embedding_blob(blob):
+    if not blob:
+        return None
+    try:
+        return np.asarray(pickle.loads(blob), dtype=np.float32).reshape(-1)
+    except Exception:
+        return None
+
+def stack_embeddings(row_ids, vectors, size):
+    """Stack vectors into a normalized matrix.
+    Returns (matrix, positions, rows): positions maps item row -> matrix row (-1 if absent),
+    rows maps matrix row -> item row. Vectors whose dimension differs from the majority are left out."""
+    positions = np.full(size, -1, dtype=np.int64)
+    if not vectors:
+        return None, positions, np.empty(0, dtype=np.int64)
+    dims = [v.shape[0] for v in vectors]
+    dim = max(set(dims), key=dims.count)
+    keep = [i for i, d in enumerate(dims) if d == dim]
+    rows = np.array([row_ids[i] for i in keep], dtype=np.int64)
+    positions[rows] = np.arange(len(keep))
+    return l2_normalize(np.vstack([vectors[i] for i in keep])), positions, rows
+
+def append_rows(buffers, name, view, values):
+    """view (None or a prefix of the buffer kept in buffers[name]) with values appended.
+    The buffer grows by doubling and values are written past the end of view, so other
+    prefix views of it, held by older index snapshots, never change."""
+    values = np.asarray(values)
+    if view is None:
+        view = np.empty((0,) + values.shape[1:], dtype=values.dtype)
+    n, k = len(view), len(values)
+    if k == 0:
+        return view
+    entry = buffers.get(name)  # [buffer, length in use]
+    if entry is None or entry[1] != n or len(entry[0]) < n + k or view.base is not entry[0]:
+        buffer = np.empty((max(16, 2 * (n + k)),) + view.shape[1:], dtype=view.dtype)
+        buffer[:n] = view
+        entry = buffers[name] = [buffer, n]
+    entry[0][n:n + k] = values
+    entry[1] = n + k
+    return entry[0][:n + k]
+
+
+def fit_pca(matrix, dim):
+    """PCA projection (mean, components) to dim dimensions, or None when there are too few
+    samples to estimate dim components reliably"""
+    if matrix is None or dim <= 0 or dim >= matrix.shape[1] or matrix.shape[0] < 2 * dim:
+        return None
+    mean = matrix.mean(axis=0)
+    _, _, vt = np.linalg.svd(matrix - mean, full_matrices=False)
+    return mean.astype(np.float32), vt[:dim].astype(np.float32)
+
+def apply_pca(vectors, pca):
+    if pca is None:
+        return l2_normalize(vectors)
+    mean, components = pca
+    return l2_normalize((np.asarray(vectors, dtype=np.float32) - mean) @ components.T)
+
+
+# ---------------------------------------------------------------------------
+# Embedding compression: PCA + product quantization (PQ) with asymmetric distance
+# computation (ADC). The index keeps one byte per subvector instead of the full
+# float32 vector; queries stay uncompressed and are scored against the codebooks.
+# ---------------------------------------------------------------------------
+
+COMPRESSED_IMAGE_SEARCH = os.environ.get('COMPRESSED_IMAGE_SEARCH', '0') == '1'
+PQ_RERANK = int(os.environ.get('PQ_RERANK', 100))  # full-vector re-rank depth; 0 ranks on codes only
+
+def kmeans(data, k, iterations=20, seed=0):
+    """Plain Lloyd k-means; returns (k, dim) float32 centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        distances = (data ** 2).sum(axis=1)[:, None] - 2 * data @ centroids.T + (centroids ** 2).sum(axis=1)[None, :]
+        assignment = distances.argmin(axis=1)
+        for c in range(k):
+            members = data[assignment == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+            else:
+                centroids[c] = data[rng.integers(len(data))]
+    return centroids.astype(np.float32)
+
+
+class EmbeddingCodec:
+    """Optional PCA projection followed by product quantization of normalized embeddings"""
+
+    def __init__(self, input_dim, pca, codebooks):
+        self.input_dim = input_dim
+        self.pca = pca
+        self.codebooks = codebooks  # (subvectors, centroids, sub_dim)
+
+    @classmethod
+    def train(cls, matrix, pca_dim=256, subvectors=64, centroids=256, iterations=20):
+        pca = fit_pca(matrix, pca_dim)
+        projected = apply_pca(matrix, pca)
+        dim = projected.shape[1]
+        while dim % subvectors:
+            subvectors -= 1
+        sub_dim = dim // subvectors
+        k = min(centroids, 256, len(projected))
+        codebooks = np.stack([
+            kmeans(projected[:, m * sub_dim:(m + 1) * sub_dim], k, iterations, seed=m)
+            for m in range(subvectors)
+        ])
+        return cls(matrix.shape[1], pca, codebooks)
+
+    @property
+    def code_size(self):
+        return self.codebooks.shape[0]
+
+    def project(self, vectors):
+        return apply_pca(vectors, self.pca)
+
+    def encode(self, vectors):
+        """Quantize (n, input_dim) vectors to (n, subvectors) uint8 codes"""
+        projected = self.project(vectors)
+        subvectors, _, sub_dim = self.codebooks.shape
+        codes = np.empty((len(projected), subvectors), dtype=np.uint8)
+        for m in range(subvectors):
+            part = projected[:, m * sub_dim:(m + 1) * sub_dim]
+            book = self.codebooks[m]
+            distances = -2 * part @ book.T + (book ** 2).sum(axis=1)[None, :]
+            codes[:, m] = distances.argmin(axis=1)
+        return codes
+
+    def scores(self, query_vector, codes):
+        """ADC inner-product scores of an uncompressed query against codes"""
+        subvectors, _, sub_dim = self.codebooks.shape
+        query = self.project(query_vector)
+        table = np.einsum('mkd,md->mk', self.codebooks, query.reshape(subvectors, sub_dim))
+        return table[np.arange(subvectors), codes].sum(axis=1)
+
+    def nbytes(self):
+        pca_bytes = 0 if self.pca is None else self.pca[0].nbytes + self.pca[1].nbytes
+        return self.codebooks.nbytes + pca_bytes
+
+
+def evaluate_codec(codec, matrix, codes, k=10, rerank=PQ_RERANK, sample_size=200, seed=0):
+    """Recall@k of compressed search against exact cosine, with and without full-vector re-rank"""
+    rng = np.random.default_rng(seed)
+    queries = rng.choice(len(matrix), size=min(sample_size, len(matrix)), replace=False)
+    k = min(k, len(matrix))
+    recall_codes, recall_rerank = [], []
+    for q in queries:
+        exact = set(top_k_indices(matrix @ matrix[q], k).tolist())
+        approx = top_k_indices(codec.scores(matrix[q], codes), max(k, rerank))
+        recall_codes.append(len(exact & set(approx[:k].tolist())) / k)
+        reranked = approx[np.argsort(-(matrix[approx] @ matrix[q]), kind='stable')][:k]
+        recall_rerank.append(len(exact & set(reranked.tolist())) / k)
+    full_bytes = int(matrix.shape[0] * codec.input_dim * 4)
+    compressed_bytes = int(codes.nbytes + codec.nbytes())
+    return {
+        "items": int(matrix.shape[0]),
+        "input_dim": int(codec.input_dim),
+        "pca_dim": None if codec.pca is None else int(codec.pca[1].shape[0]),
+        "subvectors": int(codec.code_size),
+        "centroids": int(codec.codebooks.shape[1]),
+        "full_bytes": full_bytes,
+        "compressed_bytes": compressed_bytes,
+        "compression_ratio": round(full_bytes / max(compressed_bytes, 1), 1),
+        f"recall_at_{k}": round(float(np.mean(recall_codes)), 4),
+        f"recall_at_{k}_reranked": round(float(np.mean(recall_rerank)), 4),
+        "rerank_depth": int(rerank)
+    }
+
+
+_embedding_codecs = {}
+
+def load_embedding_codec(model=None):
+    """Trained codec for an image model, or None if none has been trained"""
+    model = model or IMAGE_MODEL
+    if model not in _embedding_codecs:
+        conn = sqlite3.connect(DB_PATH)
+        row = conn.execute("SELECT codec FROM embedding_codecs WHERE model = ?", (model,)).fetchone()
+        conn.close()
+        # Stored as plain arrays so the blob does not depend on how this module was imported
+        _embedding_codecs[model] = EmbeddingCodec(**pickle.loads(row[0])) if row else None
+    return _embedding_codecs[model]
+
+@timed_stage('db')
+def load_full_image_vectors(item_type, item_ids):
+    """Uncompressed, normalized image vectors for the given items, keyed by item_id"""
+    if not item_ids:
+        return {}
+    conn = sqlite3.connect(DB_PATH)
+    placeholders = ",".join("?" * len(item_ids))
+    rows = conn.execute(f'''
+        SELECT item_id, image_features FROM item_features
+        WHERE item_type = ? AND item_id IN ({placeholders})
+    ''', (item_type, *item_ids)).fetchall()
+    conn.close()
+    vectors = {}
+    for item_id, blob in rows:
+        kind, features = decode_image_features_blob(blob)
+        if kind == 'resnet':
+            vectors[item_id] = l2_normalize(features)
+    return vectors
+
+def train_embedding_codec(pca_dim=256, subvectors=64, centroids=256, iterations=20):
+    """Train a codec on the stored image vectors of the current image model, save it with
+    its recall/memory report, and rebuild the item indexes. Returns the report."""
+    conn = sqlite3.connect(DB_PATH)
+    rows = conn.execute("SELECT item_id, image_features, image_model FROM item_features").fetchall()
+    conn.close()
+    vectors = []
+    for _, blob, image_model in rows:
+        kind, features = decode_image_features_blob(blob)
+        if kind == 'resnet' and (image_model or LEGACY_IMAGE_MODEL) == IMAGE_MODEL:
+            vectors.append(features)
+    matrix, _, _ = stack_embeddings(list(range(len(vectors))), vectors, len(vectors))
+    if matrix is None or len(matrix) < 2:
+        raise ValueError(f"Not enough stored {IMAGE_MODEL} vectors to train a codec")
+
+    codec = EmbeddingCodec.train(matrix, pca_dim, subvectors, centroids, iterations)
+    report = evaluate_codec(codec, matrix, codec.encode(matrix))
+    report["model"] = IMAGE_MODEL
+
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute(
+        "INSERT OR REPLACE INTO embedding_codecs (model, codec, report) VALUES (?, ?, ?)",
+        (IMAGE_MODEL, pickle.dumps(vars(codec)), json.dumps(report))
+    )
+    conn.commit()
+    conn.close()
+    _embedding_codecs.pop(IMAGE_MODEL, None)
+    for item_type in ('found', 'lost'):
+        bump_item_generation(item_type)
+    logger.info(f"Trained embedding codec for {IMAGE_MODEL}: {report}")
+    return report
+
+
+def item_tokens(item):
+    """Lexical tokens an indexed item is found by"""
+    return tokenize(f"{item['name'] or ''} {item['category'] or ''} {item['description'] or ''} {item['location'] or ''}")
+
+
+class ItemIndex:
+    """In-memory snapshot of one item_type in item_features, used for candidate generation.
+    fast_embeddings optionally holds fast-tier vectors as {'image'|'text': {item_id: vector}};
+    duplicates maps a cluster representative's item_id to its duplicates' item_ids.
+    Rows are only ever appended: with_changes() retires the old row of a changed item
+    (alive is False) and appends its new one, and get_item_index rebuilds the index once
+    retired rows make up too much of it."""
+
+    def __init__(self, item_type, rows, generation=0, fast_embeddings=None, codec=None, duplicates=None):
+        self.item_type = item_type
+        self.generation = generation
+        self.items = []
+        self.orb_descriptors = {}
+        self.postings = {}
+        self._buffers = {}  # spare capacity behind the arrays, see append_rows
+        image_rows, image_vectors = [], []
+        text_rows, text_vectors = [], []
+        fingerprint_rows, fingerprints = [], []
+        lats, lngs, dates, doc_lengths = [], [], [], []
+        duplicates = duplicates or {}
+        self.duplicate_of = {dup: rep for rep, dups in duplicates.items() for dup in dups}
+
+        for row_idx, row in enumerate(rows):
+            (item_id, name, category, description, location, date, image_blob, text_blob, lat, lng,
+             image_model, text_model, fingerprint) = row
+            self.items.append({
+                "item_id": item_id,
+                "name": name,
+                "category": category,
+                "description": description,
+                "location": location,
+                "date": date,
+                "duplicate_ids": duplicates.get(item_id, [])
+            })
+            if fingerprint:
+                fingerprint_rows.append(row_idx)
+                fingerprints.append(int(fingerprint, 16))
+
+            kind, features = decode_image_features_blob(image_blob)
+            if kind == 'resnet' and (image_model or LEGACY_IMAGE_MODEL) == IMAGE_MODEL:
+                image_rows.append(row_idx)
+                image_vectors.append(features)
+            elif kind == 'orb':
+                self.orb_descriptors[row_idx] = features
+
+            text_vector = decode_embedding_blob(text_blob)
+            if text_vector is not None and (text_model or LEGACY_TEXT_MODEL) == TEXT_MODEL:
+                text_rows.append(row_idx)
+                text_vectors.append(text_vector)
+
+            lat, lng = to_float(lat), to_float(lng)
+            lats.append(np.nan if lat is None else lat)
+            lngs.append(np.nan if lng is None else lng)
+            ordinal = parse_date_ordinal(date)
+            dates.append(np.nan if ordinal is None else ordinal)
+
+            tokens = item_tokens(self.items[-1])
+            doc_lengths.append(len(tokens))
+            for token in tokens:
+                posting = self.postings.setdefault(token, {})
+                posting[row_idx] = posting.get(row_idx, 0) + 1
+
+        size = len(self.items)
+        self.image_matrix, self.image_pos, self.image_rows = stack_embeddings(image_rows, image_vectors, size)
+        # With a codec the index keeps only PQ codes; full vectors are read back for re-ranking
+        self.image_codec, self.image_codes = None, None
+        if codec is not None and self.image_matrix is not None and self.image_matrix.shape[1] == codec.input_dim:
+            self.image_codec, self.image_codes = codec, codec.encode(self.image_matrix)
+            self.image_matrix = None
+        self.text_matrix, self.text_pos, self.text_rows = stack_embeddings(text_rows, text_vectors, size)
+        self.fingerprints = np.array(fingerprints, dtype=np.uint64)
+        self.fingerprint_rows = np.array(fingerprint_rows, dtype=np.int64)
+        self.lats = np.array(lats, dtype=np.float64)
+        self.lngs = np.array(lngs, dtype=np.float64)
+        self.date_ordinals = np.array(dates, dtype=np.float64)
+        self.doc_lengths = np.array(doc_lengths, dtype=np.float64)
+        self.doc_length_total = float(self.doc_lengths.sum())
+        self.alive = np.ones(size, dtype=bool)
+        self.live_count = size
+
+        # Fast tier: {kind: (normalized matrix, matrix row -> item row, pca)}, PCA-projected
+        # to FAST_PCA_DIM when there are enough vectors to fit it
+        self.fast = {}
+        self.row_by_item_id = row_by_item_id = {item["item_id"]: row_idx for row_idx, item in enumerate(self.items)}
+        for kind, vectors_by_id in (fast_embeddings or {}).items():
+            pairs = [(row_by_item_id[i], v) for i, v in vectors_by_id.items() if i in row_by_item_id]
+            if not pairs:
+                continue
+            matrix, _, rows = stack_embeddings([r for r, _ in pairs], [v for _, v in pairs], size)
+            pca = fit_pca(matrix, FAST_PCA_DIM)
+            if pca is not None:
+                matrix = apply_pca(matrix, pca)
+            self.fast[kind] = (matrix, rows, pca)
+
+    def __len__(self):
+        return self.live_count
+
+    @property
+    def avg_doc_length(self):
+        return self.doc_length_total / self.live_count if self.live_count and self.doc_length_total > 0 else 1.0
+
+    def live_rows(self):
+        return np.flatnonzero(self.alive)
+
+    def with_changes(self, generation, removed_ids, delta, fast_embeddings=None, duplicates=None):
+        """Copy of this index at `generation`: the rows of removed_ids and of the items in delta
+        (an ItemIndex of the changed representatives) are retired, delta's rows are appended,
+        and duplicates ({representative: duplicate ids}) replaces those clusters' lists.
+        Arrays are extended past the end of what this index sees and containers are copied
+        before they change, so requests still reading this index are unaffected."""
+        index = copy.copy(self)
+        index.generation = generation
+        index._buffers = dict(self._buffers)
+        index.items = list(self.items)
+        index.row_by_item_id = dict(self.row_by_item_id)
+        index.orb_descriptors = dict(self.orb_descriptors)
+        index.postings = dict(self.postings)
+        index.duplicate_of = dict(self.duplicate_of)
+        index.fast = dict(self.fast)
+        offset = len(self.items)
+        index.alive = np.concatenate([self.alive, np.ones(len(delta.items), dtype=bool)])
+
+        def set_posting(token, row, count):
+            posting = dict(index.postings.get(token, {}))
+            if count:
+                posting[row] = count
+            else:
+                posting.pop(row, None)
+            if posting:
+                index.postings[token] = posting
+            else:
+                index.postings.pop(token, None)
+
+        for item_id in set(removed_ids) | {item["item_id"] for item in delta.items}:
+            index.duplicate_of.pop(item_id, None)
+            row = index.row_by_item_id.pop(item_id, None)
+            if row is None:
+                continue
+            index.alive[row] = False
+            index.live_count -= 1
+            index.doc_length_total -= self.doc_lengths[row]
+            index.orb_descriptors.pop(row, None)
+            for token in set(item_tokens(self.items[row])):
+                set_posting(token, row, 0)
+
+        for row_idx, item in enumerate(delta.items):
+            row = offset + row_idx
+            index.items.append(item)
+            index.row_by_item_id[item["item_id"]] = row
+            index.live_count += 1
+            index.doc_length_total += delta.doc_lengths[row_idx]
+        for row_idx, features in delta.orb_descriptors.items():
+            index.orb_descriptors[offset + row_idx] = features
+        for token, posting in delta.postings.items():
+            for row_idx, count in posting.items():
+                set_posting(token, offset + row_idx, count)
+
+        extend = lambda name, values: setattr(index, name, append_rows(index._buffers, name, getattr(index, name), values))
+        for name in ('lats', 'lngs', 'date_ordinals', 'doc_lengths'):
+            extend(name, getattr(delta, name))
+        extend('fingerprints', delta.fingerprints)
+        extend('fingerprint_rows', delta.fingerprint_rows + offset)
+
+        # Embeddings: vectors of another dimension than the index's are left out, as in stack_embeddings
+        for kind in ('image', 'text'):
+            matrix = getattr(delta, f"{kind}_matrix")
+            delta_pos = getattr(delta, f"{kind}_pos")
+            if kind == 'image' and self.image_codes is not None:
+                width = self.image_codec.input_dim
+            else:
+                current = getattr(self, f"{kind}_matrix")
+                width = current.shape[1] if current is not None else None
+            if matrix is None or (width is not None and matrix.shape[1] != width):
+                extend(f"{kind}_pos", np.full(len(delta.items), -1, dtype=np.int64))
+                continue
+            start = len(getattr(self, f"{kind}_rows"))
+            extend(f"{kind}_pos", np.where(delta_pos >= 0, delta_pos + start, -1))
+            extend(f"{kind}_rows", getattr(delta, f"{kind}_rows") + offset)
+            if kind == 'image' and self.image_codes is not None:
+                extend('image_codes', self.image_codec.encode(matrix))
+            else:
+                extend(f"{kind}_matrix", matrix)
+
+        # Fast tier: new vectors are projected with the PCA fitted when the index was built
+        for kind, vectors_by_id in (fast_embeddings or {}).items():
+            matrix, rows, pca = self.fast.get(kind, (None, None, None))
+            width = pca[0].shape[0] if pca is not None else (matrix.shape[1] if matrix is not None else None)
+            pairs = [(offset + i, vectors_by_id[item["item_id"]]) for i, item in enumerate(delta.items)
+                     if vectors_by_id.get(item["item_id"]) is not None]
+            pairs = [(row, vector) for row, vector in pairs if width is None or vector.shape[0] == width]
+            if not pairs:
+                continue
+            new_matrix, _, new_rows = stack_embeddings([r for r, _ in pairs], [v for _, v in pairs], len(index.items))
+            index.fast[kind] = (append_rows(index._buffers, f"fast_{kind}", matrix, apply_pca(new_matrix, pca)),
+                                append_rows(index._buffers, f"fast_{kind}_rows", rows, new_rows), pca)
+
+        for representative, duplicate_ids in (duplicates or {}).items():
+            for duplicate_id in duplicate_ids:
+                index.duplicate_of[duplicate_id] = representative
+            row = index.row_by_item_id.get(representative)
+            if row is not None:
+                index.items[row] = dict(index.items[row], duplicate_ids=duplicate_ids)
+        return index
+
+    def fast_candidates(self, kind, query_vector, limit):
+        matrix, rows, pca = self.fast[kind]
+        return self._embedding_candidates(matrix, rows, apply_pca(query_vector, pca), limit)
+
+    def _embedding_candidates(self, matrix, rows, query_vector, limit):
+        if matrix is None or query_vector is None or query_vector.shape[0] != matrix.shape[1]:
+            return []
+        sims = matrix @ query_vector
+        if self.live_count < len(self.items):
+            sims = np.where(self.alive[rows], sims, -np.inf)
+        return [int(rows[i]) for i in top_k_indices(sims, limit) if sims[i] > 0]
+
+    def image_candidates(self, query, limit):
+        """Image ANN: exact cosine over the normalized image matrix. Uses the fast tier when
+        both the query and the index have it, else the heavy tier, else ORB."""
+        if query.get('fast_image_vector') is not None and 'image' in self.fast:
+            return self.fast_candidates('image', query['fast_image_vector'], limit)
+        if query.get('image_vector') is not None:
+            if self.image_codes is not None:
+                return self.compressed_image_candidates(query['image_vector'], limit)
+            return self._embedding_candidates(self.image_matrix, self.image_rows, query['image_vector'], limit)
+        if query.get('image_descriptors') is not None and self.orb_descriptors:
+            rows = list(self.orb_descriptors)
+            sims = np.array([calculate_image_similarity(query['image_descriptors'], self.orb_descriptors[r]) for r in rows])
+            return [rows[i] for i in top_k_indices(sims, limit) if sims[i] > 0]
+        return []
+
+    def compressed_image_candidates(self, query_vector, limit):
+        """ADC over the PQ codes, then exact cosine re-rank of the top PQ_RERANK hits"""
+        if query_vector.shape[0] != self.image_codec.input_dim:
+            return []
+        scores = self.image_codec.scores(query_vector, self.image_codes)
+        if self.live_count < len(self.items):
+            scores = np.where(self.alive[self.image_rows], scores, -np.inf)
+        top = top_k_indices(scores, max(limit, PQ_RERANK))
+        top = top[np.isfinite(scores[top])]
+        if PQ_RERANK:
+            item_ids = [self.items[self.image_rows[i]]["item_id"] for i in top]
+            full = load_full_image_vectors(self.item_type, item_ids)
+            exact = np.array([float(full[i] @ query_vector) if i in full else -1.0 for i in item_ids])
+            top, scores = top[np.argsort(-exact, kind='stable')], dict(zip(top.tolist(), exact))
+        return [int(self.image_rows[i]) for i in top[:limit] if scores[i] > 0]
+
+    def image_similarities(self, rows, query_vector):
+        """Cosine of query_vector with each item row's image vector (ADC estimate when
+        compressed, 0 for rows without one)"""
+        sims = np.zeros(len(rows), dtype=np.float64)
+        pos = self.image_pos[rows]
+        has_image = pos >= 0
+        if not has_image.any():
+            return sims
+        if self.image_matrix is not None and query_vector.shape[0] == self.image_matrix.shape[1]:
+            sims[has_image] = self.image_matrix[pos[has_image]] @ query_vector
+        elif self.image_codes is not None and query_vector.shape[0] == self.image_codec.input_dim:
+            sims[has_image] = self.image_codec.scores(query_vector, self.image_codes[pos[has_image]])
+        return sims
+
+    def fingerprint_candidates(self, fingerprint, max_distance):
+        """Rows whose image dHash is within max_distance bits of fingerprint, as {row: distance}"""
+        if not fingerprint or not len(self.fingerprints):
+            return {}
+        xor = self.fingerprints ^ np.uint64(int(fingerprint, 16))
+        distances = np.unpackbits(xor.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+        close = np.flatnonzero(distances <= max_distance)
+        close = close[self.alive[self.fingerprint_rows[close]]]
+        return {int(self.fingerprint_rows[i]): int(distances[i]) for i in close}
+
+    def text_candidates(self, query, limit):
+        """Text ANN: exact cosine over the normalized text embedding matrix (fast tier if available)"""
+        if query.get('fast_text_embedding') is not None and 'text' in self.fast:
+            return self.fast_candidates('text', query['fast_text_embedding'], limit)
+        return self._embedding_candidates(self.text_matrix, self.text_rows, query.get('text_embedding'), limit)
+
+    def lexical_candidates(self, query, limit, k1=1.2, b=0.75):
+        """Lexical: BM25 over name, category, description and location tokens"""
+        terms = set(tokenize(query.get('lexical_text')))
+        if not terms or not self.live_count:
+            return []
+        n = self.live_count
+        scores = np.zeros(len(self.items), dtype=np.float64)
+        for term in terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            rows = np.fromiter(posting.keys(), dtype=np.int64, count=len(posting))
+            tf = np.fromiter(posting.values(), dtype=np.float64, count=len(posting))
+            norm = k1 * (1 - b + b * self.doc_lengths[rows] / self.avg_doc_length)
+            scores[rows] += idf * tf * (k1 + 1) / (tf + norm)
+        return [int(i) for i in top_k_indices(scores, limit) if scores[i] > 0]
+
+    def geo_candidates(self, query, limit):
+        """Geo: items with coordinates within GEO_RADIUS_KM, nearest first"""
+        if query.get('lat') is None or query.get('lng') is None or not self.items:
+            return []
+        distances = haversine_km(query['lat'], query['lng'], self.lats, self.lngs)
+        distances = np.where(np.isnan(distances) | ~self.alive, np.inf, distances)
+        ranked = top_k_indices(-distances, limit)
+        return [int(i) for i in ranked if distances[i] <= GEO_RADIUS_KM]
+
+
+ITEM_CHANGE_LOG_SIZE = 1000       # Generations of item_changes kept for catching up
+ITEM_INDEX_MAX_CHANGES = 200      # More changed items than this since an index was built: rebuild it
+ITEM_INDEX_MAX_RETIRED = 0.25     # Rebuild once retired rows exceed this fraction of an index
+
+_item_index_lock = threading.Lock()
+_item_indexes = {}
+_item_index_build_locks = {}
+
+INDEX_COLUMNS = """item_id, item_name, category, description, location, date, image_features, text_embedding,
+                   lat, lng, image_model, text_model, fingerprint"""
+
+def bump_item_generation(item_type, item_ids=None):
+    """Record a write to item_features of item_ids (None: anything, e.g. a new codec) so that
+    indexes in this and every other process using the database catch up"""
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("INSERT OR IGNORE INTO item_generations (item_type, generation) VALUES (?, 0)", (item_type,))
+    conn.execute("UPDATE item_generations SET generation = generation + 1 WHERE item_type = ?", (item_type,))
+    generation = conn.execute("SELECT generation FROM item_generations WHERE item_type = ?", (item_type,)).fetchone()[0]
+    conn.executemany("INSERT INTO item_changes (item_type, generation, item_id) VALUES (?, ?, ?)",
+                     [(item_type, generation, item_id) for item_id in (item_ids or [None])])
+    conn.execute("DELETE FROM item_changes WHERE item_type = ? AND generation <= ?",
+                 (item_type, generation - ITEM_CHANGE_LOG_SIZE))
+    conn.commit()
+    conn.close()
+
+def current_generation(item_type):
+    conn = sqlite3.connect(DB_PATH)
+    row = conn.execute("SELECT generation FROM item_generations WHERE item_type = ?", (item_type,)).fetchone()
+    conn.close()
+    return row[0] if row else 0
+
+def load_fast_embeddings(cursor, item_type, item_ids=None):
+    """Fast-tier vectors of item_type as {'image'|'text': {item_id: vector}}, optionally only item_ids"""
+    fast_embeddings = {}
+    for kind, model_name in (('image', FAST_IMAGE_MODEL), ('text', FAST_TEXT_MODEL)):
+        if model_name:
+            query = "SELECT item_id, embedding FROM item_embeddings WHERE item_type = ? AND kind = ? AND model = ?"
+            params = [item_type, kind, model_name]
+            if item_ids is not None:
+                query += f" AND item_id IN ({','.join('?' * len(item_ids))})"
+                params += list(item_ids)
+            cursor.execute(query, params)
+            fast_embeddings[kind] = {item_id: decode_embedding_blob(blob) for item_id, blob in cursor.fetchall()}
+    return fast_embeddings
+
+def build_item_index(item_type):
+    """Read every cluster representative of item_type into a new ItemIndex"""
+    generation = current_generation(item_type)
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT {INDEX_COLUMNS}
+        FROM item_features
+        WHERE item_type = ? AND (cluster_id IS NULL OR cluster_id = item_id)
+        ORDER BY created_at DESC
+    ''', (item_type,))
+    rows = cursor.fetchall()
+    # Near-duplicates are left out of the index and reported on their cluster's representative
+    duplicates = {}
+    cursor.execute('''
+        SELECT cluster_id, item_id FROM item_features
+        WHERE item_type = ? AND cluster_id IS NOT NULL AND cluster_id != item_id
+        ORDER BY created_at, item_id
+    ''', (item_type,))
+    for cluster_id, item_id in cursor.fetchall():
+        duplicates.setdefault(cluster_id, []).append(item_id)
+    fast_embeddings = load_fast_embeddings(cursor, item_type)
+    conn.close()
+
+    codec = load_embedding_codec() if COMPRESSED_IMAGE_SEARCH else None
+    index = ItemIndex(item_type, rows, generation, fast_embeddings, codec, duplicates)
+    logger.info(f"Built {item_type} item index with {len(index)} items")
+    return index
+
+def update_item_index(index):
+    """index caught up with the item_changes since its generation by re-reading only the
+    changed items, or None when a full rebuild is due (a change without item ids, more than
+    ITEM_INDEX_MAX_CHANGES items, a log pruned past the index, or too many retired rows)"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    changes = cursor.execute(
+        "SELECT generation, item_id FROM item_changes WHERE item_type = ? AND generation > ? ORDER BY generation",
+        (index.item_type, index.generation)).fetchall()
+    changed_ids = {item_id for _, item_id in changes}
+    retired = len(index.items) - len(index) + len(changed_ids)
+    if not changes or changes[0][0] != index.generation + 1 or None in changed_ids \
+            or len(changed_ids) > ITEM_INDEX_MAX_CHANGES or retired > ITEM_INDEX_MAX_RETIRED * max(len(index.items), 1):
+        conn.close()
+        return None
+    generation = changes[-1][0]
+    placeholders = ','.join('?' * len(changed_ids))
+    cursor.execute(f'''
+        SELECT {INDEX_COLUMNS}, cluster_id
+        FROM item_features
+        WHERE item_type = ? AND item_id IN ({placeholders})
+        ORDER BY created_at DESC
+    ''', (index.item_type, *changed_ids))
+    rows = cursor.fetchall()
+    representatives = [row[:-1] for row in rows if row[-1] is None or row[-1] == row[0]]
+    # Clusters a changed item joined, left or represents get their duplicate lists re-read
+    clusters = {row[-1] if row[-1] is not None else row[0] for row in rows} | changed_ids
+    clusters |= {index.duplicate_of[item_id] for item_id in changed_ids if item_id in index.duplicate_of}
+    duplicates = {cluster_id: [] for cluster_id in clusters}
+    cursor.execute(f'''
+        SELECT cluster_id, item_id FROM item_features
+        WHERE item_type = ? AND cluster_id IN ({','.join('?' * len(clusters))}) AND cluster_id != item_id
+        ORDER BY created_at, item_id
+    ''', (index.item_type, *clusters))
+    for cluster_id, item_id in cursor.fetchall():
+        duplicates[cluster_id].append(item_id)
+    fast_embeddings = load_fast_embeddings(cursor, index.item_type, [row[0] for row in representatives])
+    conn.close()
+
+    delta = ItemIndex(index.item_type, representatives, duplicates=duplicates)
+    return index.with_changes(generation, changed_ids, delta, fast_embeddings, duplicates)
+
+@timed_stage('index')
+def get_item_index(item_type):
+    """Return the in-memory index for item_type, catching up with writes since it was built.
+    One thread per item_type builds or updates it; the others wait for the result."""
+    generation = current_generation(item_type)
+    with _item_index_lock:
+        index = _item_indexes.get(item_type)
+        build_lock = _item_index_build_locks.setdefault(item_type, threading.Lock())
+    if index is not None and index.generation >= generation:
+        return index
+
+    with build_lock:
+        with _item_index_lock:
+            index = _item_indexes.get(item_type)
+        if index is not None and index.generation >= generation:
+            return index
+        updated = update_item_index(index) if index is not None else None
+        index = updated or build_item_index(item_type)
+        with _item_index_lock:
+            _item_indexes[item_type] = index
+    return index
+
+
+result_cache = TTLCache(maxsize=int(os.environ.get('RESULT_CACHE_SIZE', 512)),
+                        ttl=float(os.environ.get('RESULT_CACHE_TTL_S', 300)))
+# Identical searches arriving while one is being scored wait for it instead of scoring again
+query_flight = SingleFlight()
+
+def query_fingerprint(endpoint, search_type, fields, image_bytes=None):
+    """Cache key for a search: endpoint, normalized query fields, image content hash, and the
+    generation of the searched item_type, so any /store-item write to it makes old keys unreachable"""
+    normalized = {
+        key: ' '.join(str(value).lower().split()) if isinstance(value, str) else value
+        for key, value in fields.items()
+    }
+    key_material = json.dumps({
+        "endpoint": endpoint,
+        "search_type": search_type,
+        "generation": current_generation(search_type),
+        "fields": normalized,
+        "image": image_content_hash(image_bytes) if image_bytes else None
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(key_material.encode()).hexdigest()
+
+# Cursor pagination: a paged search ranks up to RANKING_DEPTH results once and keeps the
+# full response under its query fingerprint; later pages are slices of that ranking, so
+# they stay stable and cost no similarity work until the ranking expires.
+RANKING_DEPTH = int(os.environ.get('RANKING_DEPTH', SHORTLIST_SIZE))
+ranking_cache = TTLCache(maxsize=int(os.environ.get('RANKING_CACHE_SIZE', 256)),
+                         ttl=float(os.environ.get('RANKING_CACHE_TTL_S', 600)))
+
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 100))
+
+def int_param(value, default, minimum=None):
+    """An integer request parameter (default when missing), or None when the client sent
+    something that is not an integer of at least minimum"""
+    if value is None or value == '':
+        return default
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return None
+    return number if minimum is None or number >= minimum else None
+
+def param_error(name, requirement="an integer"):
+    return jsonify({"ok": False, "error": f"{name} must be {requirement}"}), 400
+
+def valid_page_size(page_size):
+    return 1 <= page_size <= MAX_PAGE_SIZE
+
+def page_size_error():
+    return jsonify({"ok": False, "error": f"page_size must be between 1 and {MAX_PAGE_SIZE}"}), 400
+
+def encode_cursor(ranking_id, offset, page_size):
+    raw = f"{ranking_id}:{offset}:{page_size}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """(ranking_id, offset, page_size) from an opaque cursor, None if it is malformed or
+    out of range (cursors come from clients)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        ranking_id, offset, page_size = raw.rsplit(':', 2)
+        offset, page_size = int(offset), int(page_size)
+    except Exception:
+        return None
+    if offset < 0 or not valid_page_size(page_size):
+        return None
+    return ranking_id, offset, page_size
+
+def paginated_response(response, ranking_id, offset, page_size):
+    """Copy of a full ranked response holding one page of its results plus the next cursor"""
+    results = response["results"]
+    page = results[offset:offset + page_size]
+    next_offset = offset + len(page)
+    paged = dict(response)
+    paged["results"] = page
+    paged["page"] = {
+        "offset": offset,
+        "page_size": page_size,
+        "total_ranked": len(results),
+        "next_cursor": encode_cursor(ranking_id, next_offset, page_size) if next_offset < len(results) else None
+    }
+    return paged
+
+def first_page(response, ranking_id, page_size):
+    ranking_cache.set(ranking_id, response)
+    return paginated_response(response, ranking_id, 0, page_size)
+
+def cursor_page(cursor, page_size=None):
+    """Serve a later page from a cached ranking; 410 once the ranking has expired"""
+    decoded = decode_cursor(cursor)
+    if decoded is None:
+        return jsonify({"ok": False, "error": "Invalid cursor"}), 400
+    ranking_id, offset, cursor_page_size = decoded
+    page_size = int_param(page_size or None, cursor_page_size)
+    if page_size is None or not valid_page_size(page_size):
+        return page_size_error()
+    response = ranking_cache.get(ranking_id)
+    if response is None:
+        return jsonify({"ok": False, "error": "Cursor expired, run the search again"}), 410
+    return jsonify(paginated_response(response, ranking_id, offset, page_size))
+
+def build_retrieval_query(item_name='', category='', description='', location='', date='',
+                          lat=None, lng=None, image_data=None):
+    """Encode the query once for every index: text embedding, image features, coordinates"""
+    text = f"{item_name or ''} {description or ''}".strip()
+    query = {
+        "text": text,
+        "lexical_text": f"{item_name or ''} {category or ''} {description or ''} {location or ''}",
+        "category": category or '',
+        "location": location or '',
+        "date_ordinal": parse_date_ordinal(date),
+        "lat": to_float(lat),
+        "lng": to_float(lng),
+        "text_embedding": None,
+        "fast_text_embedding": None,
+        "image_vector": None,
+        "fast_image_vector": None,
+        "image_descriptors": None
+    }
+    if text:
+        embedding = encode_text_to_embedding(text)
+        if embedding is not None:
+            query["text_embedding"] = l2_normalize(embedding)
+        if fast_text_model is not None:
+            query["fast_text_embedding"] = encode_text_to_embedding(text, tier='fast')
+    if image_data:
+        image_features = get_image_features(image_data, need=search_feature_kinds())
+        query["fast_image_vector"] = image_features.get("fast")
+        if image_features["resnet"] is not None:
+            query["image_vector"] = l2_normalize(image_features["resnet"])
+        else:
+            query["image_descriptors"] = get_image_features(image_data, need=('orb',))["orb"]
+    return query
+
+def generate_candidates(index, query, limit=CANDIDATES_PER_INDEX):
+    """Run every candidate generator in parallel and return {index_name: ranked rows}"""
+    generators = {
+        "image": index.image_candidates,
+        "text": index.text_candidates,
+        "lexical": index.lexical_candidates,
+        "geo": index.geo_candidates
+    }
+    futures = {name: retrieval_executor.submit(fn, query, limit) for name, fn in generators.items()}
+    ranked_lists = {}
+    for name, future in futures.items():
+        try:
+            ranked_lists[name] = future.result()
+        except Exception as e:
+            logger.error(f"Candidate generator {name} failed: {e}")
+            ranked_lists[name] = []
+    return ranked_lists
+
+def reciprocal_rank_fusion(ranked_lists, k=RRF_K):
+    """Merge ranked candidate lists: score(d) = sum over lists of 1 / (k + rank(d))"""
+    fused = {}
+    sources = {}
+    for name, rows in ranked_lists.items():
+        for rank, row in enumerate(rows, start=1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+            sources.setdefault(row, []).append(name)
+    ordered = sorted(fused, key=lambda r: fused[r], reverse=True)
+    return ordered, fused, sources
+
+def cheap_feature_names(query):
+    """Features that are vectorized lookups for this query (no per-candidate Python work)"""
+    names = {'location_proximity', 'time_similarity'}
+    if query["image_vector"] is not None:
+        names.add('image_similarity')
+    return names
+
+@timed_stage('scoring')
+def compute_candidate_features(index, query, rows, names=None):
+    """compute_feature_set features for query vs. each shortlisted row, as arrays.
+    names restricts which features are computed (others stay 0).
+    Returns (features, available) where available names the features the query supports."""
+    rows = np.asarray(rows, dtype=np.int64)
+    n = len(rows)
+    features = {name: np.zeros(n, dtype=np.float64) for name in MATCH_WEIGHTS}
+    available = set()
+    items = [index.items[r] for r in rows]
+    wanted = lambda name: (names is None or name in names) and n > 0
+
+    if query["text"]:
+        available.add('text_similarity')
+    if query["text"] and wanted('text_similarity'):
+        sims = np.zeros(n, dtype=np.float64)
+        has_embedding = np.zeros(n, dtype=bool)
+        if query["text_embedding"] is not None and index.text_matrix is not None \
+                and query["text_embedding"].shape[0] == index.text_matrix.shape[1]:
+            pos = index.text_pos[rows]
+            has_embedding = pos >= 0
+            if has_embedding.any():
+                sims[has_embedding] = index.text_matrix[pos[has_embedding]] @ query["text_embedding"]
+        for i in np.flatnonzero(~has_embedding):
+            stored_text = f"{items[i]['name'] or ''} {items[i]['description'] or ''}".strip()
+            sims[i] = calculate_text_similarity(query["text"], stored_text)
+        features['text_similarity'] = sims
+
+    if query["category"]:
+        available.add('category_similarity')
+    if query["category"] and wanted('category_similarity'):
+        features['category_similarity'] = np.array(
+            [calculate_text_similarity(query["category"], item['category'] or '') for item in items], dtype=np.float64)
+
+    if query["location"]:
+        available.add('location_similarity')
+    if query["location"] and wanted('location_similarity'):
+        features['location_similarity'] = np.array(
+            [calculate_text_similarity(query["location"], item['location'] or '') for item in items], dtype=np.float64)
+
+    if query["lat"] is not None and query["lng"] is not None:
+        available.add('location_proximity')
+    if query["lat"] is not None and query["lng"] is not None and wanted('location_proximity'):
+        distances = haversine_km(query["lat"], query["lng"], index.lats[rows], index.lngs[rows])
+        features['location_proximity'] = np.nan_to_num(1.0 - np.minimum(distances / 5.0, 1.0), nan=0.0)
+
+    if query["date_ordinal"] is not None:
+        available.add('time_similarity')
+    if query["date_ordinal"] is not None and wanted('time_similarity'):
+        days_diff = np.abs(index.date_ordinals[rows] - query["date_ordinal"])
+        features['time_similarity'] = np.nan_to_num(1.0 - days_diff / 30.0, nan=0.0)
+
+    if query["image_vector"] is not None or query["image_descriptors"] is not None:
+        available.add('image_similarity')
+    if query["image_vector"] is not None and wanted('image_similarity'):
+        features['image_similarity'] = index.image_similarities(rows, query["image_vector"])
+    elif query["image_descriptors"] is not None and wanted('image_similarity'):
+        features['image_similarity'] = np.array([
+            calculate_image_similarity(query["image_descriptors"], index.orb_descriptors[r])
+            if r in index.orb_descriptors else 0.0
+            for r in rows.tolist()
+        ], dtype=np.float64)
+
+    for name in features:
+        features[name] = np.clip(features[name], 0.0, 1.0)
+    return features, available
+
+def weighted_feature_score(features, names, n):
+    """MATCH_WEIGHTS-weighted score (0-100) renormalized over the given feature names"""
+    weights = {name: MATCH_WEIGHTS[name] for name in names}
+    total = sum(weights.values())
+    if total <= 0:
+        return np.zeros(n, dtype=np.float64)
+    return sum(features[name] * w for name, w in weights.items()) / total * 100.0
+
+class StageTwoBudget:
+    """Adapts the cascade's stage-two size K to a latency budget.
+    Keeps an exponential moving average of the stage-two cost per candidate."""
+
+    def __init__(self, initial_cost_s=0.002, alpha=0.2):
+        self.cost_per_candidate_s = initial_cost_s
+        self.alpha = alpha
+        self.lock = threading.Lock()
+
+    def choose_k(self, remaining_s):
+        with self.lock:
+            cost = self.cost_per_candidate_s
+        k = int(remaining_s / cost) if cost > 0 else STAGE_TWO_MAX_K
+        return max(STAGE_TWO_MIN_K, min(STAGE_TWO_MAX_K, k))
+
+    def observe(self, elapsed_s, k):
+        if k <= 0:
+            return
+        with self.lock:
+            self.cost_per_candidate_s += self.alpha * (elapsed_s / k - self.cost_per_candidate_s)
+
+stage_two_budget = StageTwoBudget()
+
+def fill_missing_text_embeddings(index, query, rows, features):
+    """Stage two: batch-encode stored texts that have no embedding yet, so every shortlisted
+    candidate gets the BERT text similarity compute_feature_set would give it"""
+    if query["text_embedding"] is None or not query["text"]:
+        return
+    missing = [i for i, r in enumerate(rows) if index.text_pos[r] < 0]
+    if not missing:
+        return
+    texts = [f"{index.items[rows[i]]['name'] or ''} {index.items[rows[i]]['description'] or ''}".strip() for i in missing]
+    for i, embedding in zip(missing, encode_texts_to_embeddings(texts)):
+        if embedding is not None and embedding.shape[0] == query["text_embedding"].shape[0]:
+            features['text_similarity'][i] = float(np.clip(l2_normalize(embedding) @ query["text_embedding"], 0.0, 1.0))
+
+@timed_stage('fraud_model')
+def predict_fraud_probabilities(features):
+    """Batched fraud_model inference over feature arrays; None if the model is unavailable"""
+    if fraud_model is None:
+        return None
+    try:
+        matrix = fraud_feature_matrix(features)
+        MODEL_BATCH_SIZE.observe(matrix.shape[0], 'fraud_model')
+        return inference_executor('fraud_model').run(fraud_model.predict_proba, matrix)[:, 1]
+    except InferenceOverloaded:
+        raise
+    except Exception as e:
+        logger.error(f"Fraud model batch inference error: {e}")
+        return None
+
+def iter_ranked_results(index, query, shortlist, fused, sources, limit=10, min_score=MIN_MATCH_SCORE,
+                        cascade=False, stats=None):
+    """Bounded re-rank of a shortlist, yielding result dicts best-first as they are confirmed.
+    Cheap vectorized features are computed for the whole shortlist; treating every other
+    feature as a perfect 1.0 gives each candidate an upper bound on its score. Candidates are
+    then fully scored in RERANK_CHUNK_SIZE chunks in bound order through a top-`limit` heap of
+    (score, position) tuples. A heap entry is yielded once it beats the bound of every unscored
+    candidate, and the scan stops when no unscored candidate can enter the results. Results
+    and order equal a full sort of the shortlist by score."""
+    stats = stats if stats is not None else {}
+    if limit <= 0:
+        return
+    rows = np.asarray(shortlist, dtype=np.int64)
+    n = len(rows)
+    cheap = cheap_feature_names(query)
+    features, available = compute_candidate_features(index, query, rows, names=cheap)
+    bounds = dict(features)
+    for name in available - cheap:
+        bounds[name] = np.ones(n, dtype=np.float64)
+    upper = weighted_feature_score(bounds, available, n)
+    order = np.argsort(-upper, kind='stable')
+    scores = np.zeros(n, dtype=np.float64)
+    metadata_scores = np.zeros(n, dtype=np.float64)
+    fraud_probabilities = np.full(n, np.nan)
+
+    heap = []  # (score, -position): the weakest kept entry sits at heap[0]
+    emitted = 0
+    scored = 0
+    for start in range(0, n, RERANK_CHUNK_SIZE):
+        bound_here = upper[order[start]]
+        if bound_here < min_score or (len(heap) >= limit and heap[0][0] > bound_here):
+            break
+        chunk = order[start:start + RERANK_CHUNK_SIZE]
+        chunk_started = time.perf_counter()
+        chunk_features, _ = compute_candidate_features(index, query, rows[chunk], names=available - cheap)
+        for name in available - cheap:
+            features[name][chunk] = chunk_features[name]
+        if cascade:
+            chunk_view = {name: features[name][chunk] for name in MATCH_WEIGHTS}
+            fill_missing_text_embeddings(index, query, rows[chunk], chunk_view)
+            features['text_similarity'][chunk] = chunk_view['text_similarity']
+            probabilities = predict_fraud_probabilities(chunk_view)
+            if probabilities is not None:
+                fraud_probabilities[chunk] = probabilities
+        chunk_view = {name: features[name][chunk] for name in MATCH_WEIGHTS}
+        scores[chunk] = weighted_feature_score(chunk_view, available, len(chunk))
+        metadata_scores[chunk] = weighted_feature_score(chunk_view, available - {'image_similarity'}, len(chunk))
+        if cascade:
+            stage_two_budget.observe(time.perf_counter() - chunk_started, len(chunk))
+        scored += len(chunk)
+
+        for i in chunk.tolist():
+            if scores[i] < min_score:
+                continue
+            entry = (scores[i], -i)
+            if len(heap) < limit:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+
+        remaining_bound = upper[order[start + RERANK_CHUNK_SIZE]] if start + RERANK_CHUNK_SIZE < n else -np.inf
+        confirmed = sorted(heap, reverse=True)[emitted:]
+        for score, neg_position in confirmed:
+            if score <= remaining_bound:
+                break
+            i = -neg_position
+            row = int(rows[i])
+            result = dict(index.items[row])
+            result.update({
+                "match_score": round(float(score), 1),
+                "metadata_similarity": round(float(metadata_scores[i]), 1),
+                "fusion_score": round(fused[row], 6),
+                "retrieved_by": sources[row]
+            })
+            for name in MATCH_WEIGHTS:
+                result[name] = round(float(features[name][i]) * 100, 1)
+            if not np.isnan(fraud_probabilities[i]):
+                result["fraud_probability"] = round(float(fraud_probabilities[i]) * 100, 1)
+            emitted += 1
+            stats["scored"] = scored
+            yield result
+        if emitted >= limit:
+            break
+    stats["scored"] = scored
+
+def hybrid_search_stream(query, search_type, limit=10, min_score=MIN_MATCH_SCORE, latency_budget_ms=None,
+                         stats=None):
+    """Candidate generation -> reciprocal-rank fusion -> bounded re-rank, as a generator of
+    results in final order (see iter_ranked_results).
+    Without a latency budget the re-rank sees a SHORTLIST_SIZE shortlist. With one, the
+    search runs as a cascade: the fused rank is the cheap stage-one score over all candidates,
+    and stage two (full features, batched BERT for missing text embeddings, batched fraud_model)
+    runs on the top K, with K sized from the remaining budget. Candidate lists and the
+    shortlist grow to `limit` when it is larger, so up to `limit` results can be returned."""
+    started = time.perf_counter()
+    stats = stats if stats is not None else {}
+    stats.update({"candidates": 0, "stage_two_k": 0, "scored": 0})
+    index = get_item_index(search_type)
+    if not len(index):
+        return
+
+    ranked_lists = generate_candidates(index, query, max(CANDIDATES_PER_INDEX, limit))
+    ordered, fused, sources = reciprocal_rank_fusion(ranked_lists)
+    stats["candidates"] = len(ordered)
+    if latency_budget_ms is None:
+        k = SHORTLIST_SIZE
     else:
-        risk_level = "Critical"
-    
-    return {
-        'fraud_score': fraud_score,
-        'risk_level': risk_level,
-        'indicators': fraud_indicators,
-        'confidence': max(0, 100 - fraud_score)
-    }
+        remaining_s = latency_budget_ms / 1000.0 - (time.perf_counter() - started)
+        k = stage_two_budget.choose_k(remaining_s)
+    shortlist = ordered[:max(k, limit)]
+    stats["stage_two_k"] = len(shortlist)
+    if shortlist:
+        yield from iter_ranked_results(index, query, shortlist, fused, sources, limit, min_score,
+                                       cascade=latency_budget_ms is not None, stats=stats)
+    stats["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
 
-def calculate_match_confidence(lost_item, found_item, image_similarity=0):
-    """Calculate overall match confidence between lost and found items"""
-    # Text similarity scores
-    name_sim = calculate_text_similarity(lost_item.get('name', ''), found_item.get('name', ''))
-    desc_sim = calculate_text_similarity(lost_item.get('description', ''), found_item.get('description', ''))
-    category_sim = calculate_text_similarity(lost_item.get('category', ''), found_item.get('category', ''))
-    location_sim = calculate_text_similarity(lost_item.get('location', ''), found_item.get('location', ''))
-    
-    # Date proximity (if both have dates)
-    date_sim = 0
-    if lost_item.get('date') and found_item.get('date'):
+def hybrid_search(query, search_type, limit=10, min_score=MIN_MATCH_SCORE, latency_budget_ms=None):
+    """hybrid_search_stream collected into a list. Returns (results sorted by match_score, stats)."""
+    stats = {}
+    results = list(hybrid_search_stream(query, search_type, limit, min_score, latency_budget_ms, stats))
+    return results, stats
+
+# ---------------------------------------------------------------------------
+# Near-duplicate detection: /store-item checks a new item against the stored
+# items of the same type. A near-duplicate joins the cluster of the item it
+# duplicates (item_features.cluster_id = the representative's item_id); only
+# representatives are indexed, so searches return one result per cluster.
+# ---------------------------------------------------------------------------
+
+DUPLICATE_DETECTION = os.environ.get('DUPLICATE_DETECTION', '1') != '0'
+DUPLICATE_IMAGE_MIN_COSINE = float(os.environ.get('DUPLICATE_IMAGE_MIN_COSINE', 0.95))
+DUPLICATE_FINGERPRINT_MAX_DISTANCE = int(os.environ.get('DUPLICATE_FINGERPRINT_MAX_DISTANCE', 6))  # bits of 64
+DUPLICATE_TEXT_MIN_SIMILARITY = float(os.environ.get('DUPLICATE_TEXT_MIN_SIMILARITY', 0.9))
+DUPLICATE_CANDIDATES = 10    # Nearest image neighbours checked per new item
+
+def release_cluster(item_type, item_id):
+    """Before a representative is re-stored, hand its cluster to its oldest duplicate, so the
+    re-stored item is checked afresh (and rejoins if it still duplicates them). Items without
+    duplicates, which the index already knows, need no database work."""
+    if not DUPLICATE_DETECTION:
+        return
+    index = get_item_index(item_type)
+    row = index.row_by_item_id.get(item_id)
+    members = index.items[row]["duplicate_ids"] if row is not None else []
+    if not members:
+        return
+    successor = members[0]
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("UPDATE item_features SET cluster_id = NULL WHERE item_type = ? AND item_id = ?",
+                 (item_type, successor))
+    conn.execute("UPDATE item_features SET cluster_id = ? WHERE item_type = ? AND cluster_id = ?",
+                 (successor, item_type, item_id))
+    conn.commit()
+    conn.close()
+    bump_item_generation(item_type, [item_id] + members)
+
+def find_near_duplicate(item_type, item_id, text, text_embedding=None, image_vector=None, fingerprint=None):
+    """The stored representative a new item duplicates, as {'item_id', 'image_similarity',
+    'text_similarity'}, or None. A duplicate needs both a near-identical image (cosine at least
+    DUPLICATE_IMAGE_MIN_COSINE, or a dHash within DUPLICATE_FINGERPRINT_MAX_DISTANCE bits) and
+    near-identical text (embedding cosine, else fuzzy ratio, at least DUPLICATE_TEXT_MIN_SIMILARITY)."""
+    if not DUPLICATE_DETECTION or not text or (image_vector is None and not fingerprint):
+        return None
+    index = get_item_index(item_type)
+    if not len(index):
+        return None
+
+    image_sims = index.fingerprint_candidates(fingerprint, DUPLICATE_FINGERPRINT_MAX_DISTANCE)
+    image_sims = {row: 1.0 - distance / 64.0 for row, distance in image_sims.items()}
+    if image_vector is not None:
+        query_vector = l2_normalize(image_vector)
+        rows = index.image_candidates({"image_vector": query_vector}, DUPLICATE_CANDIDATES)
+        for row, sim in zip(rows, index.image_similarities(np.asarray(rows, dtype=np.int64), query_vector)):
+            if sim >= DUPLICATE_IMAGE_MIN_COSINE:
+                image_sims[row] = max(float(sim), image_sims.get(row, 0.0))
+
+    query_embedding = l2_normalize(text_embedding) if text_embedding is not None else None
+    best = None
+    for row, image_sim in image_sims.items():
+        item = index.items[row]
+        if item["item_id"] == item_id:
+            continue
+        pos = index.text_pos[row]
+        if query_embedding is not None and pos >= 0 and index.text_matrix.shape[1] == query_embedding.shape[0]:
+            text_sim = float(index.text_matrix[pos] @ query_embedding)
+        else:
+            text_sim = calculate_text_similarity(text, f"{item['name'] or ''} {item['description'] or ''}".strip())
+        if text_sim >= DUPLICATE_TEXT_MIN_SIMILARITY and (best is None or (image_sim, text_sim) > best[1:]):
+            best = (item["item_id"], image_sim, text_sim)
+    if best is None:
+        return None
+    return {"item_id": best[0], "image_similarity": round(best[1], 4), "text_similarity": round(best[2], 4)}
+
+# ---------------------------------------------------------------------------
+# Materialized matches: item_matches keeps each stored item's top MATCH_TABLE_K
+# matches of the opposite type. A new item is scored once against the opposite
+# type and pushed into the lists of the items it matches.
+# ---------------------------------------------------------------------------
+
+MATCH_TABLE_K = int(os.environ.get('MATCH_TABLE_K', 20))
+# One worker serializes writes to item_matches and keeps them off the request path
+match_table_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='match-table')
+
+def opposite_type(item_type):
+    return "found" if item_type == "lost" else "lost"
+
+def update_item_matches(item_type, item_id, fields, image_bytes=None, representative=True):
+    """Score a newly stored item against the opposite type and update item_matches: replace
+    the item's own top-K list and insert it into the lists of the items it matched, trimming
+    those lists back to MATCH_TABLE_K. A near-duplicate (not its cluster's representative)
+    gets its own list but stays out of the other items' lists."""
+    match_type = opposite_type(item_type)
+    query = build_retrieval_query(
+        fields.get("item_name", ""), fields.get("category", ""), fields.get("description", ""),
+        fields.get("location", ""), fields.get("date", ""), fields.get("lat"), fields.get("lng"), image_bytes
+    )
+    matches, _ = hybrid_search(query, match_type, limit=MATCH_TABLE_K)
+    own_rows = [(item_type, item_id, match["item_id"], match["match_score"]) for match in matches]
+    reverse_rows = [(match_type, match["item_id"], item_id, match["match_score"])
+                    for match in matches] if representative else []
+
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    # A re-stored item drops out of every list before being re-scored
+    cursor.execute("DELETE FROM item_matches WHERE item_type = ? AND item_id = ?", (item_type, item_id))
+    cursor.execute("DELETE FROM item_matches WHERE item_type = ? AND match_id = ?", (match_type, item_id))
+    cursor.executemany('''
+        INSERT OR REPLACE INTO item_matches (item_type, item_id, match_id, score) VALUES (?, ?, ?, ?)
+    ''', own_rows + reverse_rows)
+    cursor.executemany('''
+        DELETE FROM item_matches
+        WHERE item_type = ? AND item_id = ? AND match_id NOT IN (
+            SELECT match_id FROM item_matches WHERE item_type = ? AND item_id = ?
+            ORDER BY score DESC LIMIT ?
+        )
+    ''', [(match_type, row[1], match_type, row[1], MATCH_TABLE_K) for row in reverse_rows])
+    conn.commit()
+    conn.close()
+    logger.info(f"Updated materialized matches for {item_type} item {item_id}: {len(matches)} matches")
+    return len(matches)
+
+def schedule_item_matches_update(item_type, item_id, fields, image_bytes=None, representative=True):
+    def run():
         try:
-            from datetime import datetime
-            lost_date = datetime.strptime(lost_item['date'], '%Y-%m-%d')
-            found_date = datetime.strptime(found_item['date'], '%Y-%m-%d')
-            days_diff = abs((lost_date - found_date).days)
-            # Higher similarity for closer dates
-            date_sim = max(0, 1 - (days_diff / 30))  # 30 days max
-        except:
-            date_sim = 0
-    
-    # Weighted combination
-    if image_similarity > 0:
-        # If we have image data, weight it heavily
-        match_score = (
-            name_sim * 0.25 +
-            desc_sim * 0.25 +
-            category_sim * 0.15 +
-            location_sim * 0.10 +
-            date_sim * 0.10 +
-            image_similarity * 0.15
-        ) * 100
-    else:
-        # Text-only matching
-        match_score = (
-            name_sim * 0.35 +
-            desc_sim * 0.35 +
-            category_sim * 0.15 +
-            location_sim * 0.10 +
-            date_sim * 0.05
-        ) * 100
-    
-    # Determine confidence level
-    if match_score >= 85:
-        confidence_level = "Very High"
-    elif match_score >= 70:
-        confidence_level = "High"
-    elif match_score >= 50:
-        confidence_level = "Medium"
-    elif match_score >= 30:
-        confidence_level = "Low"
+            update_item_matches(item_type, item_id, fields, image_bytes, representative)
+        except Exception as e:
+            logger.error(f"Error updating materialized matches for {item_type} item {item_id}: {e}")
+    return match_table_executor.submit(run)
+
+@timed_stage('db')
+def fetch_item_matches(item_type, item_id, limit=MATCH_TABLE_K):
+    """Materialized matches of a stored item, best first, joined with the matched items' details"""
+    conn = sqlite3.connect(DB_PATH)
+    rows = conn.execute('''
+        SELECT m.match_id, m.score, f.item_name, f.category, f.description, f.location, f.date, m.updated_at
+        FROM item_matches m
+        JOIN item_features f ON f.item_id = m.match_id AND f.item_type = ?
+        WHERE m.item_type = ? AND m.item_id = ?
+        ORDER BY m.score DESC
+        LIMIT ?
+    ''', (opposite_type(item_type), item_type, item_id, limit)).fetchall()
+    conn.close()
+    return [{
+        "item_id": match_id,
+        "name": name,
+        "category": category,
+        "description": description,
+        "location": location,
+        "date": date,
+        "match_score": score,
+        "updated_at": updated_at
+    } for match_id, score, name, category, description, location, date, updated_at in rows]
+
+# ---------------------------------------------------------------------------
+# Background all-pairs matching: open lost items vs. open found items. Blocking
+# keys (category + week, geo cell) limit scoring to plausible pairs; blocks are
+# scored vectorized in chunks (pair_scoring.score_pair_chunk) on a spawn-started
+# process pool, and pairs scoring at least MATCH_JOB_MIN_SCORE replace the
+# contents of match_candidates.
+# ---------------------------------------------------------------------------
+
+MATCH_JOB_INTERVAL_S = float(os.environ.get('MATCH_JOB_INTERVAL_S', 0))  # 0 disables the schedule
+MATCH_JOB_MIN_SCORE = float(os.environ.get('MATCH_JOB_MIN_SCORE', 70))
+MATCH_JOB_WORKERS = int(os.environ.get('MATCH_JOB_WORKERS', os.cpu_count() or 1))
+MATCH_JOB_CHUNK_PAIRS = 2000  # Pairs per process-pool task
+DATE_BLOCK_DAYS = 7           # Lost items block with found items up to one week bucket away
+GEO_CELL_DEG = 0.1            # ~11 km cells; lost items also block with the 8 neighbouring cells
+
+_match_job_lock = threading.Lock()
+
+def blocking_keys(index, row, spread):
+    """Blocking keys of one item. Lost items (spread=True) emit the neighbouring week buckets
+    and geo cells as well, so a shared key means the pair is close in date or place.
+    Items without a date only block on category with other undated items."""
+    category = (index.items[row]['category'] or '').strip().lower()
+    offsets = (-1, 0, 1) if spread else (0,)
+    ordinal = index.date_ordinals[row]
+    if np.isnan(ordinal):
+        keys = [('category', category, None)]
     else:
-        confidence_level = "Very Low"
-    
-    return {
-        'match_score': round(match_score, 1),
-        'confidence_level': confidence_level,
-        'breakdown': {
-            'name_similarity': round(name_sim * 100, 1),
-            'description_similarity': round(desc_sim * 100, 1),
-            'category_similarity': round(category_sim * 100, 1),
-            'location_similarity': round(location_sim * 100, 1),
-            'date_similarity': round(date_sim * 100, 1),
-            'image_similarity': round(image_similarity * 100, 1) if image_similarity > 0 else None
-        }
+        week = int(ordinal // DATE_BLOCK_DAYS)
+        keys = [('category', category, week + d) for d in offsets]
+    lat, lng = index.lats[row], index.lngs[row]
+    if not (np.isnan(lat) or np.isnan(lng)):
+        cell_lat, cell_lng = int(math.floor(lat / GEO_CELL_DEG)), int(math.floor(lng / GEO_CELL_DEG))
+        keys += [('geo', cell_lat + dy, cell_lng + dx) for dy in offsets for dx in offsets]
+    return keys
+
+def blocked_pairs(lost_index, found_index, lost_rows, found_rows):
+    """(lost_row, found_row) arrays of all pairs sharing a blocking key, and the block count"""
+    blocks = {}
+    for row in lost_rows:
+        for key in blocking_keys(lost_index, row, spread=True):
+            blocks.setdefault(key, ([], []))[0].append(row)
+    for row in found_rows:
+        for key in blocking_keys(found_index, row, spread=False):
+            blocks.setdefault(key, ([], []))[1].append(row)
+    pairs = set()
+    block_count = 0
+    for lost_members, found_members in blocks.values():
+        if lost_members and found_members:
+            block_count += 1
+            pairs.update((l, f) for l in lost_members for f in found_members)
+    pairs = np.array(sorted(pairs), dtype=np.int64).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1], block_count
+
+def gather_rows(matrix, positions, rows):
+    """(vectors, mask) of matrix rows for item rows; zero vectors where an item has none"""
+    if matrix is None:
+        return None, np.zeros(len(rows), dtype=bool)
+    pos = positions[rows]
+    mask = pos >= 0
+    vectors = np.zeros((len(rows), matrix.shape[1]), dtype=np.float32)
+    vectors[mask] = matrix[pos[mask]]
+    return vectors, mask
+
+def pair_chunk_payload(lost_index, found_index, lost_rows, found_rows):
+    """Everything score_pair_chunk needs for a chunk of pairs, as plain arrays and lists"""
+    lost_items = [lost_index.items[r] for r in lost_rows]
+    found_items = [found_index.items[r] for r in found_rows]
+    text = lambda item: f"{item['name'] or ''} {item['description'] or ''}".strip()
+    payload = {
+        "lost_text": [text(item) for item in lost_items],
+        "found_text": [text(item) for item in found_items],
+        "lost_category": [item['category'] or '' for item in lost_items],
+        "found_category": [item['category'] or '' for item in found_items],
+        "lost_location": [item['location'] or '' for item in lost_items],
+        "found_location": [item['location'] or '' for item in found_items],
+        "lost_lat": lost_index.lats[lost_rows], "lost_lng": lost_index.lngs[lost_rows],
+        "found_lat": found_index.lats[found_rows], "found_lng": found_index.lngs[found_rows],
+        "lost_date": lost_index.date_ordinals[lost_rows], "found_date": found_index.date_ordinals[found_rows],
+        "weights": dict(MATCH_WEIGHTS)
     }
+    for kind in ('text', 'image'):
+        lost_matrix = getattr(lost_index, f"{kind}_matrix")
+        found_matrix = getattr(found_index, f"{kind}_matrix")
+        if lost_matrix is not None and found_matrix is not None and lost_matrix.shape[1] != found_matrix.shape[1]:
+            lost_matrix = found_matrix = None
+        payload[f"lost_{kind}_vectors"], payload[f"lost_{kind}_mask"] = gather_rows(
+            lost_matrix, getattr(lost_index, f"{kind}_pos"), lost_rows)
+        payload[f"found_{kind}_vectors"], payload[f"found_{kind}_mask"] = gather_rows(
+            found_matrix, getattr(found_index, f"{kind}_pos"), found_rows)
+    return payload
+
+def open_item_rows(index, item_type):
+    """Rows of index whose item has no approved claim"""
+    column = "lost_item_id" if item_type == "lost" else "found_item_id"
+    conn = sqlite3.connect(DB_PATH)
+    claimed = {row[0] for row in conn.execute(
+        f"SELECT {column} FROM item_claims WHERE claim_status = 'approved'")}
+    conn.close()
+    return [row for row in index.live_rows().tolist() if index.items[row]["item_id"] not in claimed]
+
+def run_matching_job(workers=None):
+    """One all-pairs matching run. Returns its stats, or None if a run is already in progress."""
+    if not _match_job_lock.acquire(blocking=False):
+        return None
+    started = time.perf_counter()
+    conn = sqlite3.connect(DB_PATH)
+    run_id = conn.execute("INSERT INTO match_job_runs (status) VALUES ('running')").lastrowid
+    conn.commit()
+    conn.close()
+    stats = {"run_id": run_id, "status": "running"}
+    try:
+        lost_index, found_index = get_item_index('lost'), get_item_index('found')
+        lost_rows = open_item_rows(lost_index, 'lost')
+        found_rows = open_item_rows(found_index, 'found')
+        lost_pairs, found_pairs, block_count = blocked_pairs(lost_index, found_index, lost_rows, found_rows)
+        stats.update({
+            "lost_items": len(lost_rows),
+            "found_items": len(found_rows),
+            "blocks": block_count,
+            "candidate_pairs": int(len(lost_pairs)),
+            "all_pairs": len(lost_rows) * len(found_rows)
+        })
+
+        chunks = [
+            pair_chunk_payload(lost_index, found_index, lost_pairs[i:i + MATCH_JOB_CHUNK_PAIRS],
+                               found_pairs[i:i + MATCH_JOB_CHUNK_PAIRS])
+            for i in range(0, len(lost_pairs), MATCH_JOB_CHUNK_PAIRS)
+        ]
+        workers = workers or MATCH_JOB_WORKERS
+        if workers > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+                chunk_scores = list(pool.map(score_pair_chunk, chunks))
+        else:
+            chunk_scores = [score_pair_chunk(chunk) for chunk in chunks]
+        scores = np.concatenate(chunk_scores) if chunk_scores else np.empty(0)
+
+        keep = np.flatnonzero(scores >= MATCH_JOB_MIN_SCORE)
+        rows = [(lost_index.items[lost_pairs[i]]["item_id"], found_index.items[found_pairs[i]]["item_id"],
+                 round(float(scores[i]), 1), run_id) for i in keep]
+        conn = sqlite3.connect(DB_PATH)
+        conn.execute("DELETE FROM match_candidates")
+        conn.executemany(
+            "INSERT INTO match_candidates (lost_item_id, found_item_id, score, run_id) VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+        conn.close()
+
+        elapsed = time.perf_counter() - started
+        stats.update({
+            "status": "completed",
+            "matches_written": len(rows),
+            "elapsed_s": round(elapsed, 3),
+            "pairs_per_s": round(len(lost_pairs) / elapsed, 1) if elapsed > 0 else None
+        })
+    except Exception as e:
+        logger.error(f"Matching job {run_id} failed: {e}")
+        stats.update({"status": "failed", "error": str(e), "elapsed_s": round(time.perf_counter() - started, 3)})
+    finally:
+        _match_job_lock.release()
+
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute('''
+        UPDATE match_job_runs
+        SET status = ?, lost_items = ?, found_items = ?, blocks = ?, candidate_pairs = ?, all_pairs = ?,
+            matches_written = ?, elapsed_s = ?, pairs_per_s = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+        WHERE run_id = ?
+    ''', (stats["status"], stats.get("lost_items"), stats.get("found_items"), stats.get("blocks"),
+          stats.get("candidate_pairs"), stats.get("all_pairs"), stats.get("matches_written"),
+          stats.get("elapsed_s"), stats.get("pairs_per_s"), stats.get("error"), run_id))
+    conn.commit()
+    conn.close()
+    logger.info(f"Matching job {run_id}: {stats}")
+    return stats
+
+def matching_job_scheduler():
+    while True:
+        time.sleep(MATCH_JOB_INTERVAL_S)
+        try:
+            run_matching_job()
+        except Exception as e:
+            logger.error(f"Scheduled matching job error: {e}")
+
+if MATCH_JOB_INTERVAL_S > 0 and not MATCH_JOB_WORKER:
+    threading.Thread(target=matching_job_scheduler, name='matching-job', daemon=True).start()
 
 @app.post("/match-image")
 def match_image():
@@ -1088,43 +3747,59 @@ def detect_fraud():
 @app.post("/store-item")
 def store_item():
     """Store a found or lost item in the database for future matching"""
-    payload = request.get_json(silent=True) or {}
+    payload = get_request_payload()
     
     # Extract item details
     item_type = payload.get("item_type", "found")  # 'found' or 'lost'
     item_id = payload.get("item_id")
+    # Form fields arrive as strings; JSON and multipart stores return the same id
+    if isinstance(item_id, str) and item_id.strip().isdigit():
+        item_id = int(item_id)
     item_name = payload.get("item_name", "")
     category = payload.get("category", "")
     description = payload.get("description", "")
     location = payload.get("location", "")
     date = payload.get("date", "")
+    lat = to_float(payload.get("lat"))
+    lng = to_float(payload.get("lng"))
     image_data = payload.get("image")
     
     try:
+        # Text embedding for the text ANN index
+        text = f"{item_name} {description}".strip()
+        text_embedding_blob = None
+        text_embedding = encode_text_to_embedding(text)
+        if text_embedding is not None:
+            text_embedding_blob = pickle.dumps(text_embedding)
+        # Fast-tier vectors for candidate generation, keyed by (kind, model)
+        fast_embeddings = {}
+        if fast_text_model is not None and text:
+            fast_embeddings[('text', FAST_TEXT_MODEL)] = encode_text_to_embedding(text, tier='fast')
+        
         # Process image if available
         image_features_blob = None
+        image_vector, fingerprint = None, None
         if image_data:
             # Try ResNet50 features first
-            image_tensor = preprocess_image_for_resnet(image_data)
-            if image_tensor is not None:
-                resnet_features = extract_resnet_features(image_tensor)
-                if resnet_features is not None:
-                    # Store ResNet50 features
-                    image_features_blob = pickle.dumps(resnet_features)
-                    logger.info(f"Stored ResNet50 features for item {item_id}")
-                else:
-                    # Fallback to ORB features
-                    processed_image = preprocess_image(image_data)
-                    if processed_image and processed_image["descriptors"] is not None:
-                        image_features_blob = processed_image["descriptors"].tobytes()
-                        logger.info(f"Stored ORB features for item {item_id}")
+            image_features = get_image_features(image_data, need=search_feature_kinds() + ('fingerprint',))
+            image_vector, fingerprint = image_features["resnet"], image_features["fingerprint"]
+            if image_features.get("fast") is not None:
+                fast_embeddings[('image', FAST_IMAGE_MODEL)] = image_features["fast"]
+            if image_features["resnet"] is not None:
+                # Store ResNet50 features
+                image_features_blob = pickle.dumps(image_features["resnet"])
+                logger.info(f"Stored ResNet50 features for item {item_id}")
             else:
                 # Fallback to ORB features
-                processed_image = preprocess_image(image_data)
-                if processed_image and processed_image["descriptors"] is not None:
-                    image_features_blob = processed_image["descriptors"].tobytes()
+                descriptors = get_image_features(image_data, need=('orb',))["orb"]
+                if descriptors is not None:
+                    image_features_blob = descriptors.tobytes()
                     logger.info(f"Stored ORB features for item {item_id}")
         
+        release_cluster(item_type, item_id)
+        duplicate = find_near_duplicate(item_type, item_id, text, text_embedding, image_vector, fingerprint)
+        cluster_id = duplicate["item_id"] if duplicate else None
+        
         # Store in SQLite database
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
@@ -1132,12 +3807,29 @@ def store_item():
         # Insert or update item features
         cursor.execute('''
             INSERT OR REPLACE INTO item_features 
-            (item_id, item_type, item_name, category, description, location, date, image_features)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (item_id, item_type, item_name, category, description, location, date, image_features_blob))
+            (item_id, item_type, item_name, category, description, location, date, image_features,
+             text_embedding, lat, lng, image_model, text_model, fingerprint, cluster_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (item_id, item_type, item_name, category, description, location, date, image_features_blob,
+              text_embedding_blob, lat, lng, IMAGE_MODEL, TEXT_MODEL, fingerprint, cluster_id))
+        if cluster_id is not None:
+            logger.info(f"{item_type} item {item_id} is a near-duplicate of item {cluster_id}: {duplicate}")
+        cursor.execute(
+            "DELETE FROM item_embeddings WHERE item_id = ? AND item_type = ?", (item_id, item_type)
+        )
+        cursor.executemany('''
+            INSERT INTO item_embeddings (item_id, item_type, kind, model, embedding)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(item_id, item_type, kind, model_name, pickle.dumps(vector))
+              for (kind, model_name), vector in fast_embeddings.items() if vector is not None])
         
         conn.commit()
         conn.close()
+        bump_item_generation(item_type, [item_id])
+        schedule_item_matches_update(item_type, item_id, {
+            "item_name": item_name, "category": category, "description": description,
+            "location": location, "date": date, "lat": lat, "lng": lng
+        }, decode_image_data(image_data) if image_data else None, representative=cluster_id is None)
         
         logger.info(f"Stored {item_type} item: {item_id} with features")
         return jsonify({
@@ -1145,8 +3837,12 @@ def store_item():
             "message": f"Item successfully stored in {item_type} items database",
             "item_id": item_id,
             "available_for_matching": True,
-            "has_image_features": image_features_blob is not None
+            "has_image_features": image_features_blob is not None,
+            "cluster_id": item_id if cluster_id is None else cluster_id,
+            "duplicate_of": duplicate
         })
+    except InferenceOverloaded:
+        raise
     except Exception as e:
         logger.error(f"Error storing item {item_id}: {e}")
         return jsonify({
@@ -1156,15 +3852,175 @@ def store_item():
         })
 
 
+def stream_format(payload):
+    """'ndjson' or 'sse' when the client asked for a streamed response, else None"""
+    accept = request.headers.get("Accept", "")
+    if "text/event-stream" in accept:
+        return "sse"
+    if "application/x-ndjson" in accept:
+        return "ndjson"
+    stream = str(payload.get("stream", "")).lower()
+    return stream if stream in ("ndjson", "sse") else ("ndjson" if stream in ("1", "true") else None)
+
+def streamed_response(events, fmt):
+    """Stream (event_type, data) pairs as NDJSON lines or server-sent events"""
+    def generate():
+        for event_type, data in events:
+            if fmt == "sse":
+                yield f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+            else:
+                yield json.dumps({"type": event_type, **data}) + "\n"
+    mimetype = "text/event-stream" if fmt == "sse" else "application/x-ndjson"
+    return Response(stream_with_context(generate()), mimetype=mimetype,
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def image_search_result(candidate):
+    similarity_score = candidate["match_score"]
+    return {
+        "item_id": candidate["item_id"],
+        "name": candidate["name"],
+        "category": candidate["category"],
+        "description": candidate["description"],
+        "location": candidate["location"],
+        "date": candidate["date"],
+        "similarity_score": similarity_score,
+        "image_similarity": candidate["image_similarity"],
+        "match_confidence": "High" if similarity_score >= 80 else "Medium" if similarity_score >= 60 else "Low",
+        "duplicate_ids": candidate["duplicate_ids"]
+    }
+
+def image_search_response(query_info, results):
+    return {
+        "ok": True,
+        "query": query_info,
+        "results": results,
+        "total_matches": len(results),
+        "best_match_score": results[0]["similarity_score"] if results else 0,
+        "search_successful": len(results) > 0
+    }
+
+def image_search_events(query, query_info, search_type, limit, cache_key):
+    """Streamed /search-by-image: a query event, one result event per confirmed match in
+    final order, then a done event with the summary fields"""
+    yield "query", {"query": query_info}
+    results = []
+    try:
+        for candidate in hybrid_search_stream(query, search_type, limit=limit):
+            result = image_search_result(candidate)
+            results.append(result)
+            yield "result", {"result": result}
+    except Exception as e:
+        logger.error(f"Error in streamed search_by_image: {e}")
+        yield "error", {"ok": False, "error": str(e)}
+        return
+    response = image_search_response(query_info, results)
+    result_cache.set(cache_key, response)
+    yield "done", {key: response[key] for key in ("ok", "total_matches", "best_match_score", "search_successful")}
+
+def cached_image_search_events(response):
+    yield "query", {"query": response["query"]}
+    for result in response["results"]:
+        yield "result", {"result": result}
+    yield "done", {key: response[key] for key in ("ok", "total_matches", "best_match_score", "search_successful")}
+
+@app.post("/item-matches")
+def item_matches():
+    """Precomputed top matches of a stored item (maintained on /store-item), read from item_matches"""
+    payload = get_request_payload()
+    item_id = payload.get("item_id")
+    item_type = payload.get("item_type", "lost")
+    limit = int_param(payload.get("limit"), MATCH_TABLE_K, minimum=1)
+    
+    if item_id is None:
+        return jsonify({"ok": False, "error": "item_id is required"}), 400
+    if limit is None:
+        return param_error("limit", "a positive integer")
+    
+    try:
+        matches = fetch_item_matches(item_type, item_id, limit)
+        return jsonify({
+            "ok": True,
+            "item_id": item_id,
+            "item_type": item_type,
+            "matches": matches,
+            "match_found": len(matches) > 0,
+            "best_match_score": matches[0]["match_score"] if matches else 0
+        })
+    except Exception as e:
+        logger.error(f"Error fetching matches for {item_type} item {item_id}: {e}")
+        return jsonify({"ok": False, "error": str(e), "matches": []})
+
+
+@app.post("/matching-job")
+def trigger_matching_job():
+    """Start an all-pairs matching run in the background ({"wait": true} runs it inline)"""
+    payload = get_request_payload()
+    if _match_job_lock.locked():
+        return jsonify({"ok": False, "error": "A matching job is already running"}), 409
+    if payload.get("wait"):
+        stats = run_matching_job()
+        if stats is None:
+            return jsonify({"ok": False, "error": "A matching job is already running"}), 409
+        return jsonify({"ok": stats["status"] == "completed", "run": stats})
+    threading.Thread(target=run_matching_job, name='matching-job-run', daemon=True).start()
+    return jsonify({"ok": True, "started": True}), 202
+
+@app.get("/matching-job")
+def matching_job_runs():
+    """Stats of the most recent matching runs"""
+    limit = int_param(request.args.get("limit"), 10, minimum=1)
+    if limit is None:
+        return param_error("limit", "a positive integer")
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    runs = [dict(row) for row in conn.execute(
+        "SELECT * FROM match_job_runs ORDER BY run_id DESC LIMIT ?", (limit,))]
+    conn.close()
+    return jsonify({"ok": True, "running": _match_job_lock.locked(), "runs": runs})
+
+@app.post("/match-candidates")
+def match_candidates():
+    """High-confidence pairs from the latest matching run, optionally for one lost or found item"""
+    payload = get_request_payload()
+    limit = int_param(payload.get("limit"), 50, minimum=1)
+    if limit is None:
+        return param_error("limit", "a positive integer")
+    conditions, params = [], []
+    for column in ("lost_item_id", "found_item_id"):
+        if payload.get(column) is not None:
+            conditions.append(f"{column} = ?")
+            params.append(payload[column])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    pairs = [dict(row) for row in conn.execute(
+        f"SELECT * FROM match_candidates {where} ORDER BY score DESC LIMIT ?", (*params, limit))]
+    conn.close()
+    return jsonify({"ok": True, "pairs": pairs})
+
+
 @app.post("/search-by-image")
 def search_by_image():
-    """Search for similar items using image similarity"""
-    payload = request.get_json(silent=True) or {}
+    """Search for similar items using image similarity.
+    With stream=ndjson|sse (or an Accept header for either), results are streamed as they are confirmed.
+    With page_size, results are paged: the response carries page.next_cursor, and posting
+    {"cursor": ...} returns the next page of the same ranking."""
+    payload = get_request_payload()
+    if payload.get("cursor"):
+        return cursor_page(payload["cursor"], payload.get("page_size"))
     
     # Extract image data
     image_data = payload.get("image")
     item_type = payload.get("item_type", "lost")  # 'lost' or 'found'
-    limit = payload.get("limit", 10)
+    limit = int_param(payload.get("limit"), 10, minimum=1)
+    if limit is None:
+        return param_error("limit", "a positive integer")
+    page_size = int_param(payload.get("page_size") or None, 0)
+    if page_size is None or (page_size and not valid_page_size(page_size)):
+        return page_size_error()
+    if page_size:
+        limit = max(limit, RANKING_DEPTH)
+    fmt = None if page_size else stream_format(payload)
     
     if not image_data:
         return jsonify({
@@ -1173,90 +4029,60 @@ def search_by_image():
         })
     
     try:
-        # Extract features from query image
-        query_tensor = preprocess_image_for_resnet(image_data)
-        if query_tensor is None:
-            return jsonify({
-                "ok": False,
-                "error": "Failed to process query image"
-            })
+        # Determine which items to search against
+        search_type = "found" if item_type == "lost" else "lost"
+        
+        # Optional metadata joins the image in the fused ranking
+        fields = {
+            "item_name": payload.get("item_name", ""),
+            "category": payload.get("category", ""),
+            "description": payload.get("description", ""),
+            "location": payload.get("location", ""),
+            "date": payload.get("date", ""),
+            "lat": to_float(payload.get("lat")),
+            "lng": to_float(payload.get("lng")),
+            "limit": limit
+        }
+        image_bytes = decode_image_data(image_data)
+        cache_key = query_fingerprint("search-by-image", search_type, fields, image_bytes)
+        cached_response = result_cache.get(cache_key)
+        if cached_response is not None:
+            if fmt:
+                return streamed_response(cached_image_search_events(cached_response), fmt)
+            if page_size:
+                return jsonify(first_page(cached_response, cache_key, page_size))
+            return jsonify(cached_response)
         
-        query_features = extract_resnet_features(query_tensor)
-        if query_features is None:
+        query = build_retrieval_query(
+            fields["item_name"], fields["category"], fields["description"], fields["location"],
+            fields["date"], fields["lat"], fields["lng"], image_bytes
+        )
+        if query["image_vector"] is None and query["image_descriptors"] is None:
             return jsonify({
                 "ok": False,
                 "error": "Failed to extract features from query image"
             })
         
-        # Get items from database to search against
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Determine which items to search against
-        search_type = "found" if item_type == "lost" else "lost"
-        
-        cursor.execute('''
-            SELECT item_id, item_name, category, description, location, date, image_features
-            FROM item_features 
-            WHERE item_type = ? AND image_features IS NOT NULL
-            ORDER BY created_at DESC
-        ''', (search_type,))
-        
-        stored_items = cursor.fetchall()
-        conn.close()
-        
-        results = []
-        
-        for stored_item in stored_items:
-            stored_item_id, stored_name, stored_category, stored_desc, stored_location, stored_date, stored_features_blob = stored_item
-            
-            try:
-                # Load stored features
-                stored_features = pickle.loads(stored_features_blob)
-                
-                # Calculate cosine similarity
-                if stored_features is not None and len(stored_features.shape) == 1:
-                    # Ensure both features are 2D for cosine_similarity
-                    query_features_2d = query_features.reshape(1, -1)
-                    stored_features_2d = stored_features.reshape(1, -1)
-                    
-                    similarity = cosine_similarity(query_features_2d, stored_features_2d)[0][0]
-                    similarity_score = float(similarity * 100)  # Convert to percentage
-                    
-                    # Only include items with reasonable similarity
-                    if similarity_score >= 30:  # Minimum threshold
-                        results.append({
-                            "item_id": stored_item_id,
-                            "name": stored_name,
-                            "category": stored_category,
-                            "description": stored_desc,
-                            "location": stored_location,
-                            "date": stored_date,
-                            "similarity_score": round(similarity_score, 1),
-                            "match_confidence": "High" if similarity_score >= 80 else "Medium" if similarity_score >= 60 else "Low"
-                        })
-            except Exception as e:
-                logger.error(f"Error processing stored features for item {stored_item_id}: {e}")
-                continue
-        
-        # Sort by similarity score (highest first)
-        results.sort(key=lambda x: x["similarity_score"], reverse=True)
-        
-        # Limit results
-        results = results[:limit]
+        query_info = {
+            "item_type": item_type,
+            "search_method": "resnet50_image_similarity" if query["image_vector"] is not None else "orb_image_similarity"
+        }
+        if fmt:
+            return streamed_response(image_search_events(query, query_info, search_type, limit, cache_key), fmt)
         
-        return jsonify({
-            "ok": True,
-            "query": {
-                "item_type": item_type,
-                "search_method": "resnet50_image_similarity"
-            },
-            "results": results,
-            "total_matches": len(results),
-            "best_match_score": results[0]["similarity_score"] if results else 0,
-            "search_successful": len(results) > 0
-        })
+        def score():
+            candidates, _ = hybrid_search(query, search_type, limit=limit)
+            results = [image_search_result(candidate) for candidate in candidates]
+            response = image_search_response(query_info, results)
+            result_cache.set(cache_key, response)
+            return response
+        response = query_flight.do(cache_key, score)
+        if page_size:
+            return jsonify(first_page(response, cache_key, page_size))
+        return jsonify(response)
         
+    except InferenceOverloaded:
+        raise
     except Exception as e:
         logger.error(f"Error in search_by_image: {e}")
         return jsonify({
@@ -1271,40 +4097,27 @@ def analyze_claim_fraud():
     """Analyze fraud risk for a specific claim by comparing lost and found items"""
     payload = request.get_json(silent=True) or {}
     
-    # Extract claim details
-    lost_item = payload.get("lost_item", {})
-    found_item = payload.get("found_item", {})
+    # Extract claim details (inline items and/or references to stored items)
+    lost_item = resolve_item(payload.get("lost_item"), payload.get("lost_item_id"), 'lost')
+    found_item = resolve_item(payload.get("found_item"), payload.get("found_item_id"), 'found')
     user_history = payload.get("user_history", {})
     
     if not lost_item or not found_item:
         return jsonify({
             "ok": False,
-            "error": "Both lost_item and found_item are required"
+            "error": "Both lost_item and found_item (or stored lost_item_id and found_item_id) are required"
         })
     
     try:
-        # Calculate image similarity if both have images
-        image_similarity = 0
-        if lost_item.get('image') and found_item.get('image'):
-            # Process both images
-            lost_tensor = preprocess_image_for_resnet(lost_item['image'])
-            found_tensor = preprocess_image_for_resnet(found_item['image'])
-            
-            if lost_tensor is not None and found_tensor is not None:
-                lost_features = extract_resnet_features(lost_tensor)
-                found_features = extract_resnet_features(found_tensor)
-                
-                if lost_features is not None and found_features is not None:
-                    # Calculate cosine similarity
-                    lost_features_2d = lost_features.reshape(1, -1)
-                    found_features_2d = found_features.reshape(1, -1)
-                    image_similarity = cosine_similarity(lost_features_2d, found_features_2d)[0][0]
+        # Pair similarities are computed once and shared by both scorers
+        pair = PairFeatures(lost_item, found_item)
+        image_similarity = pair.image_similarity()
         
         # Calculate fraud score based on matching
-        fraud_result = calculate_fraud_score_based_on_matching(lost_item, found_item, user_history)
+        fraud_result = calculate_fraud_score_based_on_matching(lost_item, found_item, user_history, pair=pair)
         
         # Calculate overall match confidence
-        match_result = calculate_match_confidence(lost_item, found_item, image_similarity)
+        match_result = calculate_match_confidence(lost_item, found_item, image_similarity, pair=pair)
         
         # Generate recommendation
         if match_result['match_score'] >= 80 and fraud_result['fraud_score'] < 20:
@@ -1330,8 +4143,11 @@ def analyze_claim_fraud():
                 "key_indicators": fraud_result['indicators'],
                 "verification_required": fraud_result['fraud_score'] >= 30 or match_result['match_score'] < 70,
                 "image_available": image_similarity > 0
-            }
+            },
+            "unresolved_item_ids": unresolved_item_ids(payload, lost_item, found_item)
         })
+    except InferenceOverloaded:
+        raise
     except Exception as e:
         logger.error(f"Error in analyze_claim_fraud: {e}")
         return jsonify({
@@ -1342,44 +4158,35 @@ def analyze_claim_fraud():
 @app.post("/compare-items")
 def compare_items():
     """Compare a lost item and a found item and predict fraud probability.
-    Input JSON: { lost_item: {...}, found_item: {...} }
+    Input JSON: { lost_item: {...}, found_item: {...} } and/or { lost_item_id, found_item_id }
+    referencing items already stored via /store-item
     Output JSON: { match_score: X, fraud_probability: Y%, explanation: [...] }
     """
-    payload = request.get_json(silent=True) or {}
-    lost_item = payload.get('lost_item', {})
-    found_item = payload.get('found_item', {})
+    payload = get_request_payload()
+    lost_item = resolve_item(payload.get('lost_item'), payload.get('lost_item_id'), 'lost')
+    found_item = resolve_item(payload.get('found_item'), payload.get('found_item_id'), 'found')
+    body, status = compare_items_result(lost_item, found_item, debug=DEBUG_TIMINGS or bool(payload.get('debug')),
+                                        unresolved=unresolved_item_ids(payload, lost_item, found_item))
+    return jsonify(body), status
 
+def compare_items_result(lost_item, found_item, debug=False, unresolved=None):
+    """(response body, status) of /compare-items for two resolved items. unresolved is the
+    unresolved_item_ids of the request. With debug, the body includes timings_ms, the
+    per-stage breakdown of the scoring."""
+    unresolved = unresolved or {}
     if not lost_item or not found_item:
-        return jsonify({ "ok": False, "error": "lost_item and found_item are required" }), 400
+        return { "ok": False, "error": "lost_item and found_item (or stored lost_item_id and found_item_id) are required",
+                 "unresolved_item_ids": unresolved }, 400
 
     try:
-        feats, aux = compute_feature_set(lost_item, found_item)
+        started = time.perf_counter()
+        pair = PairFeatures(lost_item, found_item)
+        feats, aux = compute_feature_set(lost_item, found_item, pair=pair)
         match_score = compute_match_score(feats)
 
         # Prepare vector for classifier
-        # The fraud model expects 5 features, but we have 6
-        # Combine location_similarity and location_proximity into one feature
         try:
-            x_vec = np.array([
-                feats['text_similarity'],
-                feats['category_similarity'],
-                # Combine location features with weighted average
-                (feats['location_similarity'] * 0.5 + feats['location_proximity'] * 0.5),
-                feats['time_similarity'],
-                feats['image_similarity']
-            ]).reshape(1, -1)
-            
-            # Ensure we have exactly 5 features
-            if x_vec.shape[1] != 5:
-                logger.warning(f"Expected 5 features, got {x_vec.shape[1]}. Reshaping to 5 features.")
-                # Force reshape to 5 features if needed
-                x_vec = np.array([
-                    feats['text_similarity'],
-                    feats['category_similarity'],
-                    (feats['location_similarity'] * 0.5 + feats['location_proximity'] * 0.5),
-                    feats['time_similarity'],
-                    feats.get('image_similarity', 0.0)  # Default to 0 if missing
-                ]).reshape(1, 5)
+            x_vec = fraud_feature_matrix(feats)
         except Exception as e:
             logger.warning(f"Error creating feature vector: {e}. Using default features.")
             # Fallback to default feature vector
@@ -1389,9 +4196,12 @@ def compare_items():
         feature_importance = None
         if fraud_model is not None:
             try:
-                proba = fraud_model.predict_proba(x_vec)[0][1]
+                proba = pair.timed('fraud_model', inference_executor('fraud_model').run,
+                                   fraud_model.predict_proba, x_vec)[0][1]
                 fraud_prob = float(proba)
                 feature_importance = getattr(fraud_model, 'feature_importances_', None)
+            except InferenceOverloaded:
+                raise
             except Exception as e:
                 logger.error(f"Fraud model inference error: {e}")
 
@@ -1414,7 +4224,7 @@ def compare_items():
             explanations.append("Model feature importance: " + ", ".join([f"{n}={round(v*100,1)}%" for n,v in ranked]))
 
         confidence_level = 'very_high' if match_score >= 90 else 'high' if match_score >= 70 else 'medium' if match_score >= 50 else 'low'
-        return jsonify({
+        body = {
             "ok": True,
             "match_score": match_score,
             "fraud_probability": round(fraud_prob * 100.0, 1),
@@ -1436,11 +4246,17 @@ def compare_items():
                 },
                 "recommendation": "APPROVE_MATCH" if (match_score >= 90 and (fraud_prob * 100.0) < 10) else "REVIEW",
                 "key_supporting_evidence": explanations
-            }
-        })
+            },
+            "unresolved_item_ids": unresolved
+        }
+        if debug:
+            body["timings_ms"] = {**pair.timings, "total": round((time.perf_counter() - started) * 1000, 2)}
+        return body, 200
+    except InferenceOverloaded:
+        raise
     except Exception as e:
         logger.error(f"compare_items error: {e}")
-        return jsonify({ "ok": False, "error": str(e) }), 500
+        return { "ok": False, "error": str(e) }, 500
 
 @app.post("/match-lost-found")
 def match_lost_found():
@@ -1461,20 +4277,8 @@ def match_lost_found():
     try:
         # Calculate image similarity if both have images
         image_similarity = 0
-        if lost_item.get('image') and found_item.get('image'):
-            # Process both images
-            lost_tensor = preprocess_image_for_resnet(lost_item['image'])
-            found_tensor = preprocess_image_for_resnet(found_item['image'])
-            
-            if lost_tensor is not None and found_tensor is not None:
-                lost_features = extract_resnet_features(lost_tensor)
-                found_features = extract_resnet_features(found_tensor)
-                
-                if lost_features is not None and found_features is not None:
-                    # Calculate cosine similarity
-                    lost_features_2d = lost_features.reshape(1, -1)
-                    found_features_2d = found_features.reshape(1, -1)
-                    image_similarity = cosine_similarity(lost_features_2d, found_features_2d)[0][0]
+        if has_image(lost_item) and has_image(found_item):
+            image_similarity = item_image_similarity(lost_item, found_item)
         
         # Calculate match confidence
         match_result = calculate_match_confidence(lost_item, found_item, image_similarity)
@@ -1515,6 +4319,8 @@ def match_lost_found():
             }
         })
         
+    except InferenceOverloaded:
+        raise
     except Exception as e:
         logger.error(f"Error in match_lost_found: {e}")
         return jsonify({
@@ -1561,8 +4367,9 @@ def create_claim():
     lost_item_id = payload.get("lost_item_id")
     found_item_id = payload.get("found_item_id")
     claimer_user_id = payload.get("claimer_user_id")
-    lost_item = payload.get("lost_item", {})
-    found_item = payload.get("found_item", {})
+    # Items stored via /store-item are scored from their stored features
+    lost_item = resolve_item(payload.get("lost_item"), lost_item_id, 'lost')
+    found_item = resolve_item(payload.get("found_item"), found_item_id, 'found')
     
     if not all([lost_item_id, found_item_id, claimer_user_id]):
         return jsonify({
@@ -1587,10 +4394,11 @@ def create_claim():
         
         if lost_item and found_item:
             try:
-                feats, aux = compute_feature_set(lost_item, found_item)
+                pair = PairFeatures(lost_item, found_item)
+                feats, aux = compute_feature_set(lost_item, found_item, pair=pair)
                 match_score = compute_match_score(feats)
                 
-                fraud_result = calculate_fraud_score_based_on_matching(lost_item, found_item)
+                fraud_result = calculate_fraud_score_based_on_matching(lost_item, found_item, pair=pair)
                 fraud_score = fraud_result['fraud_score']
             except Exception as e:
                 logger.error(f"Error calculating scores for claim: {e}")
@@ -1617,7 +4425,8 @@ def create_claim():
             "status": "pending",
             "match_score": match_score,
             "fraud_score": fraud_score,
-            "message": "Claim created successfully"
+            "message": "Claim created successfully",
+            "unresolved_item_ids": unresolved_item_ids(payload, lost_item, found_item)
         })
         
     except Exception as e:
@@ -1720,8 +4529,11 @@ def update_claim_status():
 
 @app.post("/match-item")
 def match_item():
-    """Match a lost item against all found items or a found item against all lost items"""
-    payload = request.get_json(silent=True) or {}
+    """Match a lost item against all found items or a found item against all lost items.
+    Returns the top `limit` (default 10) results, or pages of them with page_size / cursor."""
+    payload = get_request_payload()
+    if payload.get("cursor"):
+        return cursor_page(payload["cursor"], payload.get("page_size"))
     
     # Extract item details
     item_type = payload.get("item_type", "lost")  # 'lost' or 'found'
@@ -1733,116 +4545,105 @@ def match_item():
     image_data = payload.get("image")
     
     try:
-        # Process image if available
-        query_image_features = None
-        query_image = None
-        if image_data:
-            processed_image = preprocess_image(image_data)
-            if processed_image:
-                query_image_features = processed_image["descriptors"]
-                query_image = processed_image["image"]
-        
-        # Get items from database to match against
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
         # Determine which items to search against
         search_type = "found" if item_type == "lost" else "lost"
+        lat = to_float(payload.get("lat"))
+        lng = to_float(payload.get("lng"))
+        latency_budget_ms = to_float(payload.get("latency_budget_ms")) or MATCH_LATENCY_BUDGET_MS
+        limit = int_param(payload.get("limit"), 10, minimum=1)
+        if limit is None:
+            return param_error("limit", "a positive integer")
+        page_size = int_param(payload.get("page_size") or None, 0)
+        if page_size is None or (page_size and not valid_page_size(page_size)):
+            return page_size_error()
+        if page_size:
+            limit = max(limit, RANKING_DEPTH)
         
-        cursor.execute('''
-            SELECT item_id, item_name, category, description, location, date, image_features
-            FROM item_features 
-            WHERE item_type = ?
-            ORDER BY created_at DESC
-        ''', (search_type,))
+        image_bytes = decode_image_data(image_data) if image_data else None
+        cache_key = query_fingerprint("match-item", search_type, {
+            "item_name": item_name,
+            "category": category,
+            "description": description,
+            "location": location,
+            "date": date,
+            "lat": lat,
+            "lng": lng,
+            "limit": limit,
+            # The budget sizes the stage-two shortlist, so it changes which results come back
+            "latency_budget_ms": latency_budget_ms
+        }, image_bytes)
+        cached_response = result_cache.get(cache_key)
+        if cached_response is not None:
+            if page_size:
+                return jsonify(first_page(cached_response, cache_key, page_size))
+            return jsonify(cached_response)
         
-        stored_items = cursor.fetchall()
-        conn.close()
+        def score():
+            query = build_retrieval_query(item_name, category, description, location, date,
+                                          lat, lng, image_bytes)
         
-        results = []
+            candidates, cascade_stats = hybrid_search(query, search_type, limit=limit,
+                                                      latency_budget_ms=latency_budget_ms)
         
-        for stored_item in stored_items:
-            stored_item_id, stored_name, stored_category, stored_desc, stored_location, stored_date, stored_features_blob = stored_item
-            
-            # Calculate text similarity
-            name_similarity = calculate_text_similarity(item_name, stored_name)
-            desc_similarity = calculate_text_similarity(description, stored_desc)
-            category_similarity = calculate_text_similarity(category, stored_category)
-            location_similarity = calculate_text_similarity(location, stored_location)
-            
-            # Calculate metadata similarity (weighted average)
-            metadata_similarity = (
-                name_similarity * 0.4 +
-                desc_similarity * 0.3 +
-                category_similarity * 0.2 +
-                location_similarity * 0.1
-            )
-            
-            # Calculate image similarity if both images available
-            image_similarity = 0.0
-            if query_image_features is not None and stored_features_blob:
-                try:
-                    stored_features = np.frombuffer(stored_features_blob, dtype=np.uint8)
-                    stored_features = stored_features.reshape(-1, 32)  # ORB descriptors are 32 bytes
-                    image_similarity = calculate_image_similarity(query_image_features, stored_features)
-                except Exception as e:
-                    logger.error(f"Error calculating image similarity for item {stored_item_id}: {e}")
-            
-            # Calculate overall match score
-            if image_similarity > 0:
-                # If we have image data, weight it heavily
-                match_score = (image_similarity * 0.7 + metadata_similarity * 0.3) * 100
-            else:
-                # If no image data, rely on metadata only
-                match_score = metadata_similarity * 100
-            
-            # Only include items with reasonable match scores
-            if match_score >= 30:  # Minimum threshold
+            results = []
+            for candidate in candidates:
                 results.append({
-                    "item_id": stored_item_id,
-                    "name": stored_name,
-                    "category": stored_category,
-                    "description": stored_desc,
-                    "location": stored_location,
-                    "date": stored_date,
-                    "match_score": round(match_score, 1),
-                    "image_similarity": round(image_similarity * 100, 1) if image_similarity > 0 else None,
-                    "metadata_similarity": round(metadata_similarity * 100, 1),
-                    "name_similarity": round(name_similarity * 100, 1),
-                    "description_similarity": round(desc_similarity * 100, 1),
-                    "category_similarity": round(category_similarity * 100, 1),
-                    "location_similarity": round(location_similarity * 100, 1)
+                    "item_id": candidate["item_id"],
+                    "name": candidate["name"],
+                    "category": candidate["category"],
+                    "description": candidate["description"],
+                    "location": candidate["location"],
+                    "date": candidate["date"],
+                    "match_score": candidate["match_score"],
+                    "image_similarity": candidate["image_similarity"] if candidate["image_similarity"] > 0 else None,
+                    "metadata_similarity": candidate["metadata_similarity"],
+                    "name_similarity": round(calculate_text_similarity(item_name, candidate["name"]) * 100, 1),
+                    "description_similarity": round(calculate_text_similarity(description, candidate["description"]) * 100, 1),
+                    "text_similarity": candidate["text_similarity"],
+                    "category_similarity": candidate["category_similarity"],
+                    "location_similarity": candidate["location_similarity"],
+                    "location_proximity": candidate["location_proximity"],
+                    "time_similarity": candidate["time_similarity"],
+                    "fraud_probability": candidate.get("fraud_probability"),
+                    "retrieved_by": candidate["retrieved_by"],
+                    "duplicate_ids": candidate["duplicate_ids"]
                 })
-        
-        # Sort by match score (highest first)
-        results.sort(key=lambda x: x["match_score"], reverse=True)
-        
-        # Limit to top 10 results
-        results = results[:10]
     
-        # Determine next steps based on match scores
-        next_step = "reject"
-        if results and results[0]["match_score"] >= 80:
-            next_step = "approve_online"
-        elif results and results[0]["match_score"] >= 50:
-            next_step = "request_verification"
+            # Determine next steps based on match scores
+            next_step = "reject"
+            if results and results[0]["match_score"] >= 80:
+                next_step = "approve_online"
+            elif results and results[0]["match_score"] >= 50:
+                next_step = "request_verification"
 
-        return jsonify({
-            "ok": True,
-            "query": {
-                "item_type": item_type,
-                "item_name": item_name,
-                "category": category,
-                "description": description,
-                "location": location,
-                "date": date
-            },
-            "results": results,
-            "match_found": len(results) > 0,
-            "best_match_score": results[0]["match_score"] if results else 0,
-            "next_step": next_step
-        })
+            response = {
+                "ok": True,
+                "query": {
+                    "item_type": item_type,
+                    "item_name": item_name,
+                    "category": category,
+                    "description": description,
+                    "location": location,
+                    "date": date
+                },
+                "results": results,
+                "match_found": len(results) > 0,
+                "best_match_score": results[0]["match_score"] if results else 0,
+                "next_step": next_step,
+                "cascade": {
+                    "latency_budget_ms": latency_budget_ms,
+                    **cascade_stats
+                }
+            }
+            result_cache.set(cache_key, response)
+            return response
+        response = query_flight.do(cache_key, score)
+        if page_size:
+            return jsonify(first_page(response, cache_key, page_size))
+        return jsonify(response)
         
+    except InferenceOverloaded:
+        raise
     except Exception as e:
         logger.error(f"Error in match_item: {e}")
         return jsonify({
@@ -1854,6 +4655,11 @@ def match_item():
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=PORT)
+    if len(sys.argv) > 1 and sys.argv[1] == "train-embedding-codec":
+        # Offline: python app.py train-embedding-codec [pca_dim] [subvectors]
+        options = [int(arg) for arg in sys.argv[2:4]]
+        print(json.dumps(train_embedding_codec(*options), indent=2))
+    else:
+        app.run(host="0.0.0.0", port=PORT)
 
 
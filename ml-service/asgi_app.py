@@ -0,0 +1,307 @@
+"""
+Asynchronous (ASGI) serving mode for the ML service.
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 8000
+    hypercorn asgi_app:app --bind 0.0.0.0:8000
+
+Serves the same endpoints with the same JSON contracts as app.py. Only one endpoint is
+native to the event loop; the rest run synchronously on worker threads:
+- POST /compare-items is handled natively: both stored items are loaded from SQLite
+  concurrently on the database executor, then both items' image features and text embeddings
+  are computed concurrently on the CPU executor, and the final scoring runs there too. A CPU
+  executor thread stays occupied while its model call waits on app.py's inference executors.
+- Every other request, /match-item, /search-by-image and /store-item included, runs the Flask
+  app on the WSGI executor (ASGI_WSGI_WORKERS threads), one thread per request for its whole
+  duration, streamed responses (NDJSON/SSE) included. Their concurrency is that pool size, as
+  under a threaded WSGI server. The event loop only reads the request body before a thread is
+  taken and, for JSON payloads with several images (image, lost_item.image, found_item.image),
+  embeds them concurrently into the shared image feature cache first.
+The event loop itself never runs blocking work.
+"""
+
+import asyncio
+import io
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import app as service
+
+ASGI_CPU_WORKERS = int(os.environ.get('ASGI_CPU_WORKERS', os.cpu_count() or 1))
+ASGI_DB_WORKERS = int(os.environ.get('ASGI_DB_WORKERS', 4))
+ASGI_WSGI_WORKERS = int(os.environ.get('ASGI_WSGI_WORKERS', 16))
+WSGI_STREAM_BUFFER = 16  # Response chunks buffered between a WSGI worker and the event loop
+
+cpu_executor = ThreadPoolExecutor(max_workers=ASGI_CPU_WORKERS, thread_name_prefix='asgi-cpu')
+db_executor = ThreadPoolExecutor(max_workers=ASGI_DB_WORKERS, thread_name_prefix='asgi-db')
+wsgi_executor = ThreadPoolExecutor(max_workers=ASGI_WSGI_WORKERS, thread_name_prefix='asgi-wsgi')
+
+IMAGE_PAYLOAD_PATHS = (('image',), ('lost_item', 'image'), ('found_item', 'image'))
+
+
+async def run_in(executor, fn, *args):
+    """Run fn on an executor; model calls it makes get a 429 rather than wait when queues are full"""
+    return await asyncio.get_running_loop().run_in_executor(executor, service.rejecting_when_full, fn, *args)
+
+
+async def read_body(receive):
+    """The request body, or None once it grows past MAX_REQUEST_BYTES"""
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > service.MAX_REQUEST_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+def request_headers(scope):
+    return {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+
+
+def json_payload(headers, body):
+    """The JSON body as a dict, or None for non-JSON requests"""
+    if headers.get('content-type', '').split(';')[0].strip() != 'application/json':
+        return None
+    try:
+        payload = json.loads(body or b'null')
+    except ValueError:
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+
+async def send_json(send, body, status, extra_headers=()):
+    # Serialized exactly as Flask's jsonify does
+    with service.app.app_context():
+        data = service.app.json.response(body).get_data()
+    headers = [(b'content-type', b'application/json'), (b'content-length', str(len(data)).encode())]
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': headers + [(name.lower().encode(), value.encode()) for name, value in extra_headers]})
+    await send({'type': 'http.response.body', 'body': data})
+
+
+# ---------------------------------------------------------------------------
+# Concurrent feature preparation
+# ---------------------------------------------------------------------------
+
+async def item_image_features(item):
+    if item.get('_image_features') is not None or not item.get('image'):
+        return item.get('_image_features')
+    return await run_in(cpu_executor, service.item_image_features, item)
+
+
+async def item_text_embedding(item):
+    if item.get('_text_embedding') is not None:
+        return item['_text_embedding']
+    # Same text compute_feature_set embeds
+    text = f"{item.get('name','')} {item.get('description','')}".strip()
+    return await run_in(cpu_executor, service.item_text_embedding, item, text)
+
+
+async def prepare_pair(lost_item, found_item):
+    """Compute both items' image features and text embeddings concurrently and attach them,
+    so the synchronous scoring that follows finds them instead of computing them in turn"""
+    images_needed = service.has_image(lost_item) and service.has_image(found_item)
+    tasks = [item_text_embedding(lost_item), item_text_embedding(found_item)]
+    if images_needed:
+        tasks += [item_image_features(lost_item), item_image_features(found_item)]
+    results = await asyncio.gather(*tasks)
+    for item, embedding in zip((lost_item, found_item), results[:2]):
+        if embedding is not None:
+            item['_text_embedding'] = embedding
+    for item, features in zip((lost_item, found_item), results[2:]):
+        if features is not None:
+            item['_image_features'] = features
+
+
+async def prefetch_payload_images(payload):
+    """Embed every image in a JSON payload concurrently into the image feature cache"""
+    images = []
+    for path in IMAGE_PAYLOAD_PATHS:
+        value = payload
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        if isinstance(value, str) and value:
+            images.append(value)
+    if len(images) > 1:
+        await asyncio.gather(*(run_in(cpu_executor, service.get_image_features, image) for image in images),
+                             return_exceptions=True)
+
+
+# ---------------------------------------------------------------------------
+# Native endpoints
+# ---------------------------------------------------------------------------
+
+async def compare_items(payload):
+    lost_item, found_item = await asyncio.gather(
+        run_in(db_executor, service.resolve_item, payload.get('lost_item'), payload.get('lost_item_id'), 'lost'),
+        run_in(db_executor, service.resolve_item, payload.get('found_item'), payload.get('found_item_id'), 'found'))
+    if lost_item and found_item:
+        await prepare_pair(lost_item, found_item)
+    debug = service.DEBUG_TIMINGS or bool(payload.get('debug'))
+    unresolved = service.unresolved_item_ids(payload, lost_item, found_item)
+    return await run_in(cpu_executor, service.compare_items_result, lost_item, found_item, debug, unresolved)
+
+NATIVE_ROUTES = {
+    ('POST', '/compare-items'): compare_items
+}
+
+
+async def handle_native(handler, scope, payload, headers, send):
+    started = time.perf_counter()
+    request_id = headers.get('x-request-id') or uuid.uuid4().hex
+    retry_headers = []
+    try:
+        body, status = await handler(payload)
+    except service.InferenceOverloaded as e:
+        body, status = {"ok": False, "error": str(e), "retry_after": e.retry_after}, 429
+        retry_headers = [('Retry-After', str(e.retry_after))]
+    except Exception as e:
+        service.logger.error(f"Error in {scope['path']}: {e}")
+        body, status = {"ok": False, "error": str(e)}, 500
+    await send_json(send, body, status, [('X-Request-ID', request_id)] + retry_headers)
+    service.REQUEST_LATENCY.observe(time.perf_counter() - started, scope['path'], scope['method'], str(status))
+
+
+# ---------------------------------------------------------------------------
+# Everything else: the Flask app on a thread pool
+# ---------------------------------------------------------------------------
+
+def wsgi_environ(scope, headers, body):
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False
+    }
+    for name, value in headers.items():
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'content-length':
+            environ[f"HTTP_{name.upper().replace('-', '_')}"] = value
+    return environ
+
+
+def run_wsgi(environ, emit, cancelled):
+    """Run the Flask app for one request and pass ('start', status, headers), ('body', chunk)
+    messages to emit. The call, the iteration and close() all stay on this one thread:
+    stream_with_context generators push and pop their request context where they run."""
+    response_start = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        response_start['status'] = int(status.split(' ', 1)[0])
+        response_start['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                     for name, value in response_headers]
+
+    result = service.app.wsgi_app(environ, start_response)
+    try:
+        emit(('start', response_start['status'], response_start['headers']))
+        for chunk in result:
+            if cancelled.is_set():
+                break
+            if chunk:
+                emit(('body', chunk))
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+
+async def handle_wsgi(scope, headers, body, send):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=WSGI_STREAM_BUFFER)
+    cancelled = threading.Event()
+    done = object()
+
+    def emit(message):
+        # Blocks the worker while the queue is full, so a slow client slows the producer
+        if not cancelled.is_set():
+            asyncio.run_coroutine_threadsafe(queue.put(message), loop).result()
+
+    def run():
+        try:
+            run_wsgi(wsgi_environ(scope, headers, body), emit, cancelled)
+        finally:
+            emit(done)
+
+    worker = asyncio.ensure_future(run_in(wsgi_executor, run))
+    started = False
+    try:
+        while True:
+            message = await queue.get()
+            if message is done:
+                break
+            if message[0] == 'start':
+                await send({'type': 'http.response.start', 'status': message[1], 'headers': message[2]})
+                started = True
+            else:
+                await send({'type': 'http.response.body', 'body': message[1], 'more_body': True})
+        await worker
+        if started:
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        cancelled.set()
+        # Unblock a worker waiting on a full queue, then let it finish closing the response
+        while not worker.done():
+            while not queue.empty():
+                queue.get_nowait()
+            await asyncio.sleep(0.01)
+        if not worker.cancelled():
+            worker.exception()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            for executor in (cpu_executor, db_executor, wsgi_executor):
+                executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    headers = request_headers(scope)
+    declared = headers.get('content-length', '')
+    # A declared length over the cap is refused before any of the body is read
+    too_large = declared.isdigit() and int(declared) > service.MAX_REQUEST_BYTES
+    body = None if too_large else await read_body(receive)
+    if body is None:
+        error = f"Request body exceeds {service.MAX_REQUEST_BYTES} bytes"
+        return await send_json(send, {"ok": False, "error": error}, 413)
+    payload = json_payload(headers, body) if scope['method'] == 'POST' else None
+    handler = NATIVE_ROUTES.get((scope['method'], scope['path']))
+    # Profiled requests go through Flask, whose request hooks do the profiling
+    if handler is not None and payload is not None and 'x-profile' not in headers:
+        return await handle_native(handler, scope, payload, headers, send)
+    if payload:
+        await prefetch_payload_images(payload)
+    await handle_wsgi(scope, headers, body, send)
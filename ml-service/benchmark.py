@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the ML service hot paths.
+
+Runs in process through Flask's test client against a throwaway database, so results do
+not depend on a running server, its port or the network:
+
+    python benchmark.py --items 10000 --queries 200
+    python benchmark.py --items 1000000 --seed-mode bulk --queries 100 --output big.json
+    python benchmark.py --compare results/baseline.json
+
+A synthetic corpus of found items (text, category, location, date, coordinates and, for a
+configurable fraction, a synthetic JPEG) is loaded first. Lost-item queries are perturbed
+copies of corpus items so searches have real matches. Each benchmark reports throughput,
+latency percentiles and peak RSS; results are saved as JSON and can be compared against a
+previous run to flag regressions.
+"""
+
+import argparse
+import base64
+import io
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+NAMES = ['wallet', 'backpack', 'phone', 'umbrella', 'keys', 'laptop', 'watch', 'jacket', 'headphones',
+         'water bottle', 'notebook', 'sunglasses', 'id card', 'earbuds', 'charger', 'ring']
+COLORS = ['black', 'blue', 'red', 'brown', 'grey', 'green', 'white', 'silver', 'pink']
+DETAILS = ['leather', 'with a scratch on the back', 'with stickers', 'in a clear case', 'with a keychain',
+           'with initials engraved', 'slightly worn', 'brand new', 'with a broken zip', 'with cards inside']
+CATEGORIES = ['Electronics', 'Accessories', 'Bags', 'Keys', 'Clothing', 'Documents']
+LOCATIONS = ['Central Library', 'Main Street Cafe', 'Bus Stop 12', 'City Park', 'Metro Station',
+             'Campus Gym', 'Food Court', 'Parking Lot B']
+BASE_LAT, BASE_LNG = 12.97, 77.59
+START_DATE = date(2024, 1, 1)
+
+# Relative slowdown of p95 (or drop in throughput) that --compare reports as a regression
+REGRESSION_THRESHOLD = 0.10
+
+
+def synthetic_image(seed, size=(320, 240)):
+    """JPEG bytes of a few coloured shapes; the same seed always gives the same image"""
+    rng = random.Random(seed)
+    image = Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(6):
+        x0, y0 = rng.randrange(size[0] - 40), rng.randrange(size[1] - 40)
+        box = (x0, y0, x0 + rng.randrange(20, 120), y0 + rng.randrange(20, 120))
+        fill = tuple(rng.randrange(256) for _ in range(3))
+        (draw.ellipse if rng.random() < 0.5 else draw.rectangle)(box, fill=fill)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def synthetic_item(item_id, rng, image_fraction):
+    name = f"{rng.choice(COLORS)} {rng.choice(NAMES)}"
+    return {
+        "item_id": item_id,
+        "item_name": name,
+        "category": rng.choice(CATEGORIES),
+        "description": f"{name} {rng.choice(DETAILS)} {rng.choice(DETAILS)}",
+        "location": rng.choice(LOCATIONS),
+        "date": (START_DATE + timedelta(days=rng.randrange(120))).isoformat(),
+        "lat": BASE_LAT + rng.uniform(-0.1, 0.1),
+        "lng": BASE_LNG + rng.uniform(-0.1, 0.1),
+        "image_seed": item_id if rng.random() < image_fraction else None
+    }
+
+
+def lost_query(item, rng):
+    """A lost-item report describing a corpus item with some noise"""
+    query = dict(item)
+    query["description"] = f"{item['item_name']} {rng.choice(DETAILS)}"
+    query["date"] = (date.fromisoformat(item["date"]) - timedelta(days=rng.randrange(4))).isoformat()
+    query["lat"] = item["lat"] + rng.uniform(-0.005, 0.005)
+    query["lng"] = item["lng"] + rng.uniform(-0.005, 0.005)
+    return query
+
+
+def with_image(payload, seed):
+    if seed is not None:
+        payload["image"] = base64.b64encode(synthetic_image(seed)).decode()
+    return payload
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024, 1)
+
+
+def summarize(name, latencies_s, errors, wall_s):
+    latencies_ms = np.array(latencies_s) * 1000.0
+    count = len(latencies_ms)
+    return {
+        "name": name,
+        "count": count,
+        "errors": errors,
+        "throughput_per_s": round(count / wall_s, 2) if wall_s > 0 else None,
+        "mean_ms": round(float(latencies_ms.mean()), 3) if count else None,
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3) if count else None,
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3) if count else None,
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3) if count else None,
+        "max_ms": round(float(latencies_ms.max()), 3) if count else None,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def run_benchmark(name, calls, warmup):
+    """Time each call; a call returns True on success. The first `warmup` calls are not timed."""
+    for call in calls[:warmup]:
+        call()
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for call in calls[warmup:]:
+        call_started = time.perf_counter()
+        ok = call()
+        latencies.append(time.perf_counter() - call_started)
+        errors += 0 if ok else 1
+    return summarize(name, latencies, errors, time.perf_counter() - started)
+
+
+def post_ok(client, path, payload):
+    response = client.post(path, json=payload)
+    return response.status_code < 400 and (response.get_json(silent=True) or {}).get("ok", True)
+
+
+def bulk_load(app_module, items):
+    """Insert corpus rows straight into item_features (text and coordinates, no image features).
+    Used for corpora too large to push through /store-item one request at a time."""
+    import sqlite3
+    conn = sqlite3.connect(app_module.DB_PATH)
+    conn.executemany('''
+        INSERT OR REPLACE INTO item_features
+        (item_id, item_type, item_name, category, description, location, date, lat, lng, image_model, text_model)
+        VALUES (?, 'found', ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(item["item_id"], item["item_name"], item["category"], item["description"], item["location"],
+           item["date"], item["lat"], item["lng"], app_module.IMAGE_MODEL, app_module.TEXT_MODEL)
+          for item in items])
+    conn.commit()
+    conn.close()
+    app_module.bump_item_generation('found')
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVICE_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_suite(args):
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='ml-bench-')
+    # The service keeps its database and log in the working directory; use a throwaway one
+    os.chdir(workdir)
+    if not args.with_result_cache:
+        os.environ['RESULT_CACHE_SIZE'] = '0'
+    sys.path.insert(0, SERVICE_DIR)
+    import app as service
+    # Per-request INFO logging would dominate the timings and the console
+    service.logger.setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+
+    client = service.app.test_client()
+    corpus = [synthetic_item(i, rng, args.image_fraction) for i in range(1, args.items + 1)]
+    queries = [lost_query(rng.choice(corpus), rng) for _ in range(args.queries + args.warmup)]
+    results = []
+
+    print(f"Loading {len(corpus)} items ({args.seed_mode}) into {workdir}")
+    load_started = time.perf_counter()
+    if args.seed_mode == 'bulk':
+        bulk_load(service, corpus)
+    else:
+        for item in corpus:
+            client.post('/store-item', json=with_image(
+                {key: value for key, value in item.items() if key != "image_seed"} | {"item_type": "found"},
+                item["image_seed"]))
+        service.match_table_executor.submit(lambda: None).result()
+    load_s = time.perf_counter() - load_started
+    service.get_item_index('found')  # build the index outside the timed runs
+
+    store_calls = [
+        (lambda n=n, item=item: post_ok(client, '/store-item', with_image(
+            {key: value for key, value in item.items() if key != "image_seed"}
+            | {"item_type": "lost", "item_id": 10_000_000 + n}, item["image_seed"])))
+        for n, item in enumerate(queries[:args.store_samples + args.warmup])
+    ]
+    results.append(run_benchmark('store_item', store_calls, args.warmup))
+    service.match_table_executor.submit(lambda: None).result()
+
+    image_calls = [
+        (lambda n=n: post_ok(client, '/search-by-image', {
+            "image": base64.b64encode(synthetic_image(rng.choice(corpus)["item_id"])).decode(),
+            "item_type": "lost", "limit": 10}))
+        for n in range(args.queries + args.warmup)
+    ]
+    results.append(run_benchmark('search_by_image', image_calls, args.warmup))
+
+    match_calls = [
+        (lambda q=q: post_ok(client, '/match-item', with_image(
+            {key: value for key, value in q.items() if key not in ("image_seed", "item_id")}
+            | {"item_type": "lost"}, q["image_seed"] if args.match_with_images else None)))
+        for q in queries
+    ]
+    results.append(run_benchmark('match_item', match_calls, args.warmup))
+
+    def item_payload(item):
+        return {"name": item["item_name"], "category": item["category"], "description": item["description"],
+                "location": item["location"], "date": item["date"], "lat": item["lat"], "lng": item["lng"]}
+    compare_calls = [
+        (lambda q=q, f=rng.choice(corpus): post_ok(client, '/compare-items', {
+            "lost_item": item_payload(q), "found_item": item_payload(f)}))
+        for q in queries
+    ]
+    results.append(run_benchmark('compare_items', compare_calls, args.warmup))
+
+    fraud_items = [{"name": q["item_name"], "description": q["description"], "location": q["location"],
+                    "category": q["category"], "date": q["date"]} for q in queries]
+    results.append(run_benchmark('calculate_fraud_score', [
+        (lambda item=item: service.calculate_fraud_score(item) is not None) for item in fraud_items
+    ], args.warmup))
+    results.append(run_benchmark('calculate_fraud_score_based_on_matching', [
+        (lambda a=a, b=b: service.calculate_fraud_score_based_on_matching(a, b) is not None)
+        for a, b in zip(fraud_items, reversed(fraud_items))
+    ], args.warmup))
+    batch = fraud_items * max(1, 10_000 // max(len(fraud_items), 1))
+    batch_result = run_benchmark('calculate_fraud_scores_batch', [
+        (lambda: service.calculate_fraud_scores(batch) is not None) for _ in range(5 + args.warmup)
+    ], args.warmup)
+    batch_result["items_per_call"] = len(batch)
+    results.append(batch_result)
+
+    return {
+        "config": vars(args),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "torch_available": service.torch is not None,
+            "image_model_loaded": service.resnet_model is not None,
+            "text_model_loaded": service.text_model is not None,
+            "git_commit": git_commit()
+        },
+        "load_seconds": round(load_s, 2),
+        "results": results,
+        "peak_rss_mb": peak_rss_mb(),
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+
+
+def print_report(report):
+    print(f"\n{'benchmark':<42}{'n':>6}{'err':>5}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rss MB':>9}")
+    for r in report["results"]:
+        print(f"{r['name']:<42}{r['count']:>6}{r['errors']:>5}{r['throughput_per_s'] or 0:>10.1f}"
+              f"{r['p50_ms'] or 0:>10.2f}{r['p95_ms'] or 0:>10.2f}{r['p99_ms'] or 0:>10.2f}{r['peak_rss_mb']:>9.1f}")
+
+
+def compare_reports(report, baseline, threshold=REGRESSION_THRESHOLD):
+    """Print per-benchmark deltas against a baseline run; returns the names that regressed"""
+    previous = {r["name"]: r for r in baseline["results"]}
+    changed = [key for key in ('items', 'queries', 'seed_mode', 'image_fraction', 'match_with_images')
+               if baseline.get("config", {}).get(key) != report["config"].get(key)]
+    if changed:
+        print(f"\nWarning: baseline was run with different settings ({', '.join(changed)})")
+    regressions = []
+    print(f"\n{'benchmark':<42}{'p95 ms':>18}{'ops/s':>20}")
+    for r in report["results"]:
+        old = previous.get(r["name"])
+        if old is None or not old.get("p95_ms") or not old.get("throughput_per_s"):
+            continue
+        p95_change = r["p95_ms"] / old["p95_ms"] - 1
+        throughput_change = r["throughput_per_s"] / old["throughput_per_s"] - 1
+        regressed = p95_change > threshold or throughput_change < -threshold
+        if regressed:
+            regressions.append(r["name"])
+        print(f"{r['name']:<42}{old['p95_ms']:>8.2f} -> {r['p95_ms']:<8.2f}"
+              f"{old['throughput_per_s']:>9.1f} -> {r['throughput_per_s']:<9.1f}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=1000, help='corpus size (found items)')
+    parser.add_argument('--queries', type=int, default=200, help='timed calls per endpoint benchmark')
+    parser.add_argument('--store-samples', type=int, default=100, help='timed /store-item calls')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed calls before each benchmark')
+    parser.add_argument('--image-fraction', type=float, default=0.5, help='share of corpus items with an image')
+    parser.add_argument('--seed-mode', choices=('api', 'bulk'), default='api',
+                        help='load the corpus through /store-item, or insert rows directly (text only)')
+    parser.add_argument('--match-with-images', action='store_true', help='send query images to /match-item')
+    parser.add_argument('--with-result-cache', action='store_true', help='keep the search result cache enabled')
+    parser.add_argument('--verbose', action='store_true', help='keep the service INFO logging')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='where to save the JSON report (default results/benchmark-<time>.json)')
+    parser.add_argument('--compare', help='baseline JSON report to compare against')
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else os.path.join(
+        SERVICE_DIR, 'results', f"benchmark-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    report = run_suite(args)
+    print_report(report)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {output}")
+
+    if baseline is not None:
+        regressions = compare_reports(report, baseline)
+        if regressions:
+            print(f"\nRegressions beyond {REGRESSION_THRESHOLD:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
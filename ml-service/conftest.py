@@ -0,0 +1,62 @@
+"""
+Shared setup for the in-process tests (pytest), which drive app.py through the Flask test
+client. app.py creates its SQLite database, log file and fraud model in the working
+directory when imported, so it is imported from a temporary directory and then pointed at
+that directory's database; the working directory itself is left as it was.
+test_image_search.py and test_ml_matching.py are separate scripts against a running
+service and are not collected.
+"""
+
+import base64
+import io
+import os
+import random
+import sys
+import tempfile
+
+import pytest
+from PIL import Image, ImageDraw
+
+collect_ignore = ['test_image_search.py', 'test_ml_matching.py']
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = tempfile.mkdtemp(prefix='ml-service-tests-')
+sys.path.insert(0, SERVICE_DIR)
+
+_working_dir = os.getcwd()
+os.chdir(DATA_DIR)
+try:
+    import app as service  # noqa: E402
+finally:
+    os.chdir(_working_dir)
+service.DB_PATH = os.path.join(DATA_DIR, service.DB_PATH)
+
+
+def image_bytes(seed, size=(320, 240)):
+    """JPEG bytes of a few coloured shapes; the same seed always gives the same image"""
+    rng = random.Random(seed)
+    image = Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(6):
+        x0, y0 = rng.randrange(size[0] - 40), rng.randrange(size[1] - 40)
+        box = (x0, y0, x0 + rng.randrange(20, 120), y0 + rng.randrange(20, 120))
+        draw.rectangle(box, fill=tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def image_data_url(seed):
+    return 'data:image/jpeg;base64,' + base64.b64encode(image_bytes(seed)).decode()
+
+
+@pytest.fixture
+def client():
+    return service.app.test_client()
+
+
+@pytest.fixture(autouse=True)
+def clear_result_caches():
+    service.result_cache.clear()
+    service.ranking_cache.clear()
+    yield
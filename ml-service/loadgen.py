@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Load generator for the ML service: concurrency sweeps against the real HTTP server.
+
+Starts the service locally (in a throwaway working directory) or targets a running one,
+seeds it with a synthetic corpus, then replays a request mix with a closed loop of N
+concurrent clients at each concurrency level:
+
+    python loadgen.py --levels 1,2,4,8,16,32 --duration 15
+    python loadgen.py --url http://localhost:8000 --mix compare-items=6,match-item=2,search-by-image=1
+    python loadgen.py --capture captured.jsonl --output saturation.json
+
+A capture is a JSONL file with one request per line, {"method": "POST", "path": "/compare-items",
+"body": {...}} ("endpoint"/"payload" are accepted as aliases); clients replay it round-robin.
+
+For each level it reports throughput and latency percentiles (the saturation curve) and flags
+the knee: the first level whose p99 exceeds --knee-factor times the p99 at the lowest level,
+or whose error rate exceeds 1%.
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from benchmark import lost_query, synthetic_item, with_image
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_MIX = 'compare-items=5,match-item=2,search-by-image=2,store-item=1'
+MAX_ERROR_RATE = 0.01
+
+
+class Client:
+    """One keep-alive HTTP connection; reconnects after errors"""
+
+    def __init__(self, url, timeout):
+        parts = urlsplit(url)
+        self.host, self.port, self.timeout = parts.hostname, parts.port or 80, timeout
+        self.conn = None
+
+    def request(self, method, path, body=None):
+        """Returns (status, seconds); status is None when the request failed outright"""
+        data = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if data is not None else {}
+        started = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.conn.request(method, path, body=data, headers=headers)
+            response = self.conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self.close()
+            status = None
+        return status, time.perf_counter() - started
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def start_server(port, log_path):
+    """Run app.py in a temp directory so the load test gets its own database"""
+    workdir = tempfile.mkdtemp(prefix='ml-load-')
+    log = open(os.path.join(workdir, 'server.log'), 'w') if log_path is None else open(log_path, 'w')
+    process = subprocess.Popen([sys.executable, os.path.join(SERVICE_DIR, 'app.py')], cwd=workdir,
+                               env={**os.environ, "PORT": str(port)}, stdout=log, stderr=subprocess.STDOUT)
+    return process, workdir
+
+
+def wait_until_healthy(url, timeout_s=300):
+    client = Client(url, timeout=5)
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        status, _ = client.request('GET', '/health')
+        if status == 200:
+            client.close()
+            return True
+        time.sleep(0.5)
+    return False
+
+
+def seed_corpus(url, items, image_fraction, rng):
+    """Store a found-item corpus plus matching lost reports; returns (found, lost) items"""
+    client = Client(url, timeout=120)
+    found = [synthetic_item(i, rng, image_fraction) for i in range(1, items + 1)]
+    lost = []
+    for n, item in enumerate(found[:max(1, items // 4)]):
+        report = lost_query(item, rng)
+        report["item_id"] = 1_000_000 + n
+        lost.append(report)
+    for item_type, batch in (('found', found), ('lost', lost)):
+        for item in batch:
+            client.request('POST', '/store-item', store_payload(item, item_type))
+    client.close()
+    return found, lost
+
+
+def store_payload(item, item_type):
+    return with_image({key: value for key, value in item.items() if key != "image_seed"}
+                      | {"item_type": item_type}, item["image_seed"])
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        weights[name.strip().lstrip('/')] = float(weight or 1)
+    return weights
+
+
+def synthetic_requests(found, lost, mix, count, rng):
+    """A request list following the mix weights. /compare-items calls reference stored ids and
+    concentrate on a few found items, like a claims page comparing many lost reports at once."""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    popular = found[:max(1, len(found) // 20)]
+    next_id = itertools.count(2_000_000)
+    requests = []
+    for name in rng.choices(names, weights=weights, k=count):
+        if name == 'compare-items':
+            body = {"lost_item_id": rng.choice(lost)["item_id"], "found_item_id": rng.choice(popular)["item_id"]}
+        elif name == 'match-item':
+            query = lost_query(rng.choice(found), rng)
+            body = {key: value for key, value in query.items() if key not in ("image_seed", "item_id")}
+            body["item_type"] = "lost"
+        elif name == 'search-by-image':
+            seeded = [item for item in found if item["image_seed"] is not None] or found
+            body = {"image": with_image({}, rng.choice(seeded)["item_id"])["image"], "item_type": "lost", "limit": 10}
+        elif name == 'store-item':
+            item = lost_query(rng.choice(found), rng)
+            item["item_id"] = next(next_id)
+            body = store_payload(item, "lost")
+        elif name == 'detect-fraud':
+            item = rng.choice(lost)
+            body = {"item_details": {"name": item["item_name"], "description": item["description"],
+                                     "location": item["location"], "category": item["category"],
+                                     "date": item["date"]}}
+        else:
+            raise ValueError(f"No request generator for '{name}'")
+        requests.append({"method": "POST", "path": f"/{name}", "body": body})
+    return requests
+
+
+def load_capture(path):
+    requests = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            path_ = entry.get("path") or entry.get("endpoint")
+            if not path_:
+                continue
+            requests.append({"method": entry.get("method", "POST").upper(),
+                             "path": path_ if path_.startswith('/') else f"/{path_}",
+                             "body": entry.get("body", entry.get("payload"))})
+    return requests
+
+
+def run_level(url, requests, concurrency, duration_s, warmup_s, timeout):
+    """Closed loop: `concurrency` clients each send the next request as soon as the last one
+    returns. Requests finishing during the warm-up window are not counted."""
+    cursor = itertools.count()
+    lock = threading.Lock()
+    samples = []
+    started = time.perf_counter()
+    measure_from = started + warmup_s
+    deadline = measure_from + duration_s
+
+    def worker():
+        client = Client(url, timeout)
+        local = []
+        while time.perf_counter() < deadline:
+            with lock:
+                req = requests[next(cursor) % len(requests)]
+            status, seconds = client.request(req["method"], req["path"], req["body"])
+            finished = time.perf_counter()
+            if measure_from <= finished <= deadline:
+                local.append((req["path"], status, seconds))
+        client.close()
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize_level(concurrency, samples, duration_s)
+
+
+def latency_stats(seconds):
+    ms = np.array(seconds) * 1000.0
+    if not len(ms):
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None}
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 2), "p95_ms": round(float(np.percentile(ms, 95)), 2),
+            "p99_ms": round(float(np.percentile(ms, 99)), 2), "mean_ms": round(float(ms.mean()), 2)}
+
+
+def summarize_level(concurrency, samples, duration_s):
+    ok = [s for s in samples if s[1] is not None and s[1] < 400]
+    by_status = {}
+    for _, status, _ in samples:
+        key = str(status) if status is not None else "connection_error"
+        by_status[key] = by_status.get(key, 0) + 1
+    endpoints = {}
+    for path in sorted({s[0] for s in samples}):
+        path_ok = [s[2] for s in ok if s[0] == path]
+        endpoints[path] = {"count": len(path_ok), **latency_stats(path_ok)}
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "error_rate": round((len(samples) - len(ok)) / len(samples), 4) if samples else 0.0,
+        "throughput_per_s": round(len(ok) / duration_s, 2),
+        **latency_stats([s[2] for s in ok]),
+        "status_counts": by_status,
+        "endpoints": endpoints
+    }
+
+
+def find_knee(levels, knee_factor):
+    """First level where tail latency degrades relative to the lowest level, or errors appear"""
+    baseline = next((level["p99_ms"] for level in levels if level["p99_ms"]), None)
+    for level in levels:
+        if level["error_rate"] > MAX_ERROR_RATE:
+            return {"concurrency": level["concurrency"], "reason": f"error rate {level['error_rate']:.1%}"}
+        if baseline and level["p99_ms"] and level["p99_ms"] > knee_factor * baseline:
+            return {"concurrency": level["concurrency"],
+                    "reason": f"p99 {level['p99_ms']:.0f} ms > {knee_factor:g}x {baseline:.0f} ms at the lowest level"}
+    return None
+
+
+def print_curve(levels, knee):
+    peak = max((level["throughput_per_s"] for level in levels), default=0) or 1
+    print(f"\n{'conc':>5}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'err%':>7}  throughput")
+    for level in levels:
+        bar = '#' * int(30 * level["throughput_per_s"] / peak)
+        marker = '  <- knee' if knee and knee["concurrency"] == level["concurrency"] else ''
+        print(f"{level['concurrency']:>5}{level['throughput_per_s']:>9.1f}{level['p50_ms'] or 0:>10.1f}"
+              f"{level['p95_ms'] or 0:>10.1f}{level['p99_ms'] or 0:>10.1f}{100 * level['error_rate']:>7.1f}"
+              f"  {bar}{marker}")
+    if knee:
+        print(f"\nTail latency degrades at concurrency {knee['concurrency']}: {knee['reason']}")
+    else:
+        print("\nNo knee found within the tested concurrency levels")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='target a running service instead of starting one')
+    parser.add_argument('--port', type=int, default=8765, help='port for the locally started service')
+    parser.add_argument('--levels', default='1,2,4,8,16', help='comma-separated concurrency levels')
+    parser.add_argument('--duration', type=float, default=10.0, help='measured seconds per level')
+    parser.add_argument('--warmup', type=float, default=2.0, help='unmeasured seconds at the start of each level')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='endpoint=weight pairs for the synthetic mix')
+    parser.add_argument('--capture', help='JSONL capture of requests to replay instead of the synthetic mix')
+    parser.add_argument('--seed-items', type=int, default=200, help='found items stored before the sweep (0 to skip)')
+    parser.add_argument('--image-fraction', type=float, default=0.5)
+    parser.add_argument('--requests', type=int, default=2000, help='size of the synthetic request list')
+    parser.add_argument('--knee-factor', type=float, default=2.0, help='p99 growth that counts as degraded')
+    parser.add_argument('--timeout', type=float, default=60.0, help='per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='where to save the JSON report (default results/loadgen-<time>.json)')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    process = None
+    url = args.url
+    if url is None:
+        url = f"http://127.0.0.1:{args.port}"
+        process, workdir = start_server(args.port, None)
+        print(f"Started service on {url} (pid {process.pid}, workdir {workdir})")
+    try:
+        if not wait_until_healthy(url):
+            print(f"Service at {url} did not become healthy")
+            sys.exit(1)
+
+        found, lost = [], []
+        if args.seed_items > 0:
+            print(f"Seeding {args.seed_items} found items...")
+            found, lost = seed_corpus(url, args.seed_items, args.image_fraction, rng)
+        if args.capture:
+            requests = load_capture(args.capture)
+        elif found:
+            requests = synthetic_requests(found, lost, parse_mix(args.mix), args.requests, rng)
+        else:
+            print("Nothing to replay: pass --capture or seed items for the synthetic mix")
+            sys.exit(1)
+        print(f"Replaying {len(requests)} requests")
+
+        levels = []
+        for concurrency in [int(level) for level in args.levels.split(',')]:
+            level = run_level(url, requests, concurrency, args.duration, args.warmup, args.timeout)
+            levels.append(level)
+            print(f"  concurrency {concurrency:>3}: {level['throughput_per_s']:.1f} req/s, "
+                  f"p99 {level['p99_ms'] or 0:.1f} ms, errors {level['errors']}")
+        knee = find_knee(levels, args.knee_factor)
+        print_curve(levels, knee)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    report = {
+        "config": vars(args),
+        "url": url,
+        "levels": levels,
+        "knee": knee,
+        "peak_throughput_per_s": max(level["throughput_per_s"] for level in levels),
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+    output = os.path.abspath(args.output) if args.output else os.path.join(
+        SERVICE_DIR, 'results', f"loadgen-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {output}")
+
+
+if __name__ == "__main__":
+    main()
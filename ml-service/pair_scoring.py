@@ -0,0 +1,113 @@
+"""
+Pair scoring used by the background matching job (app.run_matching_job).
+
+The job scores pair chunks on a process pool started with the spawn method. Its workers
+import only this module. The functions here take everything they need as arguments, use
+no module state, take no locks and do not record metrics, so they are safe to run in any
+process. app.py wraps text_similarity with its stage timing as calculate_text_similarity.
+"""
+
+import logging
+
+import numpy as np
+try:
+    from thefuzz import fuzz
+except Exception:
+    fuzz = None
+
+logger = logging.getLogger(__name__)
+
+
+def text_similarity(text1, text2):
+    """Fuzzy similarity (0-1) between two text strings"""
+    if not text1 or not text2:
+        return 0.0
+
+    try:
+        if fuzz is None:
+            # Fallback to simple string matching when thefuzz is not available
+            text1_lower = text1.lower().strip()
+            text2_lower = text2.lower().strip()
+
+            # Exact match
+            if text1_lower == text2_lower:
+                return 1.0
+
+            # Check if one is substring of another
+            if text1_lower in text2_lower or text2_lower in text1_lower:
+                return 0.7
+
+            # Simple word overlap
+            words1 = set(text1_lower.split())
+            words2 = set(text2_lower.split())
+            if len(words1) == 0 or len(words2) == 0:
+                return 0.0
+
+            intersection = words1.intersection(words2)
+            union = words1.union(words2)
+            return len(intersection) / len(union)
+
+        # Use thefuzz if available
+        ratio = fuzz.ratio(text1.lower(), text2.lower()) / 100.0
+        partial_ratio = fuzz.partial_ratio(text1.lower(), text2.lower()) / 100.0
+        token_sort_ratio = fuzz.token_sort_ratio(text1.lower(), text2.lower()) / 100.0
+
+        # Weighted average
+        return (0.3 * ratio + 0.4 * partial_ratio + 0.3 * token_sort_ratio)
+    except Exception as e:
+        logger.error(f"Error in text similarity calculation: {e}")
+        return 0.0
+
+
+def haversine_km(lat, lng, lats, lngs):
+    """Vectorized haversine distance from one point to arrays of points"""
+    lat1, lng1 = np.radians(lat), np.radians(lng)
+    lat2, lng2 = np.radians(lats), np.radians(lngs)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 6371.0 * 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def score_pair_chunk(payload):
+    """Match scores (0-100) for a chunk of pairs built by app.pair_chunk_payload.
+    Features follow compute_candidate_features with the lost item as the query: a feature
+    counts when the lost item has the field, and the payload's weights are renormalized per pair."""
+    weights = payload["weights"]
+    n = len(payload["lost_text"])
+    features = {name: np.zeros(n, dtype=np.float64) for name in weights}
+    masks = {name: np.zeros(n, dtype=bool) for name in weights}
+
+    both_text = payload["lost_text_mask"] & payload["found_text_mask"]
+    if both_text.any():
+        features['text_similarity'][both_text] = np.einsum(
+            'ij,ij->i', payload["lost_text_vectors"][both_text], payload["found_text_vectors"][both_text])
+    for i in np.flatnonzero(~both_text):
+        features['text_similarity'][i] = text_similarity(payload["lost_text"][i], payload["found_text"][i])
+    masks['text_similarity'] = np.array([bool(t) for t in payload["lost_text"]])
+
+    for name, field in (('category_similarity', 'category'), ('location_similarity', 'location')):
+        lost_values, found_values = payload[f"lost_{field}"], payload[f"found_{field}"]
+        masks[name] = np.array([bool(v) for v in lost_values])
+        features[name] = np.array([
+            text_similarity(a, b) if a else 0.0 for a, b in zip(lost_values, found_values)
+        ], dtype=np.float64)
+
+    distances = haversine_km(payload["lost_lat"], payload["lost_lng"], payload["found_lat"], payload["found_lng"])
+    features['location_proximity'] = np.nan_to_num(1.0 - np.minimum(distances / 5.0, 1.0), nan=0.0)
+    masks['location_proximity'] = ~(np.isnan(payload["lost_lat"]) | np.isnan(payload["lost_lng"]))
+
+    days_diff = np.abs(payload["lost_date"] - payload["found_date"])
+    features['time_similarity'] = np.nan_to_num(1.0 - days_diff / 30.0, nan=0.0)
+    masks['time_similarity'] = ~np.isnan(payload["lost_date"])
+
+    both_image = payload["lost_image_mask"] & payload["found_image_mask"]
+    if both_image.any():
+        features['image_similarity'][both_image] = np.einsum(
+            'ij,ij->i', payload["lost_image_vectors"][both_image], payload["found_image_vectors"][both_image])
+    masks['image_similarity'] = payload["lost_image_mask"]
+
+    weighted = np.zeros(n, dtype=np.float64)
+    total = np.zeros(n, dtype=np.float64)
+    for name, weight in weights.items():
+        weighted += np.clip(features[name], 0.0, 1.0) * weight * masks[name]
+        total += weight * masks[name]
+    return np.where(total > 0, weighted / np.maximum(total, 1e-12) * 100.0, 0.0)
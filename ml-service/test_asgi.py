@@ -0,0 +1,85 @@
+"""In-process tests for the ASGI serving mode (asgi_app.py)"""
+
+import asyncio
+import json
+
+import asgi_app
+from conftest import image_data_url
+
+
+async def asgi_call(method, path, body=None, chunks=None, headers=()):
+    data = json.dumps(body).encode() if body is not None else b''
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'http_version': '1.1',
+        'scheme': 'http', 'server': ('test', 80), 'client': ('127.0.0.1', 1),
+        'headers': [(b'content-type', b'application/json'), *headers]
+    }
+    chunks = chunks if chunks is not None else [data]
+    messages = iter([{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                     for i, chunk in enumerate(chunks)])
+    response = {'chunks': []}
+
+    async def receive():
+        return next(messages)
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = dict(message['headers'])
+        else:
+            response['chunks'].append(message.get('body', b''))
+
+    await asgi_app.app(scope, receive, send)
+    response['body'] = b''.join(response['chunks'])
+    return response
+
+
+def store(client, item_id, item_type, seed):
+    response = client.post('/store-item', json={
+        'item_id': item_id, 'item_type': item_type, 'item_name': f'Umbrella {item_id}', 'category': 'Accessories',
+        'description': f'folding umbrella number {item_id}', 'location': 'Station', 'date': '2024-06-01',
+        'image': image_data_url(seed)
+    })
+    assert response.json['ok']
+
+
+def test_streamed_search_through_asgi(client):
+    for item_id, seed in ((4701, 47), (4702, 48), (4703, 49)):
+        store(client, item_id, 'found', seed)
+    payload = {'image': image_data_url(47), 'item_type': 'lost', 'limit': 5, 'stream': 'ndjson'}
+
+    async def concurrent_streams():
+        return await asyncio.gather(*(asgi_call('POST', '/search-by-image', payload) for _ in range(4)))
+
+    for response in asyncio.run(concurrent_streams()):
+        assert response['status'] == 200
+        assert response['headers'][b'content-type'] == b'application/x-ndjson'
+        lines = [json.loads(line) for line in response['body'].decode().splitlines()]
+        assert lines[0]['type'] == 'query'
+        assert lines[-1]['type'] == 'done' and lines[-1]['ok']
+        assert all(line['type'] == 'result' for line in lines[1:-1])
+        assert lines[-1]['total_matches'] == len(lines) - 2
+
+
+def test_native_compare_matches_flask(client):
+    store(client, 4711, 'lost', 51)
+    store(client, 4712, 'found', 51)
+    payload = {'lost_item_id': 4711, 'found_item_id': 4712}
+    response = asyncio.run(asgi_call('POST', '/compare-items', payload))
+    assert response['status'] == 200
+    assert response['body'] == client.post('/compare-items', json=payload).get_data()
+
+
+def test_wsgi_routes_through_asgi():
+    response = asyncio.run(asgi_call('GET', '/health'))
+    assert response['status'] == 200
+    assert json.loads(response['body'])['ok']
+
+
+def test_oversized_bodies_get_413(monkeypatch):
+    monkeypatch.setattr(asgi_app.service, 'MAX_REQUEST_BYTES', 1024)
+    declared = asyncio.run(asgi_call('POST', '/search-by-image', chunks=[],
+                                     headers=[(b'content-length', str(2 * 1024 ** 3).encode())]))
+    streamed = asyncio.run(asgi_call('POST', '/compare-items', chunks=[b'x' * 600, b'x' * 600]))
+    for response in (declared, streamed):
+        assert response['status'] == 413 and not json.loads(response['body'])['ok']
@@ -0,0 +1,51 @@
+"""In-process tests for the latency-budgeted /match-item cascade"""
+
+from conftest import service
+
+
+def store_items(client, count=30):
+    for i in range(count):
+        response = client.post('/store-item', json={
+            'item_id': 2700 + i, 'item_type': 'found', 'item_name': f'Red bicycle helmet {i}', 'category': 'Sports',
+            'description': f'red helmet with {i} stickers', 'location': 'North park', 'date': '2024-07-%02d' % (1 + i % 28)
+        })
+        assert response.json['ok']
+
+
+def test_stage_two_size_follows_budget():
+    budget = service.StageTwoBudget(initial_cost_s=0.001)
+    assert budget.choose_k(0.05) == 50
+    assert budget.choose_k(0.0) == service.STAGE_TWO_MIN_K
+    assert budget.choose_k(10.0) == service.STAGE_TWO_MAX_K
+    budget.observe(elapsed_s=0.1, k=20)  # 5 ms per candidate: the average moves toward it
+    assert 0.001 < budget.cost_per_candidate_s < 0.005
+    assert budget.choose_k(0.05) < 50
+
+
+def test_match_item_reports_cascade_and_fraud_probability(client):
+    store_items(client)
+    query = {'item_type': 'lost', 'item_name': 'Red bicycle helmet', 'category': 'Sports',
+             'description': 'red helmet with stickers', 'location': 'North park', 'latency_budget_ms': 250}
+    response = client.post('/match-item', json=query).json
+    cascade = response['cascade']
+    assert cascade['latency_budget_ms'] == 250
+    assert service.STAGE_TWO_MIN_K <= cascade['stage_two_k'] <= cascade['candidates']
+    assert response['results'] and all('fraud_probability' in result for result in response['results'])
+
+
+def test_cascade_ranks_like_the_plain_search(client):
+    store_items(client)
+    query = service.build_retrieval_query('Red bicycle helmet', 'Sports', 'red helmet with stickers', 'North park')
+    plain, _ = service.hybrid_search(query, 'found', limit=10)
+    cascade, stats = service.hybrid_search(query, 'found', limit=10, latency_budget_ms=10_000)
+    assert stats['stage_two_k'] >= len(plain)
+    assert [(r['item_id'], r['match_score']) for r in cascade] == [(r['item_id'], r['match_score']) for r in plain]
+
+
+def test_budgets_get_separate_cache_entries(client):
+    store_items(client)
+    query = {'item_type': 'lost', 'item_name': 'Red bicycle helmet', 'category': 'Sports'}
+    tight = client.post('/match-item', json=dict(query, latency_budget_ms=1)).json['cascade']
+    loose = client.post('/match-item', json=dict(query, latency_budget_ms=10_000)).json['cascade']
+    assert (tight['latency_budget_ms'], loose['latency_budget_ms']) == (1, 10_000)
+    assert tight['stage_two_k'] <= loose['stage_two_k']
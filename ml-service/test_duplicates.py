@@ -0,0 +1,63 @@
+"""In-process tests for near-duplicate detection on /store-item"""
+
+import io
+
+from conftest import image_bytes, image_data_url, service
+
+
+def store(client, item_id, seed=50, **fields):
+    item = {'item_id': item_id, 'item_type': 'found', 'item_name': 'Blue water bottle', 'category': 'Bottles',
+            'description': 'blue steel water bottle with a dent', 'location': 'Park', 'date': '2024-05-01',
+            'image': image_data_url(seed)}
+    item.update(fields)
+    response = client.post('/store-item', json=item)
+    assert response.json['ok']
+    return response.json
+
+
+def test_near_duplicate_joins_cluster_and_search_collapses_it(client):
+    first = store(client, 5001)
+    assert first['duplicate_of'] is None and first['cluster_id'] == 5001
+    second = store(client, 5002)
+    assert second['duplicate_of']['item_id'] == 5001 and second['cluster_id'] == 5001
+
+    response = client.post('/search-by-image', json={'image': image_data_url(50), 'item_type': 'lost'})
+    results = [r for r in response.json['results'] if r['item_id'] in (5001, 5002)]
+    assert [(r['item_id'], r['duplicate_ids']) for r in results] == [(5001, [5002])]
+
+
+def test_restored_representative_hands_cluster_to_oldest_duplicate(client):
+    store(client, 5011, seed=51)
+    store(client, 5012, seed=51)
+    store(client, 5013, seed=51)
+    changed = store(client, 5011, seed=52, item_name='Red umbrella', category='Umbrellas',
+                    description='red folding umbrella')
+    assert changed['duplicate_of'] is None and changed['cluster_id'] == 5011
+
+    index = service.get_item_index('found')
+    assert index.items[index.row_by_item_id[5012]]['duplicate_ids'] == [5013]
+    assert index.items[index.row_by_item_id[5011]]['duplicate_ids'] == []
+
+
+def test_stores_with_duplicate_detection_do_not_rebuild_the_index(client, monkeypatch):
+    for i in range(8):
+        store(client, 5030 + i, seed=530 + i, item_name=f'Pen {i}', description=f'fountain pen number {i}')
+    service.get_item_index('found')
+    builds = []
+    monkeypatch.setattr(service, 'build_item_index', lambda item_type: builds.append(item_type))
+
+    assert store(client, 5040, seed=530, item_name='Pen 0', description='fountain pen number 0')['cluster_id'] == 5030
+    store(client, 5030, seed=541, item_name='Stapler', description='grey desk stapler')  # hands the cluster over
+    assert builds == []
+    index = service.get_item_index('found')
+    assert index.items[index.row_by_item_id[5040]]['duplicate_ids'] == []
+    assert index.items[index.row_by_item_id[5030]]['name'] == 'Stapler'
+
+
+def test_multipart_store_returns_integer_item_id(client):
+    response = client.post('/store-item', content_type='multipart/form-data', data={
+        'item_id': '5021', 'item_type': 'found', 'item_name': 'Green scarf', 'category': 'Clothing',
+        'image': (io.BytesIO(image_bytes(53)), 'scarf.jpg')
+    })
+    assert response.json['ok'] and response.json['item_id'] == 5021
+    assert service.load_stored_item(5021, 'found') is not None
@@ -0,0 +1,28 @@
+"""In-process tests for the content-addressed image feature cache"""
+
+import base64
+import io
+
+from PIL import Image
+
+from conftest import service
+
+
+def blank_image_data_url():
+    buffer = io.BytesIO()
+    Image.new('RGB', (200, 150), (90, 140, 200)).save(buffer, format='PNG')
+    return 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+
+def test_orb_without_keypoints_is_cached(monkeypatch):
+    calls = []
+    orb_features = service.orb_features_from_image
+    monkeypatch.setattr(service, 'orb_features_from_image', lambda image: calls.append(1) or orb_features(image))
+    image = blank_image_data_url()
+
+    assert service.get_image_features(image, need=('orb',))['orb'] is None
+    assert service.get_image_features(image, need=('orb',))['orb'] is None
+    # The negative result also survives in the image_feature_cache table
+    service.image_feature_memory.clear()
+    assert service.get_image_features(image, need=('orb',))['orb'] is None
+    assert len(calls) == 1
@@ -0,0 +1,41 @@
+"""In-process tests for per-model inference executors and 429 backpressure"""
+
+import threading
+
+from conftest import service
+
+PAIR = {
+    'lost_item': {'name': 'Black backpack', 'category': 'Bags', 'description': 'black backpack with laptop'},
+    'found_item': {'name': 'Black backpack', 'category': 'Bags', 'description': 'black laptop backpack'}
+}
+
+
+def test_full_queue_returns_429_with_retry_after(client, monkeypatch):
+    assert service.fraud_model is not None
+    executor = service.inference_executor('fraud_model')
+    monkeypatch.setattr(executor, 'slots', threading.BoundedSemaphore(1))
+    executor.slots.acquire()
+    rejected = executor.rejected
+    try:
+        response = client.post('/compare-items', json=PAIR)
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) >= 1
+        assert response.json['retry_after'] == int(response.headers['Retry-After'])
+        assert executor.rejected == rejected + 1
+    finally:
+        executor.slots.release()
+    assert client.post('/compare-items', json=PAIR).status_code == 200
+
+
+def test_calls_outside_requests_wait_for_a_slot(monkeypatch):
+    executor = service.inference_executor('fraud_model')
+    monkeypatch.setattr(executor, 'slots', threading.BoundedSemaphore(1))
+    executor.slots.acquire()
+    result = {}
+    waiter = threading.Thread(target=lambda: result.update(value=executor.run(sum, [1, 2, 3])))
+    waiter.start()
+    waiter.join(timeout=0.2)
+    assert waiter.is_alive()
+    executor.slots.release()
+    waiter.join(timeout=10)
+    assert result == {'value': 6}
@@ -0,0 +1,52 @@
+"""In-process tests for the materialized item_matches table"""
+
+from conftest import service
+
+
+def store(client, item_id, item_type, name, description, **fields):
+    item = {'item_id': item_id, 'item_type': item_type, 'item_name': name, 'category': 'Music',
+            'description': description, 'location': 'Harbour pier', 'date': '2024-08-03'}
+    item.update(fields)
+    assert client.post('/store-item', json=item).json['ok']
+    # The single match-table worker runs updates in order; wait for this one
+    service.match_table_executor.submit(lambda: None).result(timeout=30)
+
+
+def matched_ids(client, item_type, item_id):
+    response = client.post('/item-matches', json={'item_type': item_type, 'item_id': item_id})
+    assert response.json['ok']
+    return [match['item_id'] for match in response.json['matches']]
+
+
+def test_store_updates_both_sides_and_restore_removes_stale_matches(client):
+    store(client, 4001, 'lost', 'Turquoise harmonica', 'turquoise harmonica in a tin case')
+    store(client, 4002, 'found', 'Turquoise harmonica', 'turquoise harmonica, tin case')
+    assert 4002 in matched_ids(client, 'lost', 4001)
+    assert 4001 in matched_ids(client, 'found', 4002)
+
+    matches = client.post('/item-matches', json={'item_type': 'found', 'item_id': 4002}).json['matches']
+    scores = [match['match_score'] for match in matches]
+    assert scores == sorted(scores, reverse=True)
+
+    store(client, 4002, 'found', 'Grey umbrella', 'grey golf umbrella', category='Umbrellas',
+          location='Airport', date='2023-01-20')
+    assert 4002 not in matched_ids(client, 'lost', 4001)
+
+
+def test_lists_are_trimmed_to_k(client, monkeypatch):
+    monkeypatch.setattr(service, 'MATCH_TABLE_K', 2)
+    store(client, 4011, 'lost', 'Silver flute', 'silver flute in a black case')
+    for i in range(4):
+        store(client, 4020 + i, 'found', 'Silver flute', f'silver flute in a black case, tag {i}',
+              location=f'Harbour pier {i}')
+    assert len(matched_ids(client, 'lost', 4011)) == 2
+    assert len(matched_ids(client, 'found', 4020)) <= 2
+
+    response = client.post('/item-matches', json={'item_type': 'lost'})
+    assert response.status_code == 400
+
+
+def test_malformed_limit_gets_400(client):
+    for limit in ('x', 0, -3):
+        response = client.post('/item-matches', json={'item_type': 'lost', 'item_id': 4001, 'limit': limit})
+        assert response.status_code == 400 and not response.json['ok']
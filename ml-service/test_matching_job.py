@@ -0,0 +1,68 @@
+"""In-process tests for the background all-pairs matching job"""
+
+import threading
+
+import pair_scoring
+from conftest import service
+
+
+def store_items(client):
+    for i in range(6):
+        for item_type, item_id in (('lost', 4100 + i), ('found', 4200 + i)):
+            response = client.post('/store-item', json={
+                'item_id': item_id, 'item_type': item_type, 'item_name': f'Grey laptop {i % 2}',
+                'category': 'Electronics', 'description': 'grey laptop in a black sleeve',
+                'location': 'Library', 'date': '2024-03-0%d' % (i + 1), 'lat': 40.73, 'lng': -73.99
+            })
+            assert response.json['ok']
+
+
+def test_pool_scores_equal_inline_scores(client, monkeypatch):
+    store_items(client)
+    lost_index, found_index = service.get_item_index('lost'), service.get_item_index('found')
+    lost_rows = service.open_item_rows(lost_index, 'lost')
+    found_rows = service.open_item_rows(found_index, 'found')
+    lost_pairs, found_pairs, _ = service.blocked_pairs(lost_index, found_index, lost_rows, found_rows)
+    chunk = service.pair_chunk_payload(lost_index, found_index, lost_pairs, found_pairs)
+    scores = pair_scoring.score_pair_chunk(chunk)
+    assert len(scores) == len(lost_pairs) and scores.max() >= service.MATCH_JOB_MIN_SCORE
+
+    monkeypatch.setattr(service, 'MATCH_JOB_CHUNK_PAIRS', 5)
+    inline = service.run_matching_job(workers=1)
+    pooled = service.run_matching_job(workers=2)
+    assert inline['status'] == pooled['status'] == 'completed'
+    assert inline['matches_written'] == pooled['matches_written'] > 0
+
+
+def test_job_completes_while_requests_hold_locks(client, monkeypatch):
+    """Request threads keep taking the stage-metric locks while the pool starts its workers;
+    a worker that inherited a held lock would never finish the job"""
+    store_items(client)
+    monkeypatch.setattr(service, 'MATCH_JOB_CHUNK_PAIRS', 3)
+    stop = threading.Event()
+
+    def busy():
+        while not stop.is_set():
+            service.calculate_text_similarity('grey laptop', 'gray laptop sleeve')
+
+    threads = [threading.Thread(target=busy, daemon=True) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    result = {}
+    job = threading.Thread(target=lambda: result.update(service.run_matching_job(workers=2)), daemon=True)
+    job.start()
+    job.join(timeout=120)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    assert not job.is_alive(), "matching job did not finish"
+    assert result['status'] == 'completed'
+    assert not service._match_job_lock.locked()
+
+
+def test_malformed_limit_gets_400(client):
+    for limit in ('x', '0', '-1'):
+        assert client.get('/matching-job', query_string={'limit': limit}).status_code == 400
+        assert client.post('/match-candidates', json={'limit': limit}).status_code == 400
+    assert client.get('/matching-job', query_string={'limit': '2'}).json['ok']
+    assert client.post('/match-candidates', json={'limit': 2}).json['ok']
@@ -0,0 +1,70 @@
+"""In-process tests for the concurrent feature stages of compute_feature_set"""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from conftest import image_data_url, service
+
+STAGE_S = 0.3
+
+
+def pair_items():
+    lost = {'name': 'Yellow raincoat', 'category': 'Clothing', 'description': 'yellow raincoat with hood',
+            'location': 'Bus depot', 'date': '2024-09-02', 'image': image_data_url(481)}
+    found = {'name': 'Yellow rain coat', 'category': 'Clothing', 'description': 'hooded yellow raincoat',
+             'location': 'Bus depot', 'date': '2024-09-03', 'image': image_data_url(482)}
+    return lost, found
+
+
+def test_independent_stages_overlap(monkeypatch):
+    def slow_image_features(item):
+        time.sleep(STAGE_S)
+        return np.ones(4, dtype=np.float32)
+
+    def slow_text_embeddings(*args):
+        time.sleep(STAGE_S)
+        return np.ones(4, dtype=np.float32), np.ones(4, dtype=np.float32)
+
+    monkeypatch.setattr(service, 'item_image_features', slow_image_features)
+    monkeypatch.setattr(service, 'pair_text_embeddings', slow_text_embeddings)
+    lost, found = pair_items()
+    pair = service.PairFeatures(lost, found)
+    started = time.perf_counter()
+    feats, _ = service.compute_feature_set(lost, found, pair=pair)
+    elapsed = time.perf_counter() - started
+    # Two images and the text batch would take 3 * STAGE_S one after another
+    assert elapsed < 2 * STAGE_S
+    assert feats['image_similarity'] == pytest.approx(1.0)
+    assert set(pair.timings) >= {'text_embeddings', 'images', 'fuzzy'}
+
+
+def test_parallel_image_similarity_equals_serial():
+    lost, found = pair_items()
+    serial = service.item_image_similarity(lost, found)
+    assert service.item_image_similarity(lost, found, service.pair_feature_executor) == serial
+
+
+def test_compare_items_reports_timings_only_in_debug(client):
+    lost, found = pair_items()
+    plain = client.post('/compare-items', json={'lost_item': lost, 'found_item': found}).json
+    assert 'timings_ms' not in plain
+    debug = client.post('/compare-items', json={'lost_item': lost, 'found_item': found, 'debug': True}).json
+    assert {'images', 'text_embeddings', 'fuzzy', 'total'} <= set(debug['timings_ms'])
+    assert debug['match_score'] == plain['match_score']
+
+
+def test_pool_tasks_keep_request_admission(monkeypatch):
+    executor = service.inference_executor('fraud_model')
+    monkeypatch.setattr(executor, 'slots', threading.BoundedSemaphore(1))
+    executor.slots.acquire()
+    try:
+        with service.app.test_request_context():
+            task = service.with_caller_admission(lambda: executor.run(sum, [1, 2]))
+            job = service.pair_feature_executor.submit(task)
+        with pytest.raises(service.InferenceOverloaded):
+            job.result(timeout=10)
+    finally:
+        executor.slots.release()
@@ -0,0 +1,124 @@
+"""In-process tests for hybrid retrieval (/match-item, /search-by-image)"""
+
+import hashlib
+import subprocess
+import sys
+import textwrap
+
+from conftest import DATA_DIR, SERVICE_DIR, image_data_url, service
+
+
+def label(i):
+    return hashlib.sha256(str(i).encode()).hexdigest()[:12]
+
+
+def store(client, item_id, item_type, name, **fields):
+    item = {'item_id': item_id, 'item_type': item_type, 'item_name': name, 'category': 'Keys',
+            'description': f'{name} keyring', 'location': 'Gym', 'date': '2024-01-15'}
+    item.update(fields)
+    assert client.post('/store-item', json=item).json['ok']
+
+
+def test_match_item_reports_name_and_description_similarity(client):
+    store(client, 2601, 'found', 'Silver car key')
+    response = client.post('/match-item', json={
+        'item_type': 'lost', 'item_name': 'Silver car key', 'category': 'Keys', 'description': 'Silver car key keyring'
+    })
+    result = next(r for r in response.json['results'] if r['item_id'] == 2601)
+    assert result['name_similarity'] == 100.0
+    assert result['description_similarity'] == 100.0
+
+
+def test_search_by_image_limit_above_shortlist(client):
+    image = image_data_url(26)
+    count = service.SHORTLIST_SIZE + 10
+    for i in range(count):
+        store(client, 26100 + i, 'found', label(i), category='Luggage', image=image)
+    response = client.post('/search-by-image', json={'image': image, 'item_type': 'lost', 'limit': count})
+    ids = {r['item_id'] for r in response.json['results']}
+    assert {26100 + i for i in range(count)} <= ids
+
+
+def test_writes_from_another_process_invalidate_index_and_cache(client):
+    query = {'item_type': 'lost', 'item_name': 'Orange scooter helmet', 'category': 'Sports'}
+    before = client.post('/match-item', json=query).json
+    assert 2699 not in [r['item_id'] for r in before['results']]
+    generation = service.current_generation('found')
+
+    # A second worker process serving the same database stores a matching item
+    script = textwrap.dedent(f'''
+        import sys
+        sys.path.insert(0, {SERVICE_DIR!r})
+        import app
+        response = app.app.test_client().post('/store-item', json={{
+            'item_id': 2699, 'item_type': 'found', 'item_name': 'Orange scooter helmet',
+            'category': 'Sports', 'description': 'orange helmet'}})
+        assert response.json['ok']
+    ''')
+    subprocess.run([sys.executable, '-c', script], check=True, capture_output=True, cwd=DATA_DIR)
+
+    assert service.current_generation('found') > generation
+    after = client.post('/match-item', json=query).json
+    assert 2699 in [r['item_id'] for r in after['results']]
+
+
+def test_cursor_pages_and_rejects_out_of_range_cursors(client):
+    for i in range(5):
+        store(client, 3901 + i, 'found', f'Black umbrella {label(i)}', category='Umbrellas')
+    query = {'item_type': 'lost', 'item_name': 'Black umbrella', 'category': 'Umbrellas', 'page_size': 2}
+    first = client.post('/match-item', json=query).json
+    seen = [r['item_id'] for r in first['results']]
+    cursor = first['page']['next_cursor']
+    while cursor:
+        page = client.post('/match-item', json={'cursor': cursor}).json
+        seen += [r['item_id'] for r in page['results']]
+        cursor = page['page']['next_cursor']
+    assert len(seen) == len(set(seen)) == first['page']['total_ranked']
+
+    ranking_id = service.decode_cursor(first['page']['next_cursor'])[0]
+    for offset, page_size in ((-2, 2), (0, 0), (0, -1), (0, service.MAX_PAGE_SIZE + 1)):
+        cursor = service.encode_cursor(ranking_id, offset, page_size)
+        assert client.post('/match-item', json={'cursor': cursor}).status_code == 400
+    cursor = service.encode_cursor(ranking_id, 0, 2)
+    assert client.post('/match-item', json={'cursor': cursor, 'page_size': -1}).status_code == 400
+    assert client.post('/match-item', json=dict(query, page_size=-3)).status_code == 400
+    assert client.post('/search-by-image', json={'image': image_data_url(1), 'page_size': -3}).status_code == 400
+
+
+def test_writes_update_the_index_in_place_of_a_rebuild(client, monkeypatch):
+    for i in range(12):
+        store(client, 2610 + i, 'found', f'Green thermos {label(i)}', category='Bottles', location=f'Hall {i % 3}',
+              lat=40.7 + i / 100, lng=-74.0)
+    service.get_item_index('found')
+    builds = []
+    monkeypatch.setattr(service, 'build_item_index', lambda item_type: builds.append(item_type))
+
+    store(client, 2630, 'found', 'Green thermos flask', category='Bottles', location='Hall 1', lat=40.75, lng=-74.0)
+    store(client, 2611, 'found', 'Blue umbrella', category='Umbrellas', location='Gate 4')  # re-stored
+    updated = service.get_item_index('found')
+    assert builds == []
+    assert updated.generation == service.current_generation('found')
+    monkeypatch.undo()
+    rebuilt = service.build_item_index('found')
+
+    def live_items(index):
+        return sorted(tuple(sorted(index.items[row].items())) for row in index.live_rows())
+
+    assert live_items(updated) == live_items(rebuilt)
+    query = service.build_retrieval_query('green thermos', 'Bottles', '', 'Hall 1', '', 40.75, -74.0)
+    for candidates in ('lexical_candidates', 'geo_candidates'):
+        found = [{index.items[row]['item_id'] for row in getattr(index, candidates)(query, 100)}
+                 for index in (updated, rebuilt)]
+        assert found[0] == found[1]
+    assert 2630 in found[0] and 2611 not in found[0]
+
+
+def test_malformed_limit_and_page_size_get_400(client):
+    search = {'image': image_data_url(1), 'item_type': 'lost'}
+    match = {'item_type': 'lost', 'item_name': 'Black umbrella'}
+    for endpoint, query in (('/search-by-image', search), ('/match-item', match)):
+        for field, value in (('limit', 'abc'), ('limit', [3]), ('page_size', 'x')):
+            response = client.post(endpoint, json=dict(query, **{field: value}))
+            assert response.status_code == 400 and response.json['ok'] is False
+    cursor = service.encode_cursor('ranking', 0, 2)
+    assert client.post('/match-item', json={'cursor': cursor, 'page_size': 'x'}).status_code == 400
@@ -0,0 +1,98 @@
+"""In-process tests for request coalescing (SingleFlight)"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import image_data_url, service
+
+CALLERS = 8
+
+
+def concurrent(fn):
+    """Run fn on CALLERS threads started together; return their results or exceptions"""
+    barrier = threading.Barrier(CALLERS)
+
+    def call():
+        barrier.wait()
+        try:
+            return fn()
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(CALLERS) as pool:
+        return list(pool.map(lambda _: call(), range(CALLERS)))
+
+
+def test_coalesced_callers_share_one_result():
+    flight, calls = service.SingleFlight(), []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return object()
+
+    results = concurrent(lambda: flight.do('key', compute))
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.leaders == 1 and flight.followers == CALLERS - 1
+    assert flight.calls == {}
+
+
+def test_leader_error_reaches_every_waiter():
+    flight, calls = service.SingleFlight(), []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        raise ValueError('model failed')
+
+    results = concurrent(lambda: flight.do('key', compute))
+    assert len(calls) == 1
+    assert all(isinstance(result, ValueError) and str(result) == 'model failed' for result in results)
+    # A failed key is not remembered; the next call computes again
+    assert flight.do('key', lambda: 'ok') == 'ok'
+
+
+def test_do_many_computes_only_unowned_keys():
+    flight, owned = service.SingleFlight(), []
+    release = threading.Event()
+
+    def slow(keys):
+        owned.append(keys)
+        release.wait(5)
+        return [key.upper() for key in keys]
+
+    leader = threading.Thread(target=lambda: flight.do_many(['a', 'b'], slow))
+    leader.start()
+    while not owned:
+        time.sleep(0.01)
+    with ThreadPoolExecutor(1) as pool:
+        follower = pool.submit(flight.do_many, ['b', 'c'], slow)
+        while len(owned) < 2:
+            time.sleep(0.01)
+        release.set()
+        leader.join()
+        assert follower.result(timeout=5) == ['B', 'C']
+    assert owned == [['a', 'b'], ['c']]
+
+    with pytest.raises(RuntimeError):
+        flight.do_many(['d', 'e'], lambda keys: ['D'])
+
+
+def test_concurrent_identical_images_compute_features_once(monkeypatch):
+    calls = []
+    compute = service.compute_image_features
+
+    def counted(*args):
+        calls.append(1)
+        time.sleep(0.2)
+        return compute(*args)
+
+    monkeypatch.setattr(service, 'compute_image_features', counted)
+    image = image_data_url(4901)  # not used by any other test, so never cached
+    results = concurrent(lambda: service.get_image_features(image, need=('fingerprint',))['fingerprint'])
+    assert len(calls) == 1
+    assert results[0] is not None and len(set(results)) == 1
@@ -0,0 +1,41 @@
+"""In-process tests for scoring stored items referenced by id"""
+
+from conftest import image_data_url, service
+
+
+def store(client, item_id, item_type, **fields):
+    item = {'item_id': item_id, 'item_type': item_type, 'item_name': 'Brown wallet', 'category': 'Wallets',
+            'description': 'brown leather wallet', 'location': 'Market', 'date': '2024-02-10',
+            'image': image_data_url(30)}
+    item.update(fields)
+    assert client.post('/store-item', json=item).json['ok']
+
+
+def test_unresolved_ids_are_reported(client):
+    store(client, 3001, 'lost')
+    store(client, 3002, 'found')
+    resolved = client.post('/compare-items', json={'lost_item_id': 3001, 'found_item_id': 3002})
+    assert resolved.status_code == 200 and resolved.json['unresolved_item_ids'] == {}
+
+    inline = {'name': 'Brown wallet', 'category': 'Wallets', 'image': image_data_url(30)}
+    response = client.post('/compare-items', json={'lost_item_id': 3001, 'found_item_id': 3999, 'found_item': inline})
+    assert response.status_code == 200
+    assert response.json['unresolved_item_ids'] == {'found_item_id': 3999}
+
+    response = client.post('/compare-items', json={'lost_item_id': 3001, 'found_item_id': 3999})
+    assert response.status_code == 400
+    assert response.json['unresolved_item_ids'] == {'found_item_id': 3999}
+
+    response = client.post('/analyze-claim-fraud', json={'lost_item_id': 3998, 'lost_item': inline,
+                                                         'found_item_id': 3002})
+    assert response.json['unresolved_item_ids'] == {'lost_item_id': 3998}
+
+
+def test_inline_text_drops_stored_embedding(client):
+    store(client, 3011, 'lost')
+    stored = service.load_stored_item(3011, 'lost')
+    same = service.resolve_item({'name': stored['name'], 'description': stored['description']}, 3011, 'lost')
+    assert same['_stored'] and '_text_embedding' in same
+    changed = service.resolve_item({'description': 'red canvas wallet with zip'}, 3011, 'lost')
+    assert changed['_stored'] and changed['description'] == 'red canvas wallet with zip'
+    assert '_text_embedding' not in changed
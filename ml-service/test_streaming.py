@@ -0,0 +1,71 @@
+"""In-process tests for streamed /search-by-image results and the bounded re-rank"""
+
+import json
+
+from conftest import image_bytes, image_data_url, service
+
+QUERY = {'image': image_data_url(38), 'item_type': 'lost', 'limit': 5, 'location': 'Central station',
+         'lat': 40.75, 'lng': -73.99, 'date': '2024-04-10'}
+
+
+def store_items(client, count=40):
+    """Item 3800 has the query's image; only the first few were found near the query place and date"""
+    for i in range(count):
+        near = i < 4
+        response = client.post('/store-item', json={
+            'item_id': 3800 + i, 'item_type': 'found', 'item_name': f'Leather glove {i}', 'category': 'Clothing',
+            'description': f'brown leather glove number {i}', 'location': 'Central station',
+            'lat': 40.75 + (i * 0.01 if near else 10), 'lng': -73.99, 'date': '2024-04-1%d' % i if near else '2021-01-01',
+            'image': image_data_url(38 if i == 0 else 380 + i)
+        })
+        assert response.json['ok']
+
+
+def test_ndjson_stream_matches_buffered_response(client):
+    store_items(client)
+    buffered = client.post('/search-by-image', json=QUERY).json
+    assert buffered['results']
+    service.result_cache.clear()
+
+    for _ in range(2):  # computed, then replayed from the result cache
+        response = client.post('/search-by-image', json=dict(QUERY, stream='ndjson'))
+        assert response.mimetype == 'application/x-ndjson'
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert lines[0] == {'type': 'query', 'query': buffered['query']}
+        assert [line['result'] for line in lines[1:-1]] == buffered['results']
+        assert lines[-1] == {'type': 'done', 'ok': True, 'total_matches': buffered['total_matches'],
+                             'best_match_score': buffered['best_match_score'], 'search_successful': True}
+
+
+def test_sse_stream_from_accept_header(client):
+    store_items(client, count=5)
+    response = client.post('/search-by-image', json=QUERY, headers={'Accept': 'text/event-stream'})
+    assert response.mimetype == 'text/event-stream'
+    events = [block.split('\n') for block in response.get_data(as_text=True).strip().split('\n\n')]
+    assert [event[0] for event in events[:1] + events[-1:]] == ['event: query', 'event: done']
+    for event_line, data_line in events:
+        assert event_line.startswith('event: ') and data_line.startswith('data: ')
+        json.loads(data_line[len('data: '):])
+
+
+def test_bounded_rerank_equals_full_sort_and_stops_early(client):
+    store_items(client)
+    query = service.build_retrieval_query('', '', '', QUERY['location'], QUERY['date'], QUERY['lat'], QUERY['lng'],
+                                          image_bytes(38))
+    everything, _ = service.hybrid_search(query, 'found', limit=100, min_score=0)
+    top, stats = service.hybrid_search(query, 'found', limit=1, min_score=0)
+    assert top[0]['item_id'] == 3800
+    assert [(r['item_id'], r['match_score']) for r in top] == \
+        [(r['item_id'], r['match_score']) for r in everything[:1]]
+    # Far-away candidates can't beat the first result, so they are never fully scored
+    assert stats['scored'] < stats['stage_two_k']
+
+
+def test_non_positive_limits(client):
+    store_items(client, count=3)
+    query = service.build_retrieval_query('Leather glove', 'Clothing', '', 'Central station')
+    for limit in (0, -1):
+        assert service.hybrid_search(query, 'found', limit=limit)[0] == []
+        for endpoint, payload in (('/search-by-image', QUERY), ('/match-item', {'item_name': 'Leather glove'})):
+            response = client.post(endpoint, json=dict(payload, limit=limit))
+            assert response.status_code == 400 and 'limit' in response.json['error']
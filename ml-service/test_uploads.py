@@ -0,0 +1,33 @@
+"""In-process tests for raw and multipart image uploads"""
+
+import io
+import tracemalloc
+
+from conftest import image_bytes, service
+
+
+def test_raw_upload_searches_by_image(client):
+    response = client.post('/search-by-image?item_type=lost', data=image_bytes(31), content_type='image/jpeg')
+    assert response.status_code == 200 and response.json['ok']
+
+
+def test_declared_length_over_cap_is_refused_before_allocating(client):
+    tracemalloc.start()
+    try:
+        response = client.post('/search-by-image', data=b'0123456789', content_type='image/jpeg',
+                               environ_overrides={'CONTENT_LENGTH': str(2 * 1024 ** 3)})
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert response.status_code == 413 and response.json['ok'] is False
+    assert peak < 50 * 1024 ** 2
+
+
+def test_bodies_over_cap_get_413(client, monkeypatch):
+    monkeypatch.setitem(service.app.config, 'MAX_CONTENT_LENGTH', 1024)
+    monkeypatch.setattr(service, 'MAX_REQUEST_BYTES', 1024)
+    upload = client.post('/search-by-image', content_type='multipart/form-data',
+                         data={'item_type': 'lost', 'image': (io.BytesIO(image_bytes(31)), 'photo.jpg')})
+    assert upload.status_code == 413 and upload.json['ok'] is False
+    raw = client.post('/search-by-image', data=image_bytes(31), content_type='image/jpeg')
+    assert raw.status_code == 413
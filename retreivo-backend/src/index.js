@@ -1042,6 +1042,38 @@ app.get('/api/user/rewards', authenticateToken, async (req, res) => {
   }
 });
 
+// Compare a lost and a found item with the ML service. Items are referenced by id so it can
+// score them from their stored features; any id it has not stored (unresolved_item_ids) is
+// compared again from the item's own metadata and image. Returns the ML response or null.
+const compareItemsWithMl = async (lostItem, foundItem) => {
+  const { image: lostImage, ...lostFields } = lostItem;
+  const { image: foundImage, ...foundFields } = foundItem;
+  const post = async (body) => {
+    const r = await fetch(`${mlServiceBaseUrl}/compare-items`, {
+      method: 'POST',
+      headers: { 'content-type': 'application/json' },
+      body: JSON.stringify(body)
+    });
+    return r.ok ? r.json() : null;
+  };
+  const ml = await post({
+    lost_item_id: lostItem.item_id,
+    found_item_id: foundItem.item_id,
+    lost_item: lostFields,
+    found_item: foundFields
+  });
+  const unresolved = (ml && ml.unresolved_item_ids) || {};
+  if (unresolved.lost_item_id == null && unresolved.found_item_id == null) {
+    return ml;
+  }
+  return post({
+    ...(unresolved.lost_item_id == null ? { lost_item_id: lostItem.item_id } : {}),
+    ...(unresolved.found_item_id == null ? { found_item_id: foundItem.item_id } : {}),
+    lost_item: unresolved.lost_item_id == null ? lostFields : { ...lostFields, image: lostImage },
+    found_item: unresolved.found_item_id == null ? foundFields : { ...foundFields, image: foundImage }
+  });
+};
+
 // Helper function to calculate fraud score
 const calculateFraudScore = async (userId, itemId, itemType) => {
   try {
@@ -1170,19 +1202,10 @@ app.get('/api/hub/claims', async (req, res) => {
             ]);
 
             if (lostRes.rows.length > 0 && foundRes.rows.length > 0) {
-              const lostItem = lostRes.rows[0];
-              const foundItem = foundRes.rows[0];
-              const r = await fetch(`${mlServiceBaseUrl}/compare-items`, {
-                method: 'POST',
-                headers: { 'content-type': 'application/json' },
-                body: JSON.stringify({ lost_item: lostItem, found_item: foundItem })
-              });
-              if (r.ok) {
-                const ml = await r.json();
-                if (ml && ml.ok) {
-                  fraudScoreFromMl = typeof ml.fraud_probability === 'number' ? ml.fraud_probability : null;
-                  indicators = Array.isArray(ml.explanation) ? ml.explanation : [];
-                }
+              const ml = await compareItemsWithMl(lostRes.rows[0], foundRes.rows[0]);
+              if (ml && ml.ok) {
+                fraudScoreFromMl = typeof ml.fraud_probability === 'number' ? ml.fraud_probability : null;
+                indicators = Array.isArray(ml.explanation) ? ml.explanation : [];
               }
             }
           }
@@ -1272,16 +1295,9 @@ app.get('/api/hub/claims/export', async (req, res) => {
               )
             ]);
             if (lostRes.rows.length > 0 && foundRes.rows.length > 0) {
-              const r = await fetch(`${mlServiceBaseUrl}/compare-items`, {
-                method: 'POST',
-                headers: { 'content-type': 'application/json' },
-                body: JSON.stringify({ lost_item: lostRes.rows[0], found_item: foundRes.rows[0] })
-              });
-              if (r.ok) {
-                const ml = await r.json();
-                if (ml && ml.ok && typeof ml.fraud_probability === 'number') {
-                  fraudScoreFromMl = ml.fraud_probability;
-                }
+              const ml = await compareItemsWithMl(lostRes.rows[0], foundRes.rows[0]);
+              if (ml && ml.ok && typeof ml.fraud_probability === 'number') {
+                fraudScoreFromMl = ml.fraud_probability;
               }
             }
           }